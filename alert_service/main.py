@@ -1,5 +1,12 @@
 from fastapi import FastAPI
+from database import engine, SessionLocal
 from routers.alerts import router as alerts_router
+from routers.rules import router as rules_router
+from services.broadcaster import broadcaster
+from services.digests import ALERT_DIGEST_INTERVAL_SECONDS, run_digest_job
+from services.ingest_queue import ingest_queue
+from services.periodic import PeriodicJob
+from services.retention import ALERT_RETENTION_INTERVAL_SECONDS, run_retention_job
 
 
 app = FastAPI(
@@ -8,13 +15,40 @@ app = FastAPI(
         "Alerts & Tips cho Dashboard theo điểm tín dụng.\n"
         "- GET  /alerts/{user_id}: danh sách alerts/tips\n"
         "- POST /alerts/on-score-updated: tạo alerts khi điểm thay đổi\n"
-        "- POST /alerts/{alert_id}/read: đánh dấu đã đọc"
+        "- POST /alerts/events: nhận sự kiện điểm vào hàng đợi, ghi alert theo lô (202)\n"
+        "- POST /alerts/{alert_id}/read: đánh dấu đã đọc\n"
+        "- POST /alerts/read, POST /alerts/{user_id}/read-all: đánh dấu đã đọc hàng loạt\n"
+        "- GET  /alerts/{user_id}/stream: nhận alert mới theo thời gian thực (SSE)\n"
+        "- GET  /alerts/{user_id}/digests: tổng hợp alert theo ngày\n"
+        "- GET  /alerts/rules, POST /alerts/rules/dry-run: xem/chạy thử luật sinh alert"
     ),
     version="1.0.0",
 )
 
+# rules_router phải đăng ký trước để /alerts/rules không bị khớp với /alerts/{user_id}
+app.include_router(rules_router, prefix="/api/v1")
 app.include_router(alerts_router, prefix="/api/v1")
 
+retention_job = PeriodicJob("alert-retention", run_retention_job, ALERT_RETENTION_INTERVAL_SECONDS)
+digest_job = PeriodicJob("alert-digest", run_digest_job, ALERT_DIGEST_INTERVAL_SECONDS)
+
+
+@app.on_event("startup")
+async def start_background_workers() -> None:
+    broadcaster.start(engine)
+    await ingest_queue.start(SessionLocal)
+    retention_job.start()
+    digest_job.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_workers() -> None:
+    # Ghi nốt các sự kiện còn trong hàng đợi trước khi tắt
+    await ingest_queue.stop()
+    await retention_job.stop()
+    await digest_job.stop()
+    broadcaster.stop()
+
 
 @app.get("/")
 def root() -> dict:
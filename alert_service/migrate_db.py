@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Database migration script for Alert Service
+Adds indexes for paginated alert listing and unread counts,
+and the columns/unique index used by the alert dedup window,
+and the template columns used for localized messages,
+and the listing indexes keyed on last_occurred_at (replacing created_at)
+"""
+
+from sqlalchemy import text
+from database import engine
+
+def migrate_database():
+    """Apply schema changes that create_all() does not add to existing tables"""
+
+    migration_commands = [
+        """
+        CREATE INDEX IF NOT EXISTS ix_alerts_user_read_created
+        ON alerts (user_id, is_read, created_at DESC, id DESC);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_alerts_user_created
+        ON alerts (user_id, created_at DESC, id DESC);
+        """,
+        """
+        ALTER TABLE alerts
+        ADD COLUMN IF NOT EXISTS dedup_bucket BIGINT;
+        """,
+        """
+        ALTER TABLE alerts
+        ADD COLUMN IF NOT EXISTS occurrences INTEGER NOT NULL DEFAULT 1;
+        """,
+        """
+        ALTER TABLE alerts
+        ADD COLUMN IF NOT EXISTS last_occurred_at TIMESTAMP;
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_alerts_user_type_bucket
+        ON alerts (user_id, type, dedup_bucket);
+        """,
+        """
+        ALTER TABLE alerts
+        ADD COLUMN IF NOT EXISTS template_id VARCHAR(64);
+        """,
+        """
+        ALTER TABLE alerts
+        ADD COLUMN IF NOT EXISTS params JSON;
+        """,
+        """
+        UPDATE alerts SET last_occurred_at = created_at
+        WHERE last_occurred_at IS NULL;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_alerts_user_read_last
+        ON alerts (user_id, is_read, last_occurred_at DESC, id DESC);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_alerts_user_last
+        ON alerts (user_id, last_occurred_at DESC, id DESC);
+        """,
+        """
+        DROP INDEX IF EXISTS ix_alerts_user_read_created;
+        """,
+        """
+        DROP INDEX IF EXISTS ix_alerts_user_created;
+        """,
+    ]
+
+    try:
+        with engine.connect() as conn:
+            for command in migration_commands:
+                print(f"Executing: {command.strip()}")
+                conn.execute(text(command))
+                conn.commit()
+                print("✓ Success")
+
+        print("\n🎉 Database migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔄 Starting database migration...")
+    migrate_database()
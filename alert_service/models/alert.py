@@ -1,5 +1,5 @@
 import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Index, BigInteger, JSON
 from .base import Base
 
 
@@ -14,5 +14,56 @@ class Alert(Base):
     severity = Column(String(20), nullable=False)  # low, medium, high
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     is_read = Column(Boolean, default=False)
+    # Alert lặp lại trong cùng cửa sổ dedup được gộp vào một dòng (xem services/alert_store.py)
+    dedup_bucket = Column(BigInteger, nullable=True)
+    occurrences = Column(Integer, nullable=False, default=1)
+    last_occurred_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # title/message lưu sẵn theo ngôn ngữ mặc định; ngôn ngữ khác render từ template khi đọc
+    template_id = Column(String(64), nullable=True)
+    params = Column(JSON, nullable=True)
 
 
+# Danh sách alert (keyset theo last_occurred_at, id) và đếm chưa đọc đều đi theo index, không cần sort;
+# alert được gộp (dedup) cập nhật last_occurred_at nên quay lại đầu danh sách
+Index(
+    "ix_alerts_user_read_last",
+    Alert.user_id,
+    Alert.is_read,
+    Alert.last_occurred_at.desc(),
+    Alert.id.desc(),
+)
+Index("ix_alerts_user_last", Alert.user_id, Alert.last_occurred_at.desc(), Alert.id.desc())
+# Nguồn sự thật cho dedup: mỗi (user, type, cửa sổ) chỉ một dòng; NULL bucket = không dedup
+Index("uq_alerts_user_type_bucket", Alert.user_id, Alert.type, Alert.dedup_bucket, unique=True)
+
+
+class AlertUnreadCounter(Base):
+    """Số alert chưa đọc theo user, cập nhật cùng transaction với bảng alerts."""
+
+    __tablename__ = "alert_unread_counters"
+
+    user_id = Column(String(100), primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+class AlertDigest(Base):
+    """Tổng hợp alert theo ngày cho từng user (một dòng / user / ngày)."""
+
+    __tablename__ = "alert_digests"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String(100), nullable=False)
+    digest_date = Column(Date, nullable=False)
+    total = Column(Integer, nullable=False)
+    unread = Column(Integer, nullable=False)
+    by_type = Column(JSON, nullable=False)  # {"tip": 3, "score_drop": 1}
+    by_severity = Column(JSON, nullable=False)  # {"low": 3, "high": 1}
+    top_severity = Column(String(20), nullable=False)
+    first_alert_at = Column(DateTime, nullable=True)
+    last_alert_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+Index("uq_alert_digests_user_date", AlertDigest.user_id, AlertDigest.digest_date, unique=True)
+Index("ix_alert_digests_date", AlertDigest.digest_date)
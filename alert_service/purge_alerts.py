@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Apply alert retention policies (config/retention.yaml)
+Usage: python purge_alerts.py [--dry-run]
+"""
+
+import sys
+from database import SessionLocal
+from services.retention import run_retention
+
+def purge(dry_run: bool = False):
+    db = SessionLocal()
+    try:
+        report = run_retention(db, dry_run=dry_run)
+    finally:
+        db.close()
+    if report["skipped"]:
+        print("⏭  Another retention run is in progress, nothing done")
+        return
+    for item in report["policies"]:
+        print(f"  - {item['policy']} ({item['action']}): {item['rows']} rows")
+    verb = "would be removed" if dry_run else "removed"
+    print(f"✓ {report['rows_removed']} rows {verb}, {report['rows_archived']} archived, "
+          f"{report['bytes_archived']} bytes written")
+    if report["archive_file"]:
+        print(f"  archive: {report['archive_file']}")
+
+if __name__ == "__main__":
+    print("🧹 Applying alert retention policies...")
+    purge(dry_run="--dry-run" in sys.argv[1:])
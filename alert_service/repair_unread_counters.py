@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Recompute alert_unread_counters from the alerts table
+Usage: python repair_unread_counters.py [user_id]
+"""
+
+import sys
+from database import SessionLocal
+from services.unread_counters import rebuild_counters
+
+def repair(user_id: str | None = None):
+    db = SessionLocal()
+    try:
+        rows = rebuild_counters(db, user_id)
+        target = f"user {user_id}" if user_id else "all users"
+        print(f"✓ Rebuilt unread counters for {target} ({rows} counter rows written)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("🔄 Rebuilding unread counters...")
+    repair(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -1,107 +1,242 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import base64
+import datetime
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from typing import List
-from models.alert import Alert
-from schemas.alert import AlertOut, ScoreUpdatedIn, MarkReadOut
-from database import get_db
+from typing import AsyncIterator, List, Optional
+from models.alert import Alert, AlertDigest
+from schemas.alert import (
+    AlertOut,
+    ScoreUpdatedIn,
+    MarkReadOut,
+    MarkReadManyIn,
+    MarkReadManyOut,
+    UnreadCountOut,
+    EventAcceptedOut,
+    DeadLetterOut,
+    IngestQueueOut,
+    RetentionReportOut,
+    AlertDigestOut,
+    DigestRunOut,
+)
+from database import get_db, SessionLocal
+from services import alert_store, unread_counters
+from services.broadcaster import broadcaster
+from services.ingest_queue import ingest_queue
+from services.digests import generate_digests
+from services.retention import run_retention
+from services.templates import localize, message_catalog, pick_language
 
 
 router = APIRouter(prefix="/alerts", tags=["alerts"])
 
+ALERT_SSE_KEEPALIVE_SECONDS = float(os.getenv("ALERT_SSE_KEEPALIVE_SECONDS", "15"))
+
 
 def _make_rules(payload: ScoreUpdatedIn) -> list[Alert]:
-    alerts: list[Alert] = []
-    delta = None
-    if payload.old_score is not None:
-        delta = payload.new_score - payload.old_score
-
-    # Rule: tăng/giảm điểm mạnh
-    if delta is not None and delta <= -10:
-        alerts.append(
-            Alert(
-                user_id=payload.user_id,
-                type="score_drop",
-                severity="high",
-                title="Điểm giảm mạnh",
-                message=f"Điểm tín dụng giảm {abs(delta)} điểm. Hãy giảm tỷ lệ sử dụng tín dụng và thanh toán đúng hạn.",
-            )
-        )
-    elif delta is not None and delta >= 10:
-        alerts.append(
-            Alert(
-                user_id=payload.user_id,
-                type="score_rise",
-                severity="medium",
-                title="Điểm cải thiện",
-                message=f"Điểm tín dụng tăng {delta} điểm. Tiếp tục duy trì thói quen thanh toán tốt.",
-            )
-        )
+    # Luật được khai báo trong config/alert_rules.yaml (xem services/rule_engine.py)
+    return alert_store.build_alerts([payload])
 
-    # Rule: tips theo ngưỡng điểm hiện tại
-    if payload.new_score < 60:
-        alerts.append(
-            Alert(
-                user_id=payload.user_id,
-                type="tip",
-                severity="medium",
-                title="Gợi ý cải thiện",
-                message="Giữ tỷ lệ sử dụng tín dụng dưới 30% và tránh mở thẻ mới trong giai đoạn này.",
-            )
-        )
-    elif payload.new_score < 80:
-        alerts.append(
-            Alert(
-                user_id=payload.user_id,
-                type="tip",
-                severity="low",
-                title="Gợi ý duy trì",
-                message="Giữ tỷ lệ sử dụng dưới 50% và thanh toán đúng hạn để tăng điểm bền vững.",
-            )
-        )
-    else:
-        alerts.append(
-            Alert(
-                user_id=payload.user_id,
-                type="tip",
-                severity="low",
-                title="Tiếp tục duy trì",
-                message="Điểm tốt. Tránh trễ hạn và theo dõi chi tiêu để giữ mức hiện tại.",
-            )
-        )
 
-    return alerts
+def _encode_cursor(row: Alert) -> str:
+    raw = f"{row.last_occurred_at.isoformat()}|{row.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        last_occurred_at, alert_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(last_occurred_at), int(alert_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get(
+    "/{user_id}",
+    response_model=List[AlertOut],
+    summary="List alerts for user",
+    description=(
+        "Phân trang keyset theo (last_occurred_at, id), mới nhất trước; alert được gộp lại quay lên đầu.\n"
+        "Nếu còn trang sau, header `X-Next-Cursor` chứa giá trị truyền vào `cursor` cho lần gọi tiếp."
+    ),
+)
+def list_alerts(
+    user_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="Giá trị X-Next-Cursor của trang trước"),
+    unread_only: bool = False,
+    type: Optional[str] = None,
+    severity: Optional[str] = None,
+    lang: Optional[str] = Query(None, pattern=r"^(vi|en|zh)$", description="Mặc định theo Accept-Language"),
+    accept_language: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    q = db.query(Alert).filter(Alert.user_id == user_id)
+    if unread_only:
+        q = q.filter(Alert.is_read.is_(False))
+    if type:
+        q = q.filter(Alert.type == type)
+    if severity:
+        q = q.filter(Alert.severity == severity)
+    if cursor:
+        q = q.filter(tuple_(Alert.last_occurred_at, Alert.id) < _decode_cursor(cursor))
+    rows = q.order_by(Alert.last_occurred_at.desc(), Alert.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
+    language = pick_language(lang, accept_language)
+    if language is None or language == message_catalog.default_language:
+        return rows
+    return [localize(alert_store.alert_payload(r), language) for r in rows]
+
+
+@router.get("/{user_id}/unread-count", response_model=UnreadCountOut, summary="Unread alert count for badge")
+def unread_count(user_id: str, db: Session = Depends(get_db)):
+    return {"user_id": user_id, "unread_count": unread_counters.get_unread_count(db, user_id)}
+
+
+async def _alert_stream(request: Request, user_id: str, language: Optional[str]) -> AsyncIterator[str]:
+    sub = broadcaster.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        while not sub.dropped:
+            try:
+                item = await asyncio.wait_for(sub.queue.get(), timeout=ALERT_SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            if item is None:
+                break
+            data = AlertOut.model_validate(localize(item, language)).model_dump_json()
+            yield f"id: {item['id']}\nevent: alert\ndata: {data}\n\n"
+    finally:
+        broadcaster.unsubscribe(sub)
+
+
+@router.get(
+    "/{user_id}/stream",
+    summary="Stream new alerts (Server-Sent Events)",
+    description=(
+        "Giữ kết nối SSE và đẩy alert mới ngay khi được commit (event `alert`).\n"
+        "Client chậm sẽ bị ngắt kết nối; EventSource tự kết nối lại."
+    ),
+)
+async def stream_alerts(
+    user_id: str,
+    request: Request,
+    lang: Optional[str] = Query(None, pattern=r"^(vi|en|zh)$"),
+    accept_language: Optional[str] = Header(None),
+):
+    return StreamingResponse(
+        _alert_stream(request, user_id, pick_language(lang, accept_language)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-@router.get("/{user_id}", response_model=List[AlertOut], summary="List alerts for user")
-def list_alerts(user_id: str, db: Session = Depends(get_db)):
-    rows = (
-        db.query(Alert)
-        .filter(Alert.user_id == user_id)
-        .order_by(Alert.created_at.desc())
+@router.get("/{user_id}/digests", response_model=List[AlertDigestOut], summary="Daily alert digests for user")
+def list_digests(user_id: str, limit: int = Query(30, ge=1, le=366), db: Session = Depends(get_db)):
+    return (
+        db.query(AlertDigest)
+        .filter(AlertDigest.user_id == user_id)
+        .order_by(AlertDigest.digest_date.desc())
+        .limit(limit)
         .all()
     )
-    return rows
 
 
 @router.post("/on-score-updated", response_model=List[AlertOut], summary="Create alerts when score updated")
 def on_score_updated(payload: ScoreUpdatedIn, db: Session = Depends(get_db)):
-    alerts = _make_rules(payload)
-    for a in alerts:
-        db.add(a)
-    db.commit()
-    # refresh to return IDs
-    for a in alerts:
-        db.refresh(a)
-    return alerts
+    return alert_store.insert_alerts(db, _make_rules(payload))
+
+
+@router.post(
+    "/events",
+    status_code=202,
+    response_model=EventAcceptedOut,
+    summary="Queue a score update for batched alert creation",
+    description=(
+        "Nhận sự kiện vào hàng đợi trong bộ nhớ và trả 202 ngay; alert được ghi theo lô ở nền.\n"
+        "429 khi hàng đợi đầy (thử lại sau `Retry-After` giây)."
+    ),
+    responses={429: {"description": "Hàng đợi đầy"}},
+)
+async def enqueue_score_event(payload: ScoreUpdatedIn):
+    if not ingest_queue.offer(payload):
+        raise HTTPException(
+            status_code=429,
+            detail="Alert ingestion queue is full",
+            headers={"Retry-After": "1"},
+        )
+    return {"accepted": True, "queue_depth": ingest_queue.depth}
+
+
+@router.get("/events/queue", response_model=IngestQueueOut, summary="Ingestion queue depth and counters")
+def ingest_queue_stats():
+    return ingest_queue.stats()
+
+
+@router.get(
+    "/events/dead-letters",
+    response_model=List[DeadLetterOut],
+    summary="Queued events that could not be written",
+    description="Sự kiện đã nhận (202) nhưng ghi lỗi kể cả sau khi thử lại và tách lô, kèm lỗi; giữ tối đa `ALERT_INGEST_DEAD_LETTERS` mục gần nhất.",
+)
+def ingest_dead_letters():
+    return ingest_queue.dead_letters()
 
 
 @router.post("/{alert_id}/read", response_model=MarkReadOut, summary="Mark alert as read")
 def mark_read(alert_id: int, db: Session = Depends(get_db)):
-    row = db.query(Alert).filter(Alert.id == alert_id).first()
-    if not row:
+    if alert_store.mark_alert_read(db, alert_id) is None:
         raise HTTPException(status_code=404, detail="Alert not found")
-    row.is_read = True
-    db.commit()
     return {"success": True}
 
 
+@router.post("/read", response_model=MarkReadManyOut, summary="Mark a list of alerts as read")
+def mark_many_read(payload: MarkReadManyIn, db: Session = Depends(get_db)):
+    updated = alert_store.mark_alerts_read(db, payload.ids, user_id=payload.user_id)
+    return {"success": True, "updated": updated}
+
+
+@router.post("/{user_id}/read-all", response_model=MarkReadManyOut, summary="Mark all alerts of user as read")
+def mark_all_read(user_id: str, db: Session = Depends(get_db)):
+    return {"success": True, "updated": alert_store.mark_all_read(db, user_id)}
+
+
+@router.post(
+    "/admin/retention/run",
+    response_model=RetentionReportOut,
+    summary="Apply alert retention policies now",
+    description=(
+        "Xoá/lưu trữ alert cũ theo config/retention.yaml, theo từng lô.\n"
+        "`dry_run=true` chỉ đếm số dòng sẽ bị xử lý.\n"
+        "`skipped=true` nếu một lần chạy khác (worker khác) đang giữ khoá retention."
+    ),
+)
+def run_retention_now(dry_run: bool = False, db: Session = Depends(get_db)):
+    try:
+        return run_retention(db, dry_run=dry_run)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=500, detail=f"Retention failed: {e}")
+
+
+@router.post(
+    "/admin/digests/run",
+    response_model=DigestRunOut,
+    summary="Build daily digests for a day",
+    description=(
+        "Tổng hợp alert trong ngày `day` (UTC, mặc định hôm qua) thành một digest cho mỗi user.\n"
+        "Chạy lại an toàn: user đã có digest của ngày đó sẽ được bỏ qua."
+    ),
+)
+def run_digests(day: Optional[datetime.date] = None):
+    day = day or (datetime.datetime.utcnow().date() - datetime.timedelta(days=1))
+    return generate_digests(SessionLocal, day)
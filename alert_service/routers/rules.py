@@ -0,0 +1,49 @@
+from collections import Counter
+from fastapi import APIRouter, HTTPException
+from schemas.alert import RuleSetOut, RuleDryRunIn, RuleDryRunOut
+from services.rule_engine import RuleError, compile_rules, rule_engine
+
+
+router = APIRouter(prefix="/alerts/rules", tags=["alert-rules"])
+
+
+def _ruleset_out() -> dict:
+    try:
+        ruleset = rule_engine.ruleset
+    except RuleError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "version": ruleset.version,
+        "rules": [r.id for r in ruleset.rules],
+        "last_error": rule_engine.last_error,
+    }
+
+
+@router.get("", response_model=RuleSetOut, summary="Show active alert rules")
+def get_rules():
+    return _ruleset_out()
+
+
+@router.post("/reload", response_model=RuleSetOut, summary="Reload alert rules from file now")
+def reload_rules():
+    rule_engine.reload(force=True)
+    return _ruleset_out()
+
+
+@router.post("/dry-run", response_model=RuleDryRunOut, summary="Evaluate rules against events without saving")
+def dry_run(payload: RuleDryRunIn):
+    """Chạy thử rule trên danh sách sự kiện (vd. lấy từ lịch sử điểm) – không ghi DB."""
+    try:
+        ruleset = compile_rules(payload.rules) if payload.rules is not None else rule_engine.ruleset
+    except RuleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    outcomes = ruleset.evaluate_batch(payload.events)
+    matched = Counter(a["rule_id"] for alerts in outcomes for a in alerts)
+    return {
+        "version": ruleset.version,
+        "results": [
+            {"user_id": event.user_id, "alerts": alerts}
+            for event, alerts in zip(payload.events, outcomes)
+        ],
+        "matched": dict(matched),
+    }
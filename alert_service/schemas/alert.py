@@ -1,6 +1,6 @@
-from typing import List
-from pydantic import BaseModel
-from datetime import datetime
+from typing import Any, Dict, List
+from pydantic import BaseModel, Field
+from datetime import date, datetime
 
 
 class AlertOut(BaseModel):
@@ -12,6 +12,9 @@ class AlertOut(BaseModel):
     severity: str
     created_at: datetime
     is_read: bool
+    occurrences: int = 1
+    last_occurred_at: datetime | None = None
+    template_id: str | None = None
 
     class Config:
         from_attributes = True
@@ -30,3 +33,118 @@ class MarkReadOut(BaseModel):
     success: bool
 
 
+
+
+class RuleAlertOut(BaseModel):
+    rule_id: str
+    type: str
+    severity: str
+    title: str
+    message: str
+    template_id: str | None = None
+
+
+class RuleSetOut(BaseModel):
+    version: str
+    rules: List[str]
+    last_error: str | None = None
+
+
+class RuleDryRunIn(BaseModel):
+    events: List[ScoreUpdatedIn]
+    # YAML rules để thử; bỏ trống => dùng bộ rule đang chạy
+    rules: str | None = None
+
+
+class RuleDryRunResult(BaseModel):
+    user_id: str
+    alerts: List[RuleAlertOut]
+
+
+class RuleDryRunOut(BaseModel):
+    version: str
+    results: List[RuleDryRunResult]
+    matched: dict[str, int]
+
+
+class UnreadCountOut(BaseModel):
+    user_id: str
+    unread_count: int
+
+
+class MarkReadManyIn(BaseModel):
+    ids: List[int] = Field(..., max_length=1000)
+    # Nếu có, chỉ đánh dấu các alert thuộc user này
+    user_id: str | None = None
+
+
+class MarkReadManyOut(BaseModel):
+    success: bool
+    updated: int
+
+
+class EventAcceptedOut(BaseModel):
+    accepted: bool
+    queue_depth: int
+
+
+class IngestQueueOut(BaseModel):
+    accepting: bool
+    depth: int
+    capacity: int
+    accepted: int
+    rejected: int
+    written: int
+    failed: int
+    batches: int
+    retries: int = 0
+    dead_letters: int = 0
+    last_error: str | None = None
+
+
+class DeadLetterOut(BaseModel):
+    event: Dict[str, Any]
+    error: str
+    failed_at: datetime
+
+
+class RetentionPolicyReport(BaseModel):
+    policy: str
+    action: str
+    rows: int
+
+
+class RetentionReportOut(BaseModel):
+    dry_run: bool
+    # True: một worker khác đang chạy retention, lần này không làm gì
+    skipped: bool = False
+    rows_removed: int
+    rows_archived: int
+    bytes_archived: int
+    archive_file: str | None = None
+    policies: List[RetentionPolicyReport]
+
+
+class AlertDigestOut(BaseModel):
+    user_id: str
+    digest_date: date
+    total: int
+    unread: int
+    by_type: dict[str, int]
+    by_severity: dict[str, int]
+    top_severity: str
+    first_alert_at: datetime | None = None
+    last_alert_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class DigestRunOut(BaseModel):
+    day: date
+    users: int
+    skipped: int
+    written: int
+    chunks: int
+    failed_chunks: int
+    last_error: str | None = None
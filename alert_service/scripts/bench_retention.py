@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: alert list latency before/after retention on a large synthetic table.
+
+Usage (from alert_service/):
+    python scripts/bench_retention.py [--rows 500000] [--users 2000] [--db sqlite:///bench_alerts.db]
+
+Uses a throwaway SQLite file by default; pass a Postgres URL to measure there.
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=500_000)
+    p.add_argument("--users", type=int, default=2_000)
+    p.add_argument("--queries", type=int, default=300)
+    p.add_argument("--db", default=None)
+    return p.parse_args()
+
+
+def _populate(engine, Alert, rows: int, users: int) -> None:
+    now = datetime.datetime.utcnow()
+    types = [("tip", "low"), ("tip", "medium"), ("score_drop", "high"), ("score_rise", "medium")]
+    chunk = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            alert_type, severity = random.choice(types)
+            age_days = random.expovariate(1 / 200)  # phần lớn alert đã cũ
+            chunk.append(
+                {
+                    "user_id": f"user_{random.randrange(users)}",
+                    "type": alert_type,
+                    "severity": severity,
+                    "title": "Bench",
+                    "message": "Synthetic alert for retention benchmark " * 3,
+                    "created_at": now - datetime.timedelta(days=age_days),
+                    "last_occurred_at": now - datetime.timedelta(days=age_days),
+                    "is_read": random.random() < 0.8,
+                    "occurrences": 1,
+                }
+            )
+            if len(chunk) == 10_000:
+                conn.execute(Alert.__table__.insert(), chunk)
+                chunk = []
+        if chunk:
+            conn.execute(Alert.__table__.insert(), chunk)
+
+
+def _measure(SessionLocal, list_alerts, users: int, queries: int) -> dict:
+    from fastapi import Response
+
+    db = SessionLocal()
+    timings = {"first_page": [], "unread_only": []}
+    try:
+        for _ in range(queries):
+            user_id = f"user_{random.randrange(users)}"
+            for key, unread in (("first_page", False), ("unread_only", True)):
+                t0 = time.perf_counter()
+                list_alerts(user_id, Response(), limit=50, cursor=None, unread_only=unread, type=None, severity=None, db=db)
+                timings[key].append((time.perf_counter() - t0) * 1000)
+    finally:
+        db.close()
+    return {k: (statistics.median(v), sorted(v)[int(len(v) * 0.95) - 1]) for k, v in timings.items()}
+
+
+def main() -> None:
+    args = _args()
+    tmp = None
+    if args.db is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        args.db = f"sqlite:///{tmp.name}"
+    os.environ["ALERT_DATABASE_URL"] = args.db
+
+    from sqlalchemy import func, select
+    from database import SessionLocal, engine
+    from models.alert import Alert
+    from routers.alerts import list_alerts
+    from services.retention import run_retention
+
+    print(f"Populating {args.rows} alerts for {args.users} users ...")
+    t0 = time.perf_counter()
+    _populate(engine, Alert, args.rows, args.users)
+    print(f"  done in {time.perf_counter() - t0:.1f}s")
+
+    before = _measure(SessionLocal, list_alerts, args.users, args.queries)
+    with SessionLocal() as db:
+        rows_before = db.execute(select(func.count()).select_from(Alert)).scalar()
+        t0 = time.perf_counter()
+        report = run_retention(db, archive_dir=tempfile.mkdtemp(prefix="alert-archive-"))
+        purge_s = time.perf_counter() - t0
+        rows_after = db.execute(select(func.count()).select_from(Alert)).scalar()
+    after = _measure(SessionLocal, list_alerts, args.users, args.queries)
+
+    print(f"\nRetention: removed {report['rows_removed']} rows ({report['rows_archived']} archived, "
+          f"{report['bytes_archived'] / 1024:.0f} KiB gzip) in {purge_s:.1f}s; {rows_before} -> {rows_after} rows")
+    print(f"\n{'query':<14}{'before p50/p95 (ms)':>24}{'after p50/p95 (ms)':>24}")
+    for key in before:
+        b, a = before[key], after[key]
+        print(f"{key:<14}{b[0]:>14.2f} / {b[1]:<8.2f}{a[0]:>14.2f} / {a[1]:<8.2f}")
+
+    if tmp is not None:
+        engine.dispose()
+        os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
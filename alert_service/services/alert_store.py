@@ -0,0 +1,249 @@
+"""Write paths for alerts that keep derived state (unread counters, dedup windows) consistent."""
+import datetime
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from models.alert import Alert
+from services import unread_counters
+from services.broadcaster import broadcaster
+from services.rule_engine import rule_engine
+from services.sql import dialect_insert
+
+
+def build_alerts(events: List[Any]) -> List[Alert]:
+    """Run the alert rules over score events and build (unsaved) Alert rows."""
+    return [
+        Alert(
+            user_id=event.user_id,
+            type=a["type"],
+            severity=a["severity"],
+            title=a["title"],
+            message=a["message"],
+            template_id=a["template_id"],
+            params=a["params"],
+        )
+        for event, rendered in zip(events, rule_engine.evaluate_batch(events))
+        for a in rendered
+    ]
+
+
+def _parse_windows(spec: str) -> Dict[str, int]:
+    windows: Dict[str, int] = {}
+    for item in spec.split(","):
+        if "=" in item:
+            alert_type, seconds = item.split("=", 1)
+            if int(seconds) > 0:
+                windows[alert_type.strip()] = int(seconds)
+    return windows
+
+
+# "type=giây,..."; type không có trong danh sách thì không dedup
+ALERT_DEDUP_WINDOWS = _parse_windows(os.getenv("ALERT_DEDUP_WINDOWS", "tip=86400"))
+ALERT_DEDUP_INDEX_SIZE = int(os.getenv("ALERT_DEDUP_INDEX_SIZE", "50000"))
+
+
+class RecentAlertIndex:
+    """LRU map (user_id, type) -> (dedup_bucket, alert_id) of recently written alerts.
+
+    Only a hint that lets repeats go straight to an UPDATE by primary key; the
+    unique index on (user_id, type, dedup_bucket) stays the source of truth.
+    """
+
+    def __init__(self, max_size: int = ALERT_DEDUP_INDEX_SIZE):
+        self.max_size = max_size
+        self._items: "OrderedDict[Tuple[str, str], Tuple[int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str], bucket: int) -> Optional[int]:
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is None or hit[0] != bucket:
+                return None
+            self._items.move_to_end(key)
+            return hit[1]
+
+    def put(self, key: Tuple[str, str], bucket: int, alert_id: int) -> None:
+        with self._lock:
+            self._items[key] = (bucket, alert_id)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def discard(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+recent_alerts = RecentAlertIndex()
+
+
+def _bump(db: Session, alert: Alert, now: datetime.datetime, *conds) -> Tuple[Optional[int], bool]:
+    """Fold ``alert`` into the matching row. Returns (id, was_read); id is None if no row matched.
+
+    The row is locked before it is read so a concurrent mark-read cannot slip
+    in between; a bumped row is always unread again (the new alert may be more
+    severe than the one the user already saw).
+    """
+    row = db.execute(select(Alert.id, Alert.is_read).where(*conds).with_for_update()).first()
+    if row is None:
+        return None, False
+    db.execute(
+        update(Alert)
+        .where(Alert.id == row.id)
+        .values(
+            occurrences=Alert.occurrences + alert.occurrences,
+            last_occurred_at=now,
+            is_read=False,
+            title=alert.title,
+            message=alert.message,
+            severity=alert.severity,
+            template_id=alert.template_id,
+            params=alert.params,
+        )
+    )
+    return row.id, bool(row.is_read)
+
+
+def _write_deduped(db: Session, alert: Alert, now: datetime.datetime) -> Tuple[int, bool]:
+    """Insert ``alert`` or fold it into the row of its dedup window.
+
+    Returns (id, became_unread): True when a row was inserted or an already read
+    row was bumped, i.e. when the user's unread counter must go up by one.
+    """
+    key = (alert.user_id, alert.type)
+    bucket = alert.dedup_bucket
+    hinted_id = recent_alerts.get(key, bucket)
+    if hinted_id is not None:
+        alert_id, was_read = _bump(db, alert, now, Alert.id == hinted_id, Alert.dedup_bucket == bucket)
+        if alert_id is not None:
+            return alert_id, was_read
+        recent_alerts.discard(key)
+
+    same_window = (Alert.user_id == alert.user_id, Alert.type == alert.type, Alert.dedup_bucket == bucket)
+    upsert = dialect_insert(db)
+    alert_id = None
+    if upsert is not None:
+        values = {c.key: getattr(alert, c.key) for c in Alert.__table__.columns if c.key != "id"}
+        alert_id = db.execute(
+            upsert(Alert.__table__)
+            .values(**{k: v for k, v in values.items() if v is not None})
+            .on_conflict_do_nothing(index_elements=["user_id", "type", "dedup_bucket"])
+            .returning(Alert.id)
+        ).scalar()
+        inserted = alert_id is not None
+    else:
+        inserted = db.execute(select(Alert.id).where(*same_window)).first() is None
+        if inserted:
+            db.add(alert)
+            db.flush()
+            alert_id = alert.id
+    became_unread = inserted
+    if not inserted:
+        alert_id, became_unread = _bump(db, alert, now, *same_window)
+    recent_alerts.put(key, bucket, alert_id)
+    return alert_id, became_unread
+
+
+def alert_payload(row: Alert) -> Dict[str, Any]:
+    return {c.key: getattr(row, c.key) for c in Alert.__table__.columns if c.key != "dedup_bucket"}
+
+
+def insert_alerts(db: Session, alerts: List[Alert]) -> List[Dict[str, Any]]:
+    """Insert alerts and bump unread counters in one transaction.
+
+    Alert types listed in ALERT_DEDUP_WINDOWS are coalesced: a repeat within the
+    same window increments ``occurrences`` on the existing row instead of inserting,
+    marks it unread again and moves ``last_occurred_at`` (the listing order).
+    Windows are fixed UTC buckets (epoch seconds // window), not sliding: two
+    alerts a second apart can land in adjacent buckets.
+    Returns the written rows as dicts, which are also pushed to live subscribers.
+    """
+    if not alerts:
+        return []
+    now_utc = datetime.datetime.now(datetime.timezone.utc)
+    epoch = int(now_utc.timestamp())
+    now = now_utc.replace(tzinfo=None)  # cột DateTime lưu UTC không kèm timezone
+    plain: List[Alert] = []
+    windowed: Dict[Tuple[str, str], Alert] = {}
+    for a in alerts:
+        a.created_at = a.last_occurred_at = now
+        a.occurrences = a.occurrences or 1
+        window = ALERT_DEDUP_WINDOWS.get(a.type)
+        if window is None:
+            plain.append(a)
+            continue
+        a.dedup_bucket = epoch // window
+        prev = windowed.get((a.user_id, a.type))
+        if prev is not None:
+            a.occurrences += prev.occurrences
+        windowed[(a.user_id, a.type)] = a
+
+    db.add_all(plain)
+    db.flush()
+    ids = [a.id for a in plain]
+    deltas = Counter(a.user_id for a in plain)
+    for a in windowed.values():
+        alert_id, became_unread = _write_deduped(db, a, now)
+        ids.append(alert_id)
+        if became_unread:
+            deltas[a.user_id] += 1
+    unread_counters.adjust(db, deltas)
+    rows = {r.id: r for r in db.query(Alert).filter(Alert.id.in_(ids))}
+    payloads = [alert_payload(rows[i]) for i in ids if i in rows]
+    broadcaster.publish(db, payloads)
+    db.commit()
+    unread_counters.invalidate(deltas)
+    return payloads
+
+
+def mark_alert_read(db: Session, alert_id: int) -> Optional[bool]:
+    """Mark one alert read. Returns None if the alert does not exist."""
+    user_id = db.execute(
+        update(Alert)
+        .where(Alert.id == alert_id, Alert.is_read.is_(False))
+        .values(is_read=True)
+        .returning(Alert.user_id)
+    ).scalar()
+    if user_id is None:
+        db.rollback()
+        exists = db.execute(select(Alert.id).where(Alert.id == alert_id)).first()
+        return True if exists else None
+    unread_counters.adjust(db, {user_id: -1})
+    db.commit()
+    unread_counters.invalidate([user_id])
+    return True
+
+
+def mark_alerts_read(db: Session, alert_ids: List[int], user_id: Optional[str] = None) -> int:
+    """Mark a list of alerts read with one UPDATE. Returns the number of alerts changed."""
+    if not alert_ids:
+        return 0
+    stmt = update(Alert).where(Alert.id.in_(set(alert_ids)), Alert.is_read.is_(False))
+    if user_id is not None:
+        stmt = stmt.where(Alert.user_id == user_id)
+    owners = db.execute(stmt.values(is_read=True).returning(Alert.user_id)).scalars().all()
+    deltas = {u: -n for u, n in Counter(owners).items()}
+    unread_counters.adjust(db, deltas)
+    db.commit()
+    unread_counters.invalidate(deltas)
+    return len(owners)
+
+
+def mark_all_read(db: Session, user_id: str) -> int:
+    """Mark every unread alert of a user read. Returns the number of alerts changed."""
+    updated = db.execute(
+        update(Alert).where(Alert.user_id == user_id, Alert.is_read.is_(False)).values(is_read=True)
+    ).rowcount
+    unread_counters.adjust(db, {user_id: -updated})
+    db.commit()
+    unread_counters.invalidate([user_id])
+    return updated
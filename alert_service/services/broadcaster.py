@@ -0,0 +1,160 @@
+"""Fan-out of committed alerts to live (SSE) subscribers.
+
+Writers call ``publish(db, payloads)`` before committing. On Postgres this is a
+``pg_notify`` inside the same transaction, so every worker's listener receives
+it exactly when the transaction commits; each worker keeps a single LISTEN
+connection shared by all of its subscribers. On other databases (SQLite in
+dev/tests) payloads are parked on the session and dispatched in-process from
+the ``after_commit`` hook.
+
+Each subscriber owns a bounded queue. A client that falls behind is dropped
+(its stream ends and it reconnects) instead of slowing everyone else down.
+"""
+import asyncio
+import json
+import os
+import select
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+ALERT_NOTIFY_CHANNEL = os.getenv("ALERT_NOTIFY_CHANNEL", "alert_events")
+ALERT_SSE_QUEUE_SIZE = int(os.getenv("ALERT_SSE_QUEUE_SIZE", "100"))
+
+_PENDING_KEY = "pending_alert_events"
+
+
+class Subscription:
+    def __init__(self, user_id: str, maxsize: int):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+
+class AlertBroadcaster:
+    def __init__(self, queue_size: int = ALERT_SSE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subs: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+
+    # ---- writer side -------------------------------------------------
+    def publish(self, db: Session, payloads: List[Dict[str, Any]]) -> None:
+        """Queue payloads for delivery once the current transaction commits."""
+        if not payloads:
+            return
+        if db.get_bind().dialect.name == "postgresql":
+            for p in payloads:
+                db.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": ALERT_NOTIFY_CHANNEL, "payload": json.dumps(p, default=str)},
+                )
+        else:
+            db.info.setdefault(_PENDING_KEY, []).extend(payloads)
+
+    def deliver(self, payload: Dict[str, Any]) -> None:
+        """Thread-safe hand-off of one committed alert to the event loop."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed() and self._subs.get(payload.get("user_id")):
+            loop.call_soon_threadsafe(self._dispatch, payload)
+
+    # ---- subscriber side (event loop only) ---------------------------
+    def subscribe(self, user_id: str) -> Subscription:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        sub = Subscription(user_id, self.queue_size)
+        self._subs.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subs.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subs[sub.user_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subs.values())
+
+    def _dispatch(self, payload: Dict[str, Any]) -> None:
+        for sub in list(self._subs.get(payload.get("user_id"), ())):
+            try:
+                sub.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                self._drop(sub)
+
+    def _drop(self, sub: Subscription) -> None:
+        sub.dropped = True
+        self.unsubscribe(sub)
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+    # ---- lifecycle ---------------------------------------------------
+    def start(self, engine: Engine) -> None:
+        self._loop = asyncio.get_running_loop()
+        if engine.dialect.name == "postgresql" and self._listener is None:
+            self._stop.clear()
+            self._listener = threading.Thread(
+                target=self._listen, args=(engine,), name="alert-listener", daemon=True
+            )
+            self._listener.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join(timeout=5)
+            self._listener = None
+        for subs in list(self._subs.values()):
+            for sub in list(subs):
+                self._drop(sub)
+
+    def _listen(self, engine: Engine) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                raw.detach()  # kết nối LISTEN riêng, không trả về pool
+                conn = raw.dbapi_connection
+                conn.autocommit = True
+                conn.cursor().execute(f'LISTEN "{ALERT_NOTIFY_CHANNEL}"')
+                backoff = 1.0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        note = conn.notifies.pop(0)
+                        try:
+                            self.deliver(json.loads(note.payload))
+                        except ValueError:
+                            continue
+            except Exception:
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+
+broadcaster = AlertBroadcaster()
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_pending(session: Session) -> None:
+    for payload in session.info.pop(_PENDING_KEY, ()):
+        broadcaster.deliver(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
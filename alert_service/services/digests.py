@@ -0,0 +1,150 @@
+"""Daily per-user alert digests.
+
+All users' counts for a day come from one ``GROUP BY user_id, type, severity``
+query over ``alerts``. Users that already have a digest row for the day are
+skipped, the rest are split into chunks written in parallel, each chunk in its
+own session and transaction. A run that fails half-way can simply be started
+again: finished users are skipped and ``ON CONFLICT DO NOTHING`` covers races
+between workers.
+"""
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from models.alert import Alert, AlertDigest
+from services.sql import dialect_insert, job_lock
+
+
+ALERT_DIGEST_CHUNK_SIZE = int(os.getenv("ALERT_DIGEST_CHUNK_SIZE", "500"))
+ALERT_DIGEST_WORKERS = int(os.getenv("ALERT_DIGEST_WORKERS", "4"))
+ALERT_DIGEST_INTERVAL_SECONDS = float(os.getenv("ALERT_DIGEST_INTERVAL_SECONDS", "3600"))
+DIGEST_JOB_LOCK = "alert-digest"
+
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3}
+
+
+def aggregate_day(db: Session, day: datetime.date) -> Dict[str, Dict[str, Any]]:
+    """Summaries for every user with alerts on ``day`` (UTC), from a single grouped query."""
+    start = datetime.datetime.combine(day, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+    rows = db.execute(
+        select(
+            Alert.user_id,
+            Alert.type,
+            Alert.severity,
+            func.count(),
+            func.sum(case((Alert.is_read.is_(False), 1), else_=0)),
+            func.min(Alert.created_at),
+            func.max(Alert.created_at),
+        )
+        .where(Alert.created_at >= start, Alert.created_at < end)
+        .group_by(Alert.user_id, Alert.type, Alert.severity)
+    ).all()
+
+    summaries: Dict[str, Dict[str, Any]] = {}
+    for user_id, alert_type, severity, count, unread, first_at, last_at in rows:
+        s = summaries.get(user_id)
+        if s is None:
+            s = summaries[user_id] = {
+                "user_id": user_id,
+                "digest_date": day,
+                "total": 0,
+                "unread": 0,
+                "by_type": {},
+                "by_severity": {},
+                "top_severity": severity,
+                "first_alert_at": first_at,
+                "last_alert_at": last_at,
+            }
+        s["total"] += count
+        s["unread"] += unread or 0
+        s["by_type"][alert_type] = s["by_type"].get(alert_type, 0) + count
+        s["by_severity"][severity] = s["by_severity"].get(severity, 0) + count
+        if SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(s["top_severity"], 0):
+            s["top_severity"] = severity
+        s["first_alert_at"] = min(s["first_alert_at"], first_at)
+        s["last_alert_at"] = max(s["last_alert_at"], last_at)
+    return summaries
+
+
+def _write_chunk(session_factory: Callable[[], Session], rows: List[Dict[str, Any]]) -> int:
+    db = session_factory()
+    try:
+        now = datetime.datetime.utcnow()
+        rows = [dict(r, created_at=now) for r in rows]
+        upsert = dialect_insert(db)
+        if upsert is not None:
+            result = db.execute(
+                upsert(AlertDigest.__table__)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["user_id", "digest_date"])
+            )
+            written = result.rowcount
+        else:
+            db.execute(AlertDigest.__table__.insert(), rows)
+            written = len(rows)
+        db.commit()
+        return written
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def generate_digests(
+    session_factory: Callable[[], Session],
+    day: datetime.date,
+    chunk_size: int = ALERT_DIGEST_CHUNK_SIZE,
+    workers: int = ALERT_DIGEST_WORKERS,
+) -> Dict[str, Any]:
+    db = session_factory()
+    try:
+        summaries = aggregate_day(db, day)
+        done = set(
+            db.execute(select(AlertDigest.user_id).where(AlertDigest.digest_date == day)).scalars()
+        )
+    finally:
+        db.close()
+
+    pending = [summaries[u] for u in sorted(summaries) if u not in done]
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    report: Dict[str, Any] = {
+        "day": day,
+        "users": len(summaries),
+        "skipped": len(summaries) - len(pending),
+        "written": 0,
+        "chunks": len(chunks),
+        "failed_chunks": 0,
+        "last_error": None,
+    }
+    if not chunks:
+        return report
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+        futures = [pool.submit(_write_chunk, session_factory, chunk) for chunk in chunks]
+        for future in futures:
+            try:
+                report["written"] += future.result()
+            except Exception as e:
+                report["failed_chunks"] += 1
+                report["last_error"] = f"{type(e).__name__}: {e}"
+    return report
+
+
+def run_digest_job(day: Optional[datetime.date] = None) -> Optional[Dict[str, Any]]:
+    """Periodic entry point: build digests for yesterday (UTC) unless ``day`` is given.
+
+    Every worker schedules the job; only the one holding the ``alert-digest``
+    job lock runs it, the others return None.
+    """
+    from database import SessionLocal, engine
+
+    day = day or (datetime.datetime.utcnow().date() - datetime.timedelta(days=1))
+    with job_lock(engine, DIGEST_JOB_LOCK) as acquired:
+        if not acquired:
+            return None
+        return generate_digests(SessionLocal, day)
@@ -0,0 +1,193 @@
+"""Bounded in-process queue that turns bursts of score events into batched writes.
+
+``POST /alerts/events`` only enqueues and returns 202. A single background task
+collects events until ``ALERT_INGEST_BATCH_SIZE`` is reached or
+``ALERT_INGEST_FLUSH_SECONDS`` has passed since the first one, then evaluates
+the rules over the whole batch and writes it in one transaction (in a worker
+thread, so the event loop keeps accepting). When the queue is full ``offer``
+returns False and the caller answers 429. On shutdown the queue stops accepting
+and everything already queued is flushed before the task exits.
+
+Callers were already told 202, so a failed batch is not simply dropped: it is
+retried once (transient errors), then split in halves until the failing events
+are isolated. Only those are lost; they are kept with their error in a bounded
+dead-letter list (``ALERT_INGEST_DEAD_LETTERS`` entries, ``GET /alerts/events/dead-letters``).
+"""
+import asyncio
+import datetime
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from services import alert_store
+
+
+ALERT_INGEST_QUEUE_SIZE = int(os.getenv("ALERT_INGEST_QUEUE_SIZE", "10000"))
+ALERT_INGEST_BATCH_SIZE = int(os.getenv("ALERT_INGEST_BATCH_SIZE", "500"))
+ALERT_INGEST_FLUSH_SECONDS = float(os.getenv("ALERT_INGEST_FLUSH_SECONDS", "0.2"))
+ALERT_INGEST_DEAD_LETTERS = int(os.getenv("ALERT_INGEST_DEAD_LETTERS", "1000"))
+
+_STOP = object()
+
+
+class AlertIngestQueue:
+    def __init__(
+        self,
+        maxsize: int = ALERT_INGEST_QUEUE_SIZE,
+        batch_size: int = ALERT_INGEST_BATCH_SIZE,
+        flush_seconds: float = ALERT_INGEST_FLUSH_SECONDS,
+        dead_letter_size: int = ALERT_INGEST_DEAD_LETTERS,
+    ):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.accepting = False
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.retries = 0
+        self.last_error: Optional[str] = None
+        self._dead_letters: deque = deque(maxlen=dead_letter_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._session_factory: Optional[Callable[[], Session]] = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "accepting": self.accepting,
+            "depth": self.depth,
+            "capacity": self.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dead_letters": len(self._dead_letters),
+            "last_error": self.last_error,
+        }
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """Events that could not be written, oldest first (bounded; older ones are discarded)."""
+        return list(self._dead_letters)
+
+    def offer(self, event: Any) -> bool:
+        """Enqueue without waiting. False means full (or shutting down).
+
+        Must be called from the event loop thread (i.e. from an ``async def`` route).
+        """
+        if not self.accepting or self._queue is None:
+            self.rejected += 1
+            return False
+        if self._queue.qsize() >= self.maxsize:
+            self.rejected += 1
+            return False
+        self._queue.put_nowait(event)
+        self.accepted += 1
+        return True
+
+    async def start(self, session_factory: Callable[[], Session]) -> None:
+        self._session_factory = session_factory
+        # +1 chỗ cho sentinel lúc shutdown
+        self._queue = asyncio.Queue(maxsize=self.maxsize + 1)
+        self.accepting = True
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop accepting, flush everything still queued, then return."""
+        if self._task is None:
+            return
+        self.accepting = False
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch: List[Any] = [item]
+            stopping = False
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await asyncio.to_thread(self._flush, batch)
+            if stopping:
+                return
+
+    def _flush(self, batch: List[Any]) -> None:
+        try:
+            self._write(batch)
+            self.last_error = None
+        except Exception:
+            # Lỗi tạm thời (deadlock, mất kết nối...): thử lại cả lô một lần
+            self.retries += 1
+            try:
+                self._write(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    self._dead_letter(batch[0], e)
+                else:
+                    self._write_split(batch)
+        finally:
+            self.batches += 1
+
+    def _write(self, batch: List[Any]) -> None:
+        db = self._session_factory()
+        try:
+            alert_store.insert_alerts(db, alert_store.build_alerts(batch))
+        except Exception as e:
+            db.rollback()
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            db.close()
+        self.written += len(batch)
+
+    def _write_split(self, batch: List[Any]) -> None:
+        # Chia đôi tới khi cô lập được sự kiện lỗi: các sự kiện hợp lệ trong lô vẫn được ghi
+        mid = len(batch) // 2
+        for part in (batch[:mid], batch[mid:]):
+            try:
+                self._write(part)
+            except Exception as e:
+                if len(part) == 1:
+                    self._dead_letter(part[0], e)
+                else:
+                    self._write_split(part)
+
+    def _dead_letter(self, event: Any, error: Exception) -> None:
+        self.failed += 1
+        self._dead_letters.append(
+            {
+                "event": event.model_dump(mode="json") if hasattr(event, "model_dump") else event,
+                "error": f"{type(error).__name__}: {error}",
+                "failed_at": datetime.datetime.utcnow(),
+            }
+        )
+
+
+ingest_queue = AlertIngestQueue()
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Callable, Optional
+
+
+class PeriodicJob:
+    """Run a blocking function every ``interval`` seconds in a worker thread."""
+
+    def __init__(self, name: str, fn: Callable[[], object], interval: float):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.last_result: object = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.last_result = await asyncio.to_thread(self.fn)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
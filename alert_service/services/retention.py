@@ -0,0 +1,287 @@
+"""Alert retention: delete or archive old alerts in bounded batches.
+
+Policies come from ``config/retention.yaml`` (or ``ALERT_RETENTION_PATH``). Each
+alert belongs to the first policy whose type/severity match, which is expressed
+in SQL by excluding the matchers of every earlier policy. Rows are processed
+``batch_size`` at a time, oldest id first, one transaction per batch; archived
+rows are written out before they are deleted. Unread counters are adjusted for
+unread rows that disappear.
+
+Archives (``ALERT_ARCHIVE_FORMAT``): ``ndjson`` appends to one gzip-compressed
+NDJSON file per run, flushed after every batch; ``parquet`` (needs the optional
+``pyarrow`` package) writes one complete file per batch into a per-run
+directory, since a Parquet file is only readable once its footer is written.
+Names carry the pid and a random suffix, so concurrent runs never share a file.
+
+Only one run at a time applies the policies: every worker starts the periodic
+job, and a run that cannot take the ``alert-retention`` job lock (an advisory
+lock on PostgreSQL) returns a report with ``skipped`` set instead.
+"""
+import datetime
+import gzip
+import json
+import os
+import secrets
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import yaml
+from sqlalchemy import JSON, Boolean, DateTime, Integer, and_, delete, func, not_, or_, select, true
+from sqlalchemy.orm import Session
+
+from models.alert import Alert
+from services import unread_counters
+from services.alert_store import alert_payload
+from services.sql import job_lock
+
+
+_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALERT_RETENTION_PATH = os.getenv("ALERT_RETENTION_PATH", os.path.join(_SERVICE_DIR, "config", "retention.yaml"))
+ALERT_ARCHIVE_DIR = os.getenv("ALERT_ARCHIVE_DIR", os.path.join(_SERVICE_DIR, "archive"))
+ALERT_RETENTION_BATCH_SIZE = int(os.getenv("ALERT_RETENTION_BATCH_SIZE", "1000"))
+ALERT_RETENTION_INTERVAL_SECONDS = float(os.getenv("ALERT_RETENTION_INTERVAL_SECONDS", "21600"))
+ALERT_ARCHIVE_FORMAT = os.getenv("ALERT_ARCHIVE_FORMAT", "ndjson")
+
+ACTIONS = ("delete", "archive")
+ARCHIVE_FORMATS = ("ndjson", "parquet")
+RETENTION_JOB_LOCK = "alert-retention"
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    max_age_days: Optional[int] = None
+    type: Optional[str] = None
+    severity: Optional[str] = None
+    only_read: bool = False
+    action: str = "delete"
+    keep: bool = False
+
+    @property
+    def name(self) -> str:
+        return f"type={self.type or '*'},severity={self.severity or '*'}"
+
+    def matcher(self):
+        conds = []
+        if self.type:
+            conds.append(Alert.type == self.type)
+        if self.severity:
+            conds.append(Alert.severity == self.severity)
+        return and_(*conds) if conds else true()
+
+
+def load_policies(path: str = ALERT_RETENTION_PATH) -> List[RetentionPolicy]:
+    with open(path, encoding="utf-8") as f:
+        doc = yaml.safe_load(f) or {}
+    policies = []
+    for raw in doc.get("policies") or []:
+        policy = RetentionPolicy(
+            max_age_days=raw.get("max_age_days"),
+            type=raw.get("type"),
+            severity=raw.get("severity"),
+            only_read=bool(raw.get("only_read", False)),
+            action=raw.get("action", "delete"),
+            keep=bool(raw.get("keep", False)),
+        )
+        if policy.action not in ACTIONS:
+            raise ValueError(f"Unknown retention action '{policy.action}' for {policy.name}")
+        if not policy.keep and not policy.max_age_days:
+            raise ValueError(f"Retention policy {policy.name} needs max_age_days (or keep: true)")
+        policies.append(policy)
+    return policies
+
+
+def check_archive_format(fmt: str) -> None:
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format '{fmt}'. Use one of: " + ", ".join(ARCHIVE_FORMATS))
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet archives require the optional 'pyarrow' package")
+
+
+def _archive_stem(started: datetime.datetime) -> str:
+    # pid + hậu tố ngẫu nhiên: các worker/lần chạy cùng giây không bao giờ ghi chung một file
+    return f"alerts-{started:%Y%m%dT%H%M%S}-{os.getpid()}-{secrets.token_hex(4)}"
+
+
+class _NDJSONArchive:
+    """Lazily opened gzip NDJSON file shared by all batches of one run."""
+
+    def __init__(self, directory: str, started: datetime.datetime):
+        self.path = os.path.join(directory, _archive_stem(started) + ".ndjson.gz")
+        self._file = None
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = gzip.open(self.path, "xt", encoding="utf-8")
+        for row in rows:
+            self._file.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        # Flush mỗi batch: dòng đã xoá khỏi DB thì chắc chắn đã nằm trong file
+        self._file.flush()
+
+    def close(self) -> int:
+        if self._file is None:
+            return 0
+        self._file.close()
+        return os.path.getsize(self.path)
+
+
+class _ParquetArchive:
+    """Per-run directory with one Parquet file per batch (``part-00001.parquet``, ...)."""
+
+    def __init__(self, directory: str, started: datetime.datetime):
+        self.path = os.path.join(directory, _archive_stem(started) + ".parquet")
+        self._parts = 0
+        self._bytes = 0
+        self._schema = None
+
+    def _arrow_schema(self):
+        import pyarrow as pa
+
+        fields = []
+        for c in Alert.__table__.columns:
+            if c.key == "dedup_bucket":
+                continue
+            if isinstance(c.type, Boolean):
+                t = pa.bool_()
+            elif isinstance(c.type, Integer):
+                t = pa.int64()
+            elif isinstance(c.type, DateTime):
+                t = pa.timestamp("us")
+            else:
+                t = pa.string()  # String, và JSON (params) được ghi dạng chuỗi JSON
+            fields.append((c.key, t))
+        return pa.schema(fields)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._schema is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._schema = self._arrow_schema()
+        json_columns = {c.key for c in Alert.__table__.columns if isinstance(c.type, JSON)}
+        data = {
+            name: [
+                None if r[name] is None else json.dumps(r[name], ensure_ascii=False) if name in json_columns else r[name]
+                for r in rows
+            ]
+            for name in self._schema.names
+        }
+        self._parts += 1
+        part = os.path.join(self.path, f"part-{self._parts:05d}.parquet")
+        # File đóng (có footer) trước khi các dòng bị xoá khỏi DB
+        pq.write_table(pa.Table.from_pydict(data, schema=self._schema), part, compression="snappy")
+        self._bytes += os.path.getsize(part)
+
+    def close(self) -> int:
+        return self._bytes
+
+
+_ARCHIVES = {"ndjson": _NDJSONArchive, "parquet": _ParquetArchive}
+
+
+def run_retention(
+    db: Session,
+    policies: Optional[List[RetentionPolicy]] = None,
+    now: Optional[datetime.datetime] = None,
+    batch_size: int = ALERT_RETENTION_BATCH_SIZE,
+    archive_dir: str = ALERT_ARCHIVE_DIR,
+    archive_format: str = ALERT_ARCHIVE_FORMAT,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Apply the retention policies. Returns rows removed/archived and bytes written.
+
+    ``skipped`` is True (and nothing is touched) when another run holds the job lock.
+    """
+    policies = load_policies() if policies is None else policies
+    check_archive_format(archive_format)
+    now = now or datetime.datetime.utcnow()
+    report: Dict[str, Any] = {
+        "dry_run": dry_run,
+        "skipped": False,
+        "rows_removed": 0,
+        "rows_archived": 0,
+        "bytes_archived": 0,
+        "archive_file": None,
+        "policies": [],
+    }
+    if dry_run:
+        _apply(db, policies, now, batch_size, None, report)
+        return report
+    with job_lock(db.get_bind(), RETENTION_JOB_LOCK) as acquired:
+        if not acquired:
+            report["skipped"] = True
+            return report
+        archive = _ARCHIVES[archive_format](archive_dir, now)
+        try:
+            _apply(db, policies, now, batch_size, archive, report)
+        finally:
+            report["bytes_archived"] = archive.close()
+            if report["bytes_archived"]:
+                report["archive_file"] = archive.path
+    return report
+
+
+def _apply(db: Session, policies: List[RetentionPolicy], now: datetime.datetime, batch_size: int, archive, report) -> None:
+    """Process every policy; ``archive`` is None for a dry run (count only)."""
+    earlier = []
+    for policy in policies:
+        scope = and_(policy.matcher(), not_(or_(*earlier))) if earlier else policy.matcher()
+        earlier.append(policy.matcher())
+        if policy.keep:
+            continue
+        cutoff = now - datetime.timedelta(days=policy.max_age_days)
+        where = [scope, Alert.created_at < cutoff]
+        if policy.only_read:
+            where.append(Alert.is_read.is_(True))
+
+        removed = 0
+        if archive is None:
+            removed = db.execute(select(func.count()).select_from(Alert).where(*where)).scalar()
+        else:
+            while True:
+                batch = (
+                    db.execute(
+                        select(Alert)
+                        .where(*where)
+                        .order_by(Alert.id)
+                        .limit(batch_size)
+                        .with_for_update(skip_locked=True)
+                    )
+                    .scalars()
+                    .all()
+                )
+                if not batch:
+                    break
+                if policy.action == "archive":
+                    archive.write([alert_payload(a) for a in batch])
+                ids = [a.id for a in batch]
+                unread = Counter(a.user_id for a in batch if not a.is_read)
+                db.execute(delete(Alert).where(Alert.id.in_(ids)), execution_options={"synchronize_session": False})
+                unread_counters.adjust(db, {u: -n for u, n in unread.items()})
+                db.commit()
+                db.expunge_all()
+                unread_counters.invalidate(unread)
+                removed += len(batch)
+                if len(batch) < batch_size:
+                    break
+
+        report["policies"].append({"policy": policy.name, "action": policy.action, "rows": removed})
+        report["rows_removed"] += removed
+        if policy.action == "archive":
+            report["rows_archived"] += removed
+
+
+def run_retention_job() -> Dict[str, Any]:
+    """Entry point for the periodic retention job (opens its own session)."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return run_retention(db)
+    finally:
+        db.close()
@@ -0,0 +1,304 @@
+"""Declarative alert rules: load from YAML, compile once, evaluate in batches.
+
+Rules live in ``config/alert_rules.yaml`` (or ``ALERT_RULES_PATH``). The file is
+compiled into an immutable ``CompiledRuleSet``; ``RuleEngine`` checks the file's
+mtime at most every ``ALERT_RULES_RELOAD_SECONDS`` and swaps in a freshly compiled
+rule set, so workers pick up changes without a restart. A broken file never
+replaces the active rules: the error is kept in ``last_error`` instead.
+"""
+import hashlib
+import operator
+import os
+import string
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import yaml
+
+from services.templates import message_catalog
+
+
+ALERT_RULES_PATH = os.getenv(
+    "ALERT_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "alert_rules.yaml"),
+)
+ALERT_RULES_RELOAD_SECONDS = float(os.getenv("ALERT_RULES_RELOAD_SECONDS", "5"))
+
+# Các trường có thể dùng trong `when` và trong template
+FIELDS = ("delta", "abs_delta", "old_score", "new_score", "category", "model_version")
+ALERT_KEYS = ("type", "severity")
+
+
+class RuleError(ValueError):
+    """Raised when a rules document cannot be parsed or compiled."""
+
+
+def _none_safe(fn: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    def op(value: Any, operand: Any) -> bool:
+        return value is not None and fn(value, operand)
+
+    return op
+
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": _none_safe(operator.lt),
+    "lte": _none_safe(operator.le),
+    "gt": _none_safe(operator.gt),
+    "gte": _none_safe(operator.ge),
+    "in": lambda value, operand: value in operand,
+    "not_in": lambda value, operand: value not in operand,
+    "is_null": lambda value, operand: (value is None) == bool(operand),
+}
+
+Condition = Tuple[str, str, Any]  # (field, op, operand) – hashable so masks can be shared
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    id: str
+    group: str
+    conditions: Tuple[Condition, ...]
+    type: str
+    severity: str
+    title: Optional[str] = None
+    message: Optional[str] = None
+    template: Optional[str] = None
+    template_fields: Tuple[str, ...] = ()
+
+    def render(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        if self.template is not None:
+            params = {f: ctx[f] for f in self.template_fields}
+            title, message = message_catalog.render(self.template, params)
+        else:
+            params = None
+            title, message = self.title.format_map(ctx), self.message.format_map(ctx)
+        return {
+            "rule_id": self.id,
+            "type": self.type,
+            "severity": self.severity,
+            "title": title,
+            "message": message,
+            "template_id": self.template,
+            "params": params,
+        }
+
+
+@dataclass(frozen=True)
+class CompiledRuleSet:
+    version: str
+    rules: Tuple[CompiledRule, ...]
+    groups: Tuple[Tuple[str, Tuple[CompiledRule, ...]], ...]
+
+    def evaluate(self, event: Any) -> List[Dict[str, Any]]:
+        return self.evaluate_batch([event])[0]
+
+    def evaluate_batch(self, events: Sequence[Any]) -> List[List[Dict[str, Any]]]:
+        """Evaluate every rule over a batch of events column by column.
+
+        Each distinct condition is evaluated once over its whole column and the
+        resulting boolean mask is shared by every rule that uses it; rules then
+        combine masks instead of re-testing events one by one.
+        """
+        n = len(events)
+        contexts = [event_context(e) for e in events]
+        columns = {f: [c[f] for c in contexts] for f in FIELDS}
+        masks: Dict[Condition, List[bool]] = {}
+        results: List[List[Dict[str, Any]]] = [[] for _ in range(n)]
+
+        for _, rules in self.groups:
+            claimed = [False] * n
+            for rule in rules:
+                hit = [not c for c in claimed]
+                for cond in rule.conditions:
+                    mask = masks.get(cond)
+                    if mask is None:
+                        field, op, operand = cond
+                        fn = OPERATORS[op]
+                        mask = [fn(v, operand) for v in columns[field]]
+                        masks[cond] = mask
+                    hit = [h and m for h, m in zip(hit, mask)]
+                for i, h in enumerate(hit):
+                    if h:
+                        claimed[i] = True
+                        results[i].append(rule.render(contexts[i]))
+        return results
+
+
+def event_context(event: Any) -> Dict[str, Any]:
+    """Build the variables visible to conditions/templates from a score event."""
+    get = event.get if isinstance(event, dict) else lambda k: getattr(event, k, None)
+    old_score = get("old_score")
+    new_score = get("new_score")
+    delta = None
+    if old_score is not None and new_score is not None:
+        delta = new_score - old_score
+    return {
+        "delta": delta,
+        "abs_delta": abs(delta) if delta is not None else None,
+        "old_score": old_score,
+        "new_score": new_score,
+        "category": get("category"),
+        "model_version": get("model_version"),
+    }
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, (list, tuple, set)):
+        return frozenset(value)
+    return value
+
+
+def _check_template(rule_id: str, key: str, template: Any) -> str:
+    if not isinstance(template, str):
+        raise RuleError(f"Rule '{rule_id}': alert.{key} must be a string")
+    try:
+        fields = [f for _, f, _, _ in string.Formatter().parse(template) if f]
+    except ValueError as e:
+        raise RuleError(f"Rule '{rule_id}': invalid template in alert.{key}: {e}")
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise RuleError(f"Rule '{rule_id}': unknown template field(s) {unknown} in alert.{key}")
+    return template
+
+
+def compile_rules(text: str) -> CompiledRuleSet:
+    """Parse and validate a YAML rules document."""
+    try:
+        doc = yaml.safe_load(text) or {}
+    except yaml.YAMLError as e:
+        raise RuleError(f"Invalid YAML: {e}")
+    if not isinstance(doc, dict) or not isinstance(doc.get("rules"), list):
+        raise RuleError("Rules document must be a mapping with a 'rules' list")
+
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+    version = f"{doc.get('version', 0)}-{digest}"
+
+    compiled: List[CompiledRule] = []
+    seen_ids = set()
+    for idx, raw in enumerate(doc["rules"]):
+        if not isinstance(raw, dict):
+            raise RuleError(f"Rule #{idx} must be a mapping")
+        rule_id = str(raw.get("id") or f"rule_{idx}")
+        if rule_id in seen_ids:
+            raise RuleError(f"Duplicate rule id '{rule_id}'")
+        seen_ids.add(rule_id)
+
+        conditions: List[Condition] = []
+        for field, spec in (raw.get("when") or {}).items():
+            if field not in FIELDS:
+                raise RuleError(f"Rule '{rule_id}': unknown field '{field}'")
+            if not isinstance(spec, dict):
+                spec = {"eq": spec}
+            for op, operand in spec.items():
+                if op not in OPERATORS:
+                    raise RuleError(f"Rule '{rule_id}': unknown operator '{op}'")
+                conditions.append((field, op, _freeze(operand)))
+
+        alert = raw.get("alert") or {}
+        required = ALERT_KEYS if "template" in alert else ALERT_KEYS + ("title", "message")
+        missing = [k for k in required if k not in alert]
+        if missing:
+            raise RuleError(f"Rule '{rule_id}': alert is missing {missing}")
+        text: Dict[str, Any] = {}
+        if "template" in alert:
+            template_id = str(alert["template"])
+            if template_id not in message_catalog:
+                raise RuleError(f"Rule '{rule_id}': unknown message template '{template_id}'")
+            fields = message_catalog.fields(template_id)
+            unknown = sorted(fields - set(FIELDS))
+            if unknown:
+                raise RuleError(f"Rule '{rule_id}': unknown template field(s) {unknown} in '{template_id}'")
+            text = {"template": template_id, "template_fields": tuple(sorted(fields))}
+        else:
+            text = {
+                "title": _check_template(rule_id, "title", alert["title"]),
+                "message": _check_template(rule_id, "message", alert["message"]),
+            }
+        compiled.append(
+            CompiledRule(
+                id=rule_id,
+                group=str(raw.get("group") or rule_id),
+                conditions=tuple(conditions),
+                type=str(alert["type"]),
+                severity=str(alert["severity"]),
+                **text,
+            )
+        )
+
+    groups: Dict[str, List[CompiledRule]] = {}
+    for rule in compiled:
+        groups.setdefault(rule.group, []).append(rule)
+    return CompiledRuleSet(
+        version=version,
+        rules=tuple(compiled),
+        groups=tuple((g, tuple(rs)) for g, rs in groups.items()),
+    )
+
+
+class RuleEngine:
+    """Holds the active rule set and hot-reloads it when the file changes."""
+
+    def __init__(self, path: str = ALERT_RULES_PATH, reload_seconds: float = ALERT_RULES_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._ruleset: Optional[CompiledRuleSet] = None
+        self.reload(force=True)
+
+    def _stat(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError as e:
+            self.last_error = f"Cannot read rules file: {e}"
+            return None
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompile the rules if the file changed. Returns True if rules were swapped."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            catalog_error = None
+            try:
+                # Template đổi (vd. thêm biến) => biên dịch lại rule để cập nhật params
+                force = message_catalog.reload() or force
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                catalog_error = f"Cannot load message templates: {e}"
+                self.last_error = catalog_error
+            mtime = self._stat()
+            if mtime is None or (not force and mtime == self._mtime):
+                return False
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    ruleset = compile_rules(f.read())
+            except (OSError, RuleError) as e:
+                self.last_error = str(e)
+                self._mtime = mtime
+                return False
+            # Gán một tham chiếu duy nhất => request đang chạy vẫn dùng bộ rule cũ trọn vẹn
+            self._ruleset = ruleset
+            self._mtime = mtime
+            self.last_error = catalog_error
+            return True
+
+    @property
+    def ruleset(self) -> CompiledRuleSet:
+        if time.monotonic() - self._checked_at >= self.reload_seconds:
+            self.reload()
+        if self._ruleset is None:
+            raise RuleError(self.last_error or "No alert rules loaded")
+        return self._ruleset
+
+    def evaluate(self, event: Any) -> List[Dict[str, Any]]:
+        return self.ruleset.evaluate(event)
+
+    def evaluate_batch(self, events: Iterable[Any]) -> List[List[Dict[str, Any]]]:
+        return self.ruleset.evaluate_batch(list(events))
+
+
+rule_engine = RuleEngine()
@@ -0,0 +1,53 @@
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+def dialect_insert(db: Session):
+    """Return the dialect ``insert`` that supports ON CONFLICT, or None if unsupported."""
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        return postgresql.insert
+    if name == "sqlite":
+        return sqlite.insert
+    return None
+
+
+_local_locks: Dict[str, threading.Lock] = {}
+_local_locks_guard = threading.Lock()
+
+
+@contextmanager
+def job_lock(engine: Engine, name: str) -> Iterator[bool]:
+    """Try to become the only runner of job ``name``; yields whether the lock was taken.
+
+    PostgreSQL: a session-level ``pg_try_advisory_lock`` held on a dedicated
+    connection, so it spans every uvicorn worker and survives the job's own
+    commits. Other dialects (SQLite in development): a per-process lock.
+    """
+    if engine.dialect.name == "postgresql":
+        key = zlib.crc32(name.encode("utf-8"))
+        with engine.connect() as conn:
+            acquired = bool(conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar())
+            conn.commit()  # khoá theo session vẫn giữ; không để connection "idle in transaction"
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                    conn.commit()
+        return
+    with _local_locks_guard:
+        lock = _local_locks.setdefault(name, threading.Lock())
+    acquired = lock.acquire(blocking=False)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            lock.release()
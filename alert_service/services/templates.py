@@ -0,0 +1,158 @@
+"""Localized alert message templates.
+
+``config/alert_messages.yaml`` maps a template id to a title/message per
+language. Every text is checked when the file is loaded, so a field the
+renderer cannot reproduce exactly is rejected up front. A template is compiled
+(split into literal and field pieces) the first time it is needed in a given
+language and kept, so adding languages costs nothing until they are actually
+requested. Rendered results are
+memoized by (template id, params, language): alerts share a handful of
+templates and small integer params, so most reads are cache hits.
+"""
+import os
+import string
+import threading
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+import yaml
+
+
+_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALERT_MESSAGES_PATH = os.getenv("ALERT_MESSAGES_PATH", os.path.join(_SERVICE_DIR, "config", "alert_messages.yaml"))
+ALERT_DEFAULT_LANGUAGE = os.getenv("ALERT_DEFAULT_LANGUAGE", "vi")
+ALERT_TEMPLATE_CACHE_SIZE = int(os.getenv("ALERT_TEMPLATE_CACHE_SIZE", "4096"))
+
+# Cùng danh sách ngôn ngữ với Preferences.language của profile_service
+SUPPORTED_LANGUAGES = ("vi", "en", "zh")
+
+ParamsKey = Tuple[Tuple[str, Any], ...]
+
+
+_CONVERSIONS = {"s": str, "r": repr, "a": ascii}
+
+
+class CompiledTemplate:
+    """A template pre-split into ``(literal, field, conversion, format_spec)`` pieces.
+
+    Renders like ``str.format_map`` (``!s``/``!r``/``!a`` then ``format(value, spec)``),
+    except that a missing or ``None`` param renders as an empty string. Field
+    forms that cannot be reproduced from a flat params dict (``{a.b}``,
+    ``{a[0]}``, ``{}``, nested ``{x:{width}}``) raise ``ValueError``.
+    """
+
+    __slots__ = ("pieces", "fields")
+
+    def __init__(self, text: str):
+        pieces = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if field is not None:
+                if not field.isidentifier():
+                    raise ValueError(f"Unsupported template field '{{{field}}}'")
+                if conversion is not None and conversion not in _CONVERSIONS:
+                    raise ValueError(f"Unknown conversion '!{conversion}' in field '{field}'")
+                if "{" in spec or "}" in spec:
+                    raise ValueError(f"Nested format spec in field '{field}' is not supported")
+            pieces.append((literal, field, conversion, spec))
+        self.pieces = tuple(pieces)
+        self.fields: FrozenSet[str] = frozenset(f for _, f, _, _ in self.pieces if f)
+
+    def render(self, params: Dict[str, Any]) -> str:
+        out = []
+        for literal, field, conversion, spec in self.pieces:
+            out.append(literal)
+            if field:
+                value = params.get(field)
+                if value is None:
+                    continue
+                if conversion is not None:
+                    value = _CONVERSIONS[conversion](value)
+                out.append(format(value, spec))
+        return "".join(out)
+
+
+class MessageCatalog:
+    def __init__(self, path: str = ALERT_MESSAGES_PATH, default_language: str = ALERT_DEFAULT_LANGUAGE):
+        self.path = path
+        self.default_language = default_language
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._raw: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self._compiled: Dict[Tuple[str, str], Tuple[CompiledTemplate, CompiledTemplate]] = {}
+        self._render_cached = lru_cache(maxsize=ALERT_TEMPLATE_CACHE_SIZE)(self._render)
+        self.reload()
+
+    def reload(self) -> bool:
+        """Re-read the file if it changed. Returns True if templates were replaced."""
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return False
+            with open(self.path, encoding="utf-8") as f:
+                raw = yaml.safe_load(f) or {}
+            for template_id, langs in raw.items():
+                if not isinstance(langs, dict) or self.default_language not in langs:
+                    raise ValueError(f"Template '{template_id}' has no '{self.default_language}' text")
+                for lang, texts in langs.items():
+                    for key in ("title", "message"):
+                        try:
+                            CompiledTemplate(texts[key])
+                        except (KeyError, TypeError, ValueError) as e:
+                            raise ValueError(f"Template '{template_id}' ({lang}.{key}) is invalid: {e}") from e
+            self._raw = raw
+            self._compiled = {}
+            self._render_cached.cache_clear()
+            self._mtime = mtime
+            return True
+
+    def __contains__(self, template_id: str) -> bool:
+        return template_id in self._raw
+
+    def fields(self, template_id: str) -> FrozenSet[str]:
+        """Every field referenced by the template in any language."""
+        fields: FrozenSet[str] = frozenset()
+        for lang in self._raw[template_id]:
+            title, message = self._get(template_id, lang)
+            fields |= title.fields | message.fields
+        return fields
+
+    def _get(self, template_id: str, language: str) -> Tuple[CompiledTemplate, CompiledTemplate]:
+        key = (template_id, language)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            texts = self._raw[template_id].get(language) or self._raw[template_id][self.default_language]
+            compiled = (CompiledTemplate(texts["title"]), CompiledTemplate(texts["message"]))
+            self._compiled[key] = compiled
+        return compiled
+
+    def _render(self, template_id: str, params: ParamsKey, language: str) -> Tuple[str, str]:
+        title, message = self._get(template_id, language)
+        values = dict(params)
+        return title.render(values), message.render(values)
+
+    def render(self, template_id: str, params: Optional[Dict[str, Any]], language: Optional[str] = None) -> Tuple[str, str]:
+        key = tuple(sorted((params or {}).items()))
+        return self._render_cached(template_id, key, language or self.default_language)
+
+
+def pick_language(lang: Optional[str], accept_language: Optional[str] = None) -> Optional[str]:
+    """Explicit ``lang`` wins; otherwise the first supported Accept-Language entry."""
+    if lang in SUPPORTED_LANGUAGES:
+        return lang
+    for part in (accept_language or "").split(","):
+        code = part.split(";")[0].strip().lower()[:2]
+        if code in SUPPORTED_LANGUAGES:
+            return code
+    return None
+
+
+def localize(alert: Dict[str, Any], language: Optional[str]) -> Dict[str, Any]:
+    """Return ``alert`` with title/message rendered in ``language`` (if it has a template)."""
+    template_id = alert.get("template_id")
+    if not language or language == message_catalog.default_language or template_id not in message_catalog:
+        return alert
+    title, message = message_catalog.render(template_id, alert.get("params"), language)
+    return dict(alert, title=title, message=message)
+
+
+message_catalog = MessageCatalog()
@@ -0,0 +1,94 @@
+"""Per-user unread alert counters.
+
+``alert_unread_counters`` is adjusted inside the same transaction that inserts
+alerts or marks them read, so the badge count never needs ``COUNT(*)`` over
+``alerts``. Reads go through a short-lived in-process cache; writers call
+``invalidate`` after commit so this worker sees its own changes immediately,
+other workers within ``ALERT_UNREAD_CACHE_SECONDS``.
+"""
+import datetime
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import DateTime, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from models.alert import Alert, AlertUnreadCounter
+from services.sql import dialect_insert
+
+
+ALERT_UNREAD_CACHE_SECONDS = float(os.getenv("ALERT_UNREAD_CACHE_SECONDS", "5"))
+
+_cache: Dict[str, Tuple[int, float]] = {}
+_cache_lock = threading.Lock()
+
+
+def adjust(db: Session, deltas: Dict[str, int]) -> None:
+    """Add ``deltas[user_id]`` to each user's counter. Does not commit."""
+    deltas = {u: d for u, d in deltas.items() if d}
+    if not deltas:
+        return
+    now = datetime.datetime.utcnow()
+    upsert = dialect_insert(db)
+    table = AlertUnreadCounter.__table__
+    for user_id, delta in deltas.items():
+        if upsert is not None:
+            stmt = upsert(table).values(user_id=user_id, unread_count=max(delta, 0), updated_at=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.user_id],
+                set_={"unread_count": table.c.unread_count + delta, "updated_at": now},
+            )
+            db.execute(stmt)
+        else:
+            row = db.get(AlertUnreadCounter, user_id, with_for_update=True)
+            if row is None:
+                db.add(AlertUnreadCounter(user_id=user_id, unread_count=max(delta, 0), updated_at=now))
+            else:
+                row.unread_count = row.unread_count + delta
+                row.updated_at = now
+
+
+def invalidate(user_ids: Optional[Iterable[str]] = None) -> None:
+    with _cache_lock:
+        if user_ids is None:
+            _cache.clear()
+        else:
+            for user_id in user_ids:
+                _cache.pop(user_id, None)
+
+
+def get_unread_count(db: Session, user_id: str) -> int:
+    now = time.monotonic()
+    hit = _cache.get(user_id)
+    if hit is not None and hit[1] > now:
+        return hit[0]
+    count = db.execute(
+        select(AlertUnreadCounter.unread_count).where(AlertUnreadCounter.user_id == user_id)
+    ).scalar()
+    count = max(count or 0, 0)
+    with _cache_lock:
+        _cache[user_id] = (count, now + ALERT_UNREAD_CACHE_SECONDS)
+    return count
+
+
+def rebuild_counters(db: Session, user_id: Optional[str] = None) -> int:
+    """Recompute counters from ``alerts`` (one grouped query). Returns rows written."""
+    now = datetime.datetime.utcnow()
+    source = (
+        select(Alert.user_id, func.count().label("unread_count"), literal(now, DateTime).label("updated_at"))
+        .where(Alert.is_read.is_(False))
+        .group_by(Alert.user_id)
+    )
+    clear = delete(AlertUnreadCounter)
+    if user_id is not None:
+        source = source.where(Alert.user_id == user_id)
+        clear = clear.where(AlertUnreadCounter.user_id == user_id)
+    db.execute(clear)
+    result = db.execute(
+        insert(AlertUnreadCounter).from_select(["user_id", "unread_count", "updated_at"], source)
+    )
+    db.commit()
+    invalidate([user_id] if user_id is not None else None)
+    return result.rowcount
@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from routers.scores import router as scores_router
+from services import alert_client
 
 
 app = FastAPI(
@@ -18,6 +19,12 @@ app = FastAPI(
 app.include_router(scores_router, prefix="/api/v1")
 
 
+@app.on_event("shutdown")
+async def drain_alert_notifications() -> None:
+    # Gửi nốt các sự kiện điểm đang chờ sang alert_service trước khi tắt
+    await alert_client.drain()
+
+
 @app.get("/")
 def root() -> dict:
     return {"status": "ok", "service": "score_service"}
@@ -1,9 +1,91 @@
+"""Deliver score updates to alert_service ``POST /api/v1/alerts/events``.
+
+alert_service answers 429 (or 503) with ``Retry-After`` when its ingestion
+queue is full. Delivery therefore runs in a background task so the score
+request never waits on it: an event is retried with exponential backoff
+(honoring ``Retry-After``) up to ``ALERT_NOTIFY_MAX_ATTEMPTS`` times, and is
+logged when it is finally dropped. At most ``ALERT_NOTIFY_MAX_PENDING``
+deliveries are kept in flight per worker; beyond that new events are dropped
+(and logged) instead of piling up in memory.
+"""
+import asyncio
+import datetime
+import email.utils
+import logging
 import os
-from typing import Optional
+import random
+from typing import Any, Dict, Optional, Set
+
 import httpx
 
 
 ALERT_SERVICE_URL = os.getenv("ALERT_SERVICE_URL", "http://localhost:8004")
+ALERT_NOTIFY_TIMEOUT_SECONDS = float(os.getenv("ALERT_NOTIFY_TIMEOUT_SECONDS", "3"))
+ALERT_NOTIFY_MAX_ATTEMPTS = int(os.getenv("ALERT_NOTIFY_MAX_ATTEMPTS", "6"))
+ALERT_NOTIFY_BACKOFF_SECONDS = float(os.getenv("ALERT_NOTIFY_BACKOFF_SECONDS", "0.5"))
+ALERT_NOTIFY_MAX_BACKOFF_SECONDS = float(os.getenv("ALERT_NOTIFY_MAX_BACKOFF_SECONDS", "30"))
+ALERT_NOTIFY_MAX_PENDING = int(os.getenv("ALERT_NOTIFY_MAX_PENDING", "1000"))
+
+# Hàng đợi bên alert_service đầy / tạm không phục vụ được: thử lại sau
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+logger = logging.getLogger(__name__)
+
+_pending: Set[asyncio.Task] = set()
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    """Seconds from a ``Retry-After`` header (delta-seconds or HTTP-date), if any."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+
+def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+    if retry_after is not None:
+        return min(retry_after, ALERT_NOTIFY_MAX_BACKOFF_SECONDS)
+    delay = min(ALERT_NOTIFY_BACKOFF_SECONDS * 2 ** attempt, ALERT_NOTIFY_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.5, 1.0)  # jitter: các worker không dồn lại cùng một lúc
+
+
+async def deliver(payload: Dict[str, Any]) -> bool:
+    """POST one event, retrying transient failures. Returns False if the event was dropped."""
+    url = f"{ALERT_SERVICE_URL}/api/v1/alerts/events"
+    reason = "no attempt made"
+    async with httpx.AsyncClient(timeout=ALERT_NOTIFY_TIMEOUT_SECONDS) as client:
+        for attempt in range(ALERT_NOTIFY_MAX_ATTEMPTS):
+            retry_after = None
+            try:
+                resp = await client.post(url, json=payload)
+            except httpx.TransportError as e:
+                reason = f"{type(e).__name__}: {e}"
+            else:
+                if resp.status_code < 400:
+                    return True
+                reason = f"HTTP {resp.status_code}"
+                if resp.status_code not in RETRY_STATUSES:
+                    break  # payload bị từ chối: thử lại cũng vô ích
+                retry_after = _retry_after(resp)
+            if attempt + 1 < ALERT_NOTIFY_MAX_ATTEMPTS:
+                await asyncio.sleep(_backoff(attempt, retry_after))
+    logger.warning(
+        "Dropping score event for user %s after %d attempt(s): %s",
+        payload.get("user_id"),
+        attempt + 1,
+        reason,
+    )
+    return False
 
 
 async def notify_score_updated(
@@ -15,7 +97,6 @@ async def notify_score_updated(
     model_version: Optional[str],
     calculated_at: str,
 ) -> None:
-    url = f"{ALERT_SERVICE_URL}/alerts/on-score-updated"
     payload = {
         "user_id": user_id,
         "old_score": old_score,
@@ -24,11 +105,21 @@ async def notify_score_updated(
         "model_version": model_version,
         "calculated_at": calculated_at,
     }
-    try:
-        async with httpx.AsyncClient(timeout=3.0) as client:
-            await client.post(url, json=payload)
-    except Exception:
-        # Không làm fail flow chính nếu alert service lỗi
-        pass
+    if len(_pending) >= ALERT_NOTIFY_MAX_PENDING:
+        logger.warning("Dropping score event for user %s: %d deliveries already pending", user_id, len(_pending))
+        return
+    # Không làm chậm/fail flow chính nếu alert service lỗi hoặc đang đầy
+    task = asyncio.create_task(deliver(payload))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
 
 
+async def drain(timeout: float = ALERT_NOTIFY_TIMEOUT_SECONDS) -> None:
+    """Wait (bounded) for pending deliveries at shutdown; whatever is left is logged and cancelled."""
+    if not _pending:
+        return
+    done, still_pending = await asyncio.wait(set(_pending), timeout=timeout)
+    for task in still_pending:
+        task.cancel()
+    if still_pending:
+        logger.warning("Dropping %d undelivered score event(s) at shutdown", len(still_pending))
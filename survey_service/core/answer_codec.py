@@ -0,0 +1,213 @@
+"""Compact storage for choice answers.
+
+Choice answers are stored against an immutable, versioned option list
+(``survey_option_sets``) instead of repeating the option text in every row:
+
+- ``single_choice``: ``answer_code`` = index of the option, ``answer`` = NULL;
+- ``multiple_choice``: ``answer_code`` = bitmask of the chosen indices when the
+  set has at most ``BITMASK_MAX_OPTIONS`` options, otherwise ``answer`` = JSON
+  list of indices. Decoded lists come back in option order, without duplicates.
+
+``option_set_id`` on the answer row names the set used for encoding, so rows
+stay decodable after the question's options change (a change adds a new set;
+``SurveyQuestion.option_set_id`` points at the current one). Answers that are
+not one of the options (legacy data, optional questions left empty) are kept
+as raw JSON with ``option_set_id`` NULL.
+
+Option sets never change once written, so they are cached per process forever.
+"""
+import datetime
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import survey as models
+
+
+BITMASK_MAX_OPTIONS = 63  # bit 0..62: luôn vừa BIGINT có dấu
+CHOICE_TYPES = ("single_choice", "multiple_choice")
+ENCODE_BATCH_SIZE = 5000
+
+
+class StoredAnswer(NamedTuple):
+    """The three answer columns of a ``survey_answers`` row."""
+
+    answer: Any
+    option_set_id: Optional[int] = None
+    answer_code: Optional[int] = None
+
+
+class OptionSet:
+    __slots__ = ("id", "question_id", "options", "index")
+
+    def __init__(self, id: int, question_id: int, options: Iterable[str]):
+        self.id = id
+        self.question_id = question_id
+        self.options = tuple(options)
+        self.index: Dict[str, int] = {}
+        for i, opt in enumerate(self.options):
+            self.index.setdefault(opt, i)
+
+
+_sets: Dict[int, OptionSet] = {}
+_lock = threading.Lock()
+
+
+def get_sets(db: Session, set_ids: Iterable[Optional[int]]) -> Dict[int, OptionSet]:
+    """Option sets by id; only ids never seen by this process hit the DB."""
+    wanted = {sid for sid in set_ids if sid is not None}
+    missing = [sid for sid in wanted if sid not in _sets]
+    if missing:
+        s = models.SurveyOptionSet
+        rows = db.execute(select(s.id, s.question_id, s.options).where(s.id.in_(missing))).all()
+        with _lock:
+            for sid, qid, options in rows:
+                _sets[sid] = OptionSet(sid, qid, options)
+    return {sid: _sets[sid] for sid in wanted if sid in _sets}
+
+
+# ---- encode / decode ---------------------------------------------------------
+
+def encode(question_type: str, option_set: Optional[OptionSet], answer: Any) -> StoredAnswer:
+    if option_set is None or question_type not in CHOICE_TYPES:
+        return StoredAnswer(answer)
+    index = option_set.index
+    if question_type == "single_choice":
+        i = index.get(answer) if isinstance(answer, str) else None
+        return StoredAnswer(answer) if i is None else StoredAnswer(None, option_set.id, i)
+    if not isinstance(answer, list):
+        return StoredAnswer(answer)
+    indices = set()
+    for a in answer:
+        i = index.get(a) if isinstance(a, str) else None
+        if i is None:
+            return StoredAnswer(answer)
+        indices.add(i)
+    if len(option_set.options) <= BITMASK_MAX_OPTIONS:
+        mask = 0
+        for i in indices:
+            mask |= 1 << i
+        return StoredAnswer(None, option_set.id, mask)
+    return StoredAnswer(sorted(indices), option_set.id)
+
+
+def option_indices(question_type: str, stored: StoredAnswer) -> List[int]:
+    """Chosen option indices of an encoded answer (empty for raw answers)."""
+    if stored.option_set_id is None:
+        return []
+    code = stored.answer_code
+    if code is None:
+        return list(stored.answer or ())
+    if question_type == "single_choice":
+        return [code]
+    return [i for i in range(BITMASK_MAX_OPTIONS) if code >> i & 1]
+
+
+def decode(question_type: str, stored: StoredAnswer, option_set: Optional[OptionSet]) -> Any:
+    if stored.option_set_id is None:
+        return stored.answer
+    if option_set is None:
+        raise LookupError(f"Option set {stored.option_set_id} not found")
+    options = option_set.options
+    indices = option_indices(question_type, stored)
+    if question_type == "single_choice":
+        return options[indices[0]]
+    return [options[i] for i in indices]
+
+
+class Decoder:
+    """Decode rows read in bulk; option sets are fetched on first use."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def __call__(self, question_type: str, answer: Any, option_set_id: Optional[int], answer_code: Optional[int]) -> Any:
+        if option_set_id is None:
+            return answer
+        option_set = _sets.get(option_set_id) or get_sets(self.db, [option_set_id]).get(option_set_id)
+        return decode(question_type, StoredAnswer(answer, option_set_id, answer_code), option_set)
+
+
+# ---- option set maintenance / migration --------------------------------------
+
+def ensure_option_sets(db: Session) -> int:
+    """Add an option set for every choice question whose options have no current set. Does not commit.
+
+    Called by every writer of ``survey_questions.options`` (create, import, sync)
+    in the same transaction. Returns the number of sets created.
+    """
+    q, s = models.SurveyQuestion, models.SurveyOptionSet
+    rows = db.execute(
+        select(q.id, q.options, q.option_set_id, s.options)
+        .outerjoin(s, s.id == q.option_set_id)
+        .where(q.question_type.in_(CHOICE_TYPES))
+    ).all()
+    now = datetime.datetime.utcnow()
+    new_sets = [
+        {"question_id": qid, "options": list(options), "created_at": now}
+        for qid, options, set_id, current in rows
+        if options is not None and (set_id is None or current != options)
+    ]
+    if not new_sets:
+        return 0
+    table = s.__table__
+    created = db.execute(insert(table).returning(table.c.id, table.c.question_id), new_sets).all()
+    db.connection().execute(
+        update(q.__table__)
+        .where(q.__table__.c.id == bindparam("_id"))
+        .values(option_set_id=bindparam("_option_set_id")),
+        [{"_id": qid, "_option_set_id": sid} for sid, qid in created],
+    )
+    return len(created)
+
+
+def encode_existing(db: Session, batch_size: int = ENCODE_BATCH_SIZE) -> Dict[str, int]:
+    """Encode raw choice answers against their question's current option set, committing per batch."""
+    created = ensure_option_sets(db)
+    db.commit()
+    a, q = models.SurveyAnswer, models.SurveyQuestion
+    questions = {
+        qid: (qtype, set_id)
+        for qid, qtype, set_id in db.execute(
+            select(q.id, q.question_type, q.option_set_id).where(q.question_type.in_(CHOICE_TYPES))
+        )
+    }
+    sets = get_sets(db, [set_id for _, set_id in questions.values()])
+    table = a.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(answer=bindparam("_answer"), option_set_id=bindparam("_option_set_id"), answer_code=bindparam("_answer_code"))
+    )
+    report = {"option_sets": created, "encoded": 0, "skipped": 0}
+    last_id = 0
+    while True:
+        # Phân trang theo id: dòng không mã hoá được vẫn giữ option_set_id NULL nhưng không bị đọc lại
+        rows = db.execute(
+            select(a.id, a.question_id, a.answer)
+            .join(q, q.id == a.question_id)
+            .where(a.id > last_id, a.option_set_id.is_(None), q.question_type.in_(CHOICE_TYPES))
+            .order_by(a.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        params = []
+        for answer_id, qid, answer in rows:
+            qtype, set_id = questions[qid]
+            stored = encode(qtype, sets.get(set_id), answer)
+            if stored.option_set_id is None:
+                report["skipped"] += 1
+                continue
+            params.append(
+                {"_id": answer_id, "_answer": stored.answer, "_option_set_id": stored.option_set_id,
+                 "_answer_code": stored.answer_code}
+            )
+        if params:
+            db.connection().execute(stmt, params)
+            report["encoded"] += len(params)
+        db.commit()
+    return report
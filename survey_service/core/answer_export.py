@@ -0,0 +1,275 @@
+"""Streaming export of survey answers joined with question metadata.
+
+Rows are read through a server-side cursor (``stream_results`` + ``yield_per``)
+in a session owned by the generator, and encoded chunk by chunk, so memory
+stays flat regardless of table size.
+
+Layouts:
+- ``long``: one row per answer (user, question metadata, answer, submitted_at);
+- ``wide``: one row per user, one ``q_<question_id>`` column per question.
+
+Formats: ``csv``, ``ndjson`` and ``parquet`` (needs the optional ``pyarrow``
+package; one row group per chunk). Non-scalar answers are JSON-encoded in
+CSV/Parquet cells.
+
+``since``/``until`` filter on ``survey_answers.submitted_at`` (long) or on the
+user's ``survey_submissions.last_answered_at`` (wide, so a changed user is
+re-exported in full), which makes incremental pulls possible. Encoded choice
+answers are decoded back to option text (``core.answer_codec``).
+"""
+import csv
+import datetime
+import io
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import survey as models
+from core import answer_codec
+
+
+SURVEY_EXPORT_CHUNK_SIZE = int(os.getenv("SURVEY_EXPORT_CHUNK_SIZE", "2000"))
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+LAYOUTS = ("long", "wide")
+
+LONG_COLUMNS = [
+    "user_id",
+    "question_id",
+    "question_group",
+    "question_order",
+    "question_version",
+    "question_type",
+    "question_text",
+    "answer",
+    "submitted_at",
+]
+
+
+class ExportError(ValueError):
+    """Invalid export request (unknown format/layout, missing optional dependency)."""
+
+
+def check_format(fmt: str, layout: str) -> None:
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}'. Use one of: " + ", ".join(FORMATS))
+    if layout not in LAYOUTS:
+        raise ExportError(f"Unknown layout '{layout}'. Use one of: " + ", ".join(LAYOUTS))
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export requires the optional 'pyarrow' package")
+
+
+# ---- row sources -----------------------------------------------------------
+
+def _question_filter(stmt, groups: Optional[Sequence[str]]):
+    if groups:
+        stmt = stmt.where(models.SurveyQuestion.question_group.in_(list(groups)))
+    return stmt
+
+
+def _long_rows(db: Session, since, until, groups, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    a, q = models.SurveyAnswer, models.SurveyQuestion
+    stmt = (
+        select(
+            a.user_id,
+            a.question_id,
+            q.question_group,
+            q.order,
+            q.version,
+            q.question_type,
+            q.question_text,
+            a.answer,
+            a.submitted_at,
+            a.option_set_id,
+            a.answer_code,
+        )
+        .join(q, q.id == a.question_id)
+        .order_by(a.id)
+    )
+    if since is not None:
+        stmt = stmt.where(a.submitted_at >= since)
+    if until is not None:
+        stmt = stmt.where(a.submitted_at < until)
+    stmt = _question_filter(stmt, groups)
+    decode = answer_codec.Decoder(db)
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    for *row, option_set_id, answer_code in result:
+        out = dict(zip(LONG_COLUMNS, row))
+        out["answer"] = decode(out["question_type"], out["answer"], option_set_id, answer_code)
+        yield out
+
+
+def wide_columns(db: Session, groups) -> List[int]:
+    q = models.SurveyQuestion
+    stmt = _question_filter(select(q.id).order_by(q.order, q.id), groups)
+    return list(db.execute(stmt).scalars())
+
+
+def _wide_rows(db: Session, since, until, groups, question_ids: List[int], chunk_size: int) -> Iterator[Dict[str, Any]]:
+    a, q, s = models.SurveyAnswer, models.SurveyQuestion, models.SurveySubmission
+    stmt = (
+        select(a.user_id, a.question_id, a.answer, a.option_set_id, a.answer_code, q.question_type, s.last_answered_at)
+        .join(s, s.user_id == a.user_id)
+        .join(q, q.id == a.question_id)
+        .order_by(a.user_id)
+    )
+    if since is not None:
+        stmt = stmt.where(s.last_answered_at >= since)
+    if until is not None:
+        stmt = stmt.where(s.last_answered_at < until)
+    stmt = _question_filter(stmt, groups)
+    empty = {f"q_{qid}": None for qid in question_ids}
+    current: Optional[Dict[str, Any]] = None
+    decode = answer_codec.Decoder(db)
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    for user_id, question_id, answer, option_set_id, answer_code, question_type, last_answered_at in result:
+        if current is None or current["user_id"] != user_id:
+            if current is not None:
+                yield current
+            current = {"user_id": user_id, "last_answered_at": last_answered_at, **empty}
+        key = f"q_{question_id}"
+        if key in current:
+            current[key] = decode(question_type, answer, option_set_id, answer_code)
+    if current is not None:
+        yield current
+
+
+# ---- encoders --------------------------------------------------------------
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _chunks(rows: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _encode_csv(columns: List[str], rows, size: int) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")  # BOM để Excel đọc đúng tiếng Việt
+    for chunk in _chunks(rows, size):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows([_cell(r[c]) for c in columns] for r in chunk)
+        yield buf.getvalue().encode("utf-8")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _encode_ndjson(columns: List[str], rows, size: int) -> Iterator[bytes]:
+    for chunk in _chunks(rows, size):
+        yield "".join(
+            json.dumps({c: r[c] for c in columns}, ensure_ascii=False, default=_json_default) + "\n" for r in chunk
+        ).encode("utf-8")
+
+
+class _DrainSink:
+    """Write-only file object for ParquetWriter whose bytes can be taken after each row group."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _encode_parquet(columns: List[str], rows, size: int) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    time_columns = {"submitted_at", "last_answered_at"}
+    int_columns = {"question_id", "question_order", "question_version"}
+    schema = pa.schema(
+        [
+            (c, pa.timestamp("us") if c in time_columns else pa.int64() if c in int_columns else pa.string())
+            for c in columns
+        ]
+    )
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    for chunk in _chunks(rows, size):
+        data = {}
+        for c in columns:
+            values = [r[c] for r in chunk]
+            if c not in time_columns and c not in int_columns:
+                values = [None if v is None else v if isinstance(v, str) else json.dumps(v, ensure_ascii=False)
+                          for v in values]
+            data[c] = values
+        writer.write_table(pa.Table.from_pydict(data, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+_ENCODERS = {"csv": _encode_csv, "ndjson": _encode_ndjson, "parquet": _encode_parquet}
+
+
+def stream_export(
+    session_factory: Callable[[], Session],
+    fmt: str = "csv",
+    layout: str = "long",
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    groups: Optional[Sequence[str]] = None,
+    chunk_size: int = SURVEY_EXPORT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Yield the encoded export. Opens (and closes) its own session."""
+    check_format(fmt, layout)
+    db = session_factory()
+    try:
+        if layout == "long":
+            columns = LONG_COLUMNS
+            rows = _long_rows(db, since, until, groups, chunk_size)
+        else:
+            question_ids = wide_columns(db, groups)
+            columns = ["user_id", "last_answered_at"] + [f"q_{qid}" for qid in question_ids]
+            rows = _wide_rows(db, since, until, groups, question_ids, chunk_size)
+        yield from _ENCODERS[fmt](columns, rows, chunk_size)
+    finally:
+        db.close()
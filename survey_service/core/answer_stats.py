@@ -0,0 +1,334 @@
+"""Per-question answer statistics, maintained incrementally.
+
+``survey_question_stats`` keeps answer count plus numeric count / sum /
+sum of squares / min / max per question, and ``survey_option_index_counts``
+keeps one counter per (question, option set, option index) - the integer form
+choice answers are stored in (see ``core.answer_codec``); option text is only
+looked up when stats are read. Answer writers call ``apply_changes`` inside
+their transaction with the old and new stored answer of every row they touch; the
+deltas are aggregated per key and applied with one executemany
+``INSERT ... ON CONFLICT DO UPDATE`` per table, so the stats endpoint only reads
+O(options) rows.
+
+min/max cannot be decremented: when an answer changes they stay the bounds of
+every value seen since the last ``rebuild``. ``rebuild`` recomputes everything
+in the database: choice counts from ``answer_code`` (index or bitmask bits),
+numbers and large-set index lists with SQL JSON functions
+(``json_array_elements_text`` on PostgreSQL, ``json_each`` on SQLite). Other
+dialects replay every answer through ``apply_changes`` in Python.
+
+A number answer counts as numeric when it is a JSON number or a string matching
+``core.validation.NUMBER_PATTERN``, in answer validation, the incremental path
+and every rebuild alike (``core.validation.parse_number``).
+"""
+import datetime
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, select, text
+from sqlalchemy.orm import Session
+
+from models import survey as models
+from core import answer_codec
+from core.answer_codec import StoredAnswer
+from core.sql import dialect_insert
+from core.validation import NUMBER_PATTERN, parse_number
+
+
+NO_ANSWER = object()  # câu hỏi chưa có câu trả lời trước đó
+
+REBUILD_BATCH_SIZE = 5000
+
+CHOICE_TYPES = ("single_choice", "multiple_choice")
+
+Change = Tuple[int, str, Any, StoredAnswer]  # (question_id, question_type, old StoredAnswer | NO_ANSWER, new StoredAnswer)
+
+
+def _options(question_type: str, stored: StoredAnswer) -> List[Tuple[int, int]]:
+    # (option_set_id, option_index) của các đáp án đã chọn; câu trả lời chưa mã hoá không được đếm
+    return [(stored.option_set_id, i) for i in answer_codec.option_indices(question_type, stored)]
+
+
+class _QuestionDelta:
+    __slots__ = ("answer_count", "numeric_count", "numeric_sum", "numeric_sum_sq", "numeric_min", "numeric_max")
+
+    def __init__(self):
+        self.answer_count = 0
+        self.numeric_count = 0
+        self.numeric_sum = 0.0
+        self.numeric_sum_sq = 0.0
+        self.numeric_min: Optional[float] = None
+        self.numeric_max: Optional[float] = None
+
+    def add(self, question_type: str, answer: Any, sign: int) -> None:
+        self.answer_count += sign
+        if question_type != "number":
+            return
+        val = parse_number(answer)
+        if val is None:
+            return
+        self.numeric_count += sign
+        self.numeric_sum += sign * val
+        self.numeric_sum_sq += sign * val * val
+        if sign > 0:
+            self.numeric_min = val if self.numeric_min is None else min(self.numeric_min, val)
+            self.numeric_max = val if self.numeric_max is None else max(self.numeric_max, val)
+
+    def is_empty(self) -> bool:
+        return not (self.answer_count or self.numeric_count or self.numeric_sum or self.numeric_sum_sq
+                    or self.numeric_min is not None)
+
+
+def apply_changes(db: Session, changes: Iterable[Change]) -> None:
+    """Apply the stat deltas for a batch of answer writes. Does not commit."""
+    questions: Dict[int, _QuestionDelta] = defaultdict(_QuestionDelta)
+    options: Dict[Tuple[int, int, int], int] = defaultdict(int)
+    for question_id, question_type, old, new in changes:
+        if old is not NO_ANSWER:
+            if old == new:
+                continue
+            questions[question_id].add(question_type, old.answer, -1)
+            for set_id, index in _options(question_type, old):
+                options[(question_id, set_id, index)] -= 1
+        questions[question_id].add(question_type, new.answer, 1)
+        for set_id, index in _options(question_type, new):
+            options[(question_id, set_id, index)] += 1
+
+    now = datetime.datetime.utcnow()
+    stat_rows = [
+        {
+            "question_id": qid,
+            "answer_count": d.answer_count,
+            "numeric_count": d.numeric_count,
+            "numeric_sum": d.numeric_sum,
+            "numeric_sum_sq": d.numeric_sum_sq,
+            "numeric_min": d.numeric_min,
+            "numeric_max": d.numeric_max,
+            "updated_at": now,
+        }
+        for qid, d in questions.items()
+        if not d.is_empty()
+    ]
+    option_rows = [
+        {"question_id": qid, "option_set_id": set_id, "option_index": index, "count": n}
+        for (qid, set_id, index), n in options.items()
+        if n
+    ]
+
+    insert = dialect_insert(db)
+    if insert is None:
+        _apply_orm(db, stat_rows, option_rows)
+        return
+    if stat_rows:
+        t = models.SurveyQuestionStat.__table__
+        stmt = insert(t)
+        ex = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.question_id],
+            set_={
+                "answer_count": t.c.answer_count + ex.answer_count,
+                "numeric_count": t.c.numeric_count + ex.numeric_count,
+                "numeric_sum": t.c.numeric_sum + ex.numeric_sum,
+                "numeric_sum_sq": t.c.numeric_sum_sq + ex.numeric_sum_sq,
+                "numeric_min": case(
+                    (t.c.numeric_min.is_(None), ex.numeric_min),
+                    (ex.numeric_min < t.c.numeric_min, ex.numeric_min),
+                    else_=t.c.numeric_min,
+                ),
+                "numeric_max": case(
+                    (t.c.numeric_max.is_(None), ex.numeric_max),
+                    (ex.numeric_max > t.c.numeric_max, ex.numeric_max),
+                    else_=t.c.numeric_max,
+                ),
+                "updated_at": ex.updated_at,
+            },
+        )
+        db.execute(stmt, stat_rows)
+    if option_rows:
+        t = models.SurveyOptionCount.__table__
+        stmt = insert(t)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.question_id, t.c.option_set_id, t.c.option_index],
+            set_={"count": t.c.count + stmt.excluded.count},
+        )
+        db.execute(stmt, option_rows)
+
+
+def _apply_orm(db: Session, stat_rows: List[Dict[str, Any]], option_rows: List[Dict[str, Any]]) -> None:
+    # Dialect không hỗ trợ ON CONFLICT: khoá từng dòng rồi cộng dồn
+    for row in stat_rows:
+        stat = db.get(models.SurveyQuestionStat, row["question_id"], with_for_update=True)
+        if stat is None:
+            db.add(models.SurveyQuestionStat(**row))
+            continue
+        for key in ("answer_count", "numeric_count", "numeric_sum", "numeric_sum_sq"):
+            setattr(stat, key, getattr(stat, key) + row[key])
+        if row["numeric_min"] is not None:
+            stat.numeric_min = row["numeric_min"] if stat.numeric_min is None else min(stat.numeric_min, row["numeric_min"])
+            stat.numeric_max = row["numeric_max"] if stat.numeric_max is None else max(stat.numeric_max, row["numeric_max"])
+        stat.updated_at = row["updated_at"]
+    for row in option_rows:
+        key = (row["question_id"], row["option_set_id"], row["option_index"])
+        opt = db.get(models.SurveyOptionCount, key, with_for_update=True)
+        if opt is None:
+            db.add(models.SurveyOptionCount(**row))
+        else:
+            opt.count = opt.count + row["count"]
+
+
+def read_stats(db: Session, question_id: int, question_type: str) -> Dict[str, Any]:
+    """Stats payload for ``/admin/question-stats`` (same keys as before, plus numeric extras)."""
+    if question_type in CHOICE_TYPES:
+        c = models.SurveyOptionCount
+        rows = db.execute(
+            select(c.option_set_id, c.option_index, c.count)
+            .where(c.question_id == question_id, c.count > 0)
+            .order_by(c.option_set_id, c.option_index)
+        ).all()
+        # Cùng một text ở các phiên bản options khác nhau được cộng chung
+        sets = answer_codec.get_sets(db, {set_id for set_id, _, _ in rows})
+        counts: Dict[str, int] = defaultdict(int)
+        for set_id, index, n in rows:
+            option_set = sets.get(set_id)
+            if option_set is not None and index < len(option_set.options):
+                counts[option_set.options[index]] += n
+        return dict(counts)
+    stat = db.get(models.SurveyQuestionStat, question_id)
+    if question_type == "number":
+        n = stat.numeric_count if stat else 0
+        if not n:
+            return {"average": None, "count": 0}
+        mean = stat.numeric_sum / n
+        variance = max(stat.numeric_sum_sq / n - mean * mean, 0.0)
+        return {
+            "average": mean,
+            "count": n,
+            "min": stat.numeric_min,
+            "max": stat.numeric_max,
+            "stddev": math.sqrt(variance),
+        }
+    return {"count": stat.answer_count if stat else 0}
+
+
+# ---- rebuild -------------------------------------------------------------
+
+_REBUILD_SQL = {
+    "postgresql": {
+        "number": (
+            "CASE WHEN json_typeof(a.answer) = 'number' "
+            "OR (json_typeof(a.answer) = 'string' AND (a.answer #>> '{}') ~ '" + NUMBER_PATTERN + "') "
+            "THEN CAST(a.answer #>> '{}' AS DOUBLE PRECISION) END"
+        ),
+        "indices": "SELECT a.question_id, a.option_set_id, CAST(e.value AS INTEGER) AS option_index "
+        "FROM survey_answers a JOIN survey_questions q ON q.id = a.question_id "
+        "CROSS JOIN LATERAL json_array_elements_text(CASE WHEN json_typeof(a.answer) = 'array' "
+        "THEN a.answer ELSE CAST('[]' AS json) END) AS e(value) "
+        "WHERE q.question_type = 'multiple_choice' AND a.option_set_id IS NOT NULL AND a.answer_code IS NULL",
+    },
+    "sqlite": {
+        "number": (
+            # SQLite không có regex: chuỗi được kiểm tra bằng chính parse_number (đăng ký làm hàm SQL)
+            "CASE WHEN json_type(a.answer) IN ('integer', 'real') THEN json_extract(a.answer, '$') "
+            "WHEN json_type(a.answer) = 'text' THEN survey_numeric(json_extract(a.answer, '$')) END"
+        ),
+        "indices": "SELECT a.question_id, a.option_set_id, CAST(e.value AS INTEGER) AS option_index "
+        "FROM survey_answers a JOIN survey_questions q ON q.id = a.question_id, json_each(a.answer) AS e "
+        "WHERE q.question_type = 'multiple_choice' AND a.option_set_id IS NOT NULL AND a.answer_code IS NULL "
+        "AND json_type(a.answer) = 'array'",
+    },
+}
+
+# Đếm trực tiếp trên dạng số: index (single_choice) và từng bit của bitmask (multiple_choice)
+_SINGLE_SQL = (
+    "SELECT a.question_id, a.option_set_id, CAST(a.answer_code AS INTEGER) AS option_index "
+    "FROM survey_answers a JOIN survey_questions q ON q.id = a.question_id "
+    "WHERE q.question_type = 'single_choice' AND a.option_set_id IS NOT NULL AND a.answer_code IS NOT NULL"
+)
+_BITMASK_SQL = (
+    "SELECT a.question_id, a.option_set_id, b.n AS option_index "
+    "FROM survey_answers a JOIN survey_questions q ON q.id = a.question_id "
+    "JOIN (WITH RECURSIVE bits(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM bits WHERE n < "
+    f"{answer_codec.BITMASK_MAX_OPTIONS - 1}) SELECT n FROM bits) AS b ON ((a.answer_code >> b.n) & 1) = 1 "
+    "WHERE q.question_type = 'multiple_choice' AND a.option_set_id IS NOT NULL AND a.answer_code IS NOT NULL"
+)
+
+
+def rebuild(db: Session, question_id: Optional[int] = None) -> Dict[str, int]:
+    """Recompute stats from ``survey_answers`` (all questions or one) and commit."""
+    dialect = db.get_bind().dialect.name
+    sql = _REBUILD_SQL.get(dialect)
+    _delete_stats(db, question_id)
+    if sql is None:
+        return _rebuild_python(db, question_id)
+    if dialect == "sqlite":
+        db.connection().connection.driver_connection.create_function("survey_numeric", 1, parse_number, deterministic=True)
+    only = "AND a.question_id = :qid" if question_id is not None else ""
+    params = {"now": datetime.datetime.utcnow()}
+    if question_id is not None:
+        params["qid"] = question_id
+
+    stats = db.execute(
+        text(
+            "INSERT INTO survey_question_stats (question_id, answer_count, numeric_count, numeric_sum, "
+            "numeric_sum_sq, numeric_min, numeric_max, updated_at) "
+            "SELECT question_id, COUNT(*), COUNT(num), COALESCE(SUM(num), 0), COALESCE(SUM(num * num), 0), "
+            "MIN(num), MAX(num), :now FROM ("
+            f"SELECT a.question_id, CASE WHEN q.question_type = 'number' THEN {sql['number']} END AS num "
+            "FROM survey_answers a JOIN survey_questions q ON q.id = a.question_id "
+            f"WHERE 1 = 1 {only}"
+            ") AS s GROUP BY question_id"
+        ),
+        params,
+    ).rowcount
+    options = db.execute(
+        text(
+            "INSERT INTO survey_option_index_counts (question_id, option_set_id, option_index, count) "
+            "SELECT question_id, option_set_id, option_index, COUNT(*) FROM ("
+            f"{_SINGLE_SQL} {only} UNION ALL {_BITMASK_SQL} {only} UNION ALL {sql['indices']} {only}"
+            ") AS o GROUP BY question_id, option_set_id, option_index"
+        ),
+        params,
+    ).rowcount
+    db.commit()
+    return {"question_rows": stats, "option_rows": options}
+
+
+def _delete_stats(db: Session, question_id: Optional[int]) -> None:
+    for model in (models.SurveyQuestionStat, models.SurveyOptionCount):
+        stmt = delete(model)
+        if question_id is not None:
+            stmt = stmt.where(model.question_id == question_id)
+        db.execute(stmt)
+
+
+def _rebuild_python(db: Session, question_id: Optional[int]) -> Dict[str, int]:
+    # Dialect không có hàm JSON ở trên: đọc câu trả lời theo lô (keyset trên id) và cộng như câu mới
+    a, q = models.SurveyAnswer, models.SurveyQuestion
+    last_id = 0
+    while True:
+        stmt = (
+            select(a.id, a.question_id, q.question_type, a.answer, a.option_set_id, a.answer_code)
+            .join(q, q.id == a.question_id)
+            .where(a.id > last_id)
+            .order_by(a.id)
+            .limit(REBUILD_BATCH_SIZE)
+        )
+        if question_id is not None:
+            stmt = stmt.where(a.question_id == question_id)
+        rows = db.execute(stmt).all()
+        if not rows:
+            break
+        apply_changes(
+            db,
+            [(qid, qtype, NO_ANSWER, StoredAnswer(answer, set_id, code)) for _, qid, qtype, answer, set_id, code in rows],
+        )
+        last_id = rows[-1][0]
+    counts = {}
+    for key, model in (("question_rows", models.SurveyQuestionStat), ("option_rows", models.SurveyOptionCount)):
+        stmt = select(func.count()).select_from(model)
+        if question_id is not None:
+            stmt = stmt.where(model.question_id == question_id)
+        counts[key] = db.execute(stmt).scalar()
+    db.commit()
+    return counts
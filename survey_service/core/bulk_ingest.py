@@ -0,0 +1,192 @@
+"""Bulk multi-user answer ingestion over NDJSON.
+
+Input: one JSON object per line, ``{"user_id": "...", "answers": [{"question_id": 1, "answer": ...}, ...]}``.
+Lines are parsed as they arrive from the request body and grouped into batches
+of about ``SURVEY_INGEST_BATCH_ANSWERS`` answers. Each batch is validated
+against the cached compiled question catalog, then written in one transaction
+(multi-user upsert, incremental stats, submission rows) in a worker thread.
+After each batch one result line per input line is streamed back, followed by
+a final ``{"summary": {...}}`` line.
+
+Unlike ``POST /survey/submit`` there is no "already submitted" check: partners
+re-sending a user overwrite that user's answers.
+"""
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+from crud import crud
+from core import respondent_sketch
+from core.question_cache import question_cache
+from schemas import survey as schemas
+
+
+SURVEY_INGEST_BATCH_ANSWERS = int(os.getenv("SURVEY_INGEST_BATCH_ANSWERS", "5000"))
+SURVEY_INGEST_MAX_LINE_BYTES = int(os.getenv("SURVEY_INGEST_MAX_LINE_BYTES", str(1024 * 1024)))
+
+
+class NDJSONDuplexResponse(StreamingResponse):
+    """StreamingResponse that may keep reading the request body while it streams.
+
+    The stock response listens for ``http.disconnect`` on ``receive`` while
+    streaming, which would swallow the request body chunks we still need.
+    A client that goes away surfaces as ``ClientDisconnect`` from
+    ``request.stream()`` instead.
+    """
+
+    def __init__(self, content, **kwargs):
+        kwargs.setdefault("media_type", "application/x-ndjson")
+        super().__init__(content, **kwargs)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _result(line: int, user_id: Optional[str], status: str, **extra: Any) -> Dict[str, Any]:
+    return {"line": line, "user_id": user_id, "status": status, **extra}
+
+
+def parse_line(line_no: int, raw: bytes):
+    """Return (submission, None) or (None, error result)."""
+    try:
+        return schemas.BulkSubmissionIn.model_validate_json(raw), None
+    except ValidationError as e:
+        user_id = None
+        try:
+            user_id = json.loads(raw).get("user_id")
+        except (ValueError, AttributeError):
+            pass
+        errors = [f"{'.'.join(str(p) for p in err['loc']) or 'line'}: {err['msg']}" for err in e.errors()]
+        return None, _result(line_no, user_id if isinstance(user_id, str) else None, "invalid", errors=errors)
+
+
+def process_batch(session_factory: Callable[[], Session], items: List[tuple]) -> List[Dict[str, Any]]:
+    """Validate and write one batch of ``(line, BulkSubmissionIn)``. Returns result rows in input order."""
+    results: List[Dict[str, Any]] = []
+    db = session_factory()
+    try:
+        catalog = question_cache.get(db)
+        validators = catalog.validators
+        answers: Dict[tuple, Any] = {}
+        accepted: List[Dict[str, Any]] = []
+        for line, sub in items:
+            errors = []
+            for ans in sub.answers:
+                validator = validators.get(ans.question_id)
+                if validator is None:
+                    errors.append(f"Không tìm thấy câu hỏi với id {ans.question_id}")
+                    continue
+                ok, err = validator(ans.answer)
+                if not ok:
+                    errors.append(err)
+            if errors:
+                results.append(_result(line, sub.user_id, "invalid", errors=errors))
+                continue
+            for ans in sub.answers:
+                answers[(sub.user_id, ans.question_id)] = ans.answer
+            result = _result(line, sub.user_id, "ok", answers=len(sub.answers))
+            accepted.append(result)
+            results.append(result)
+        if answers:
+            try:
+                added = crud.upsert_answer_rows(db, answers)
+                crud.record_submissions(db, {r["user_id"]: added.get(r["user_id"], 0) for r in accepted}, catalog.total)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                for r in accepted:
+                    r["status"] = "error"
+                    r["errors"] = [f"{type(e).__name__}: {e}"]
+                    r.pop("answers", None)
+            else:
+                respondent_sketch.record(db, answers.keys())
+    finally:
+        db.close()
+    return results
+
+
+async def ingest(
+    body: AsyncIterator[bytes],
+    session_factory: Callable[[], Session],
+    batch_answers: int = SURVEY_INGEST_BATCH_ANSWERS,
+) -> AsyncIterator[bytes]:
+    """Consume an NDJSON byte stream and yield NDJSON result lines batch by batch."""
+    started = time.monotonic()
+    summary = {"lines": 0, "ok": 0, "invalid": 0, "error": 0, "answers": 0}
+    items: List[tuple] = []
+    pending_answers = 0
+    ready: List[Dict[str, Any]] = []  # lỗi parse, trả về cùng lô tiếp theo để giữ thứ tự gần đúng
+
+    def encode(rows: List[Dict[str, Any]]) -> bytes:
+        for r in rows:
+            summary[r["status"]] += 1
+            if r["status"] == "ok":
+                summary["answers"] += r["answers"]
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+
+    async def flush() -> bytes:
+        nonlocal items, pending_answers, ready
+        batch, items, pending_answers = items, [], 0
+        rows = ready
+        ready = []
+        if batch:
+            rows = rows + await run_in_threadpool(process_batch, session_factory, batch)
+            rows.sort(key=lambda r: r["line"])
+        return encode(rows)
+
+    buffer = b""
+    line_no = 0
+    discarding = False  # đang bỏ phần còn lại của một dòng quá dài (đã báo lỗi) tới "\n" kế tiếp
+
+    def take(raw: bytes):
+        nonlocal line_no, pending_answers
+        line_no += 1
+        raw = raw.strip()
+        if not raw:
+            return
+        summary["lines"] += 1
+        if len(raw) > SURVEY_INGEST_MAX_LINE_BYTES:
+            ready.append(_result(line_no, None, "invalid", errors=["line too long"]))
+            return
+        sub, error = parse_line(line_no, raw)
+        if error is not None:
+            ready.append(error)
+            return
+        items.append((line_no, sub))
+        pending_answers += len(sub.answers)
+
+    async for chunk in body:
+        if discarding:
+            end = chunk.find(b"\n")
+            if end < 0:
+                continue
+            chunk = chunk[end + 1:]
+            discarding = False
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            take(raw)
+        if len(buffer) > SURVEY_INGEST_MAX_LINE_BYTES:
+            # Báo lỗi ngay (không giữ cả dòng trong bộ nhớ); phần đuôi thuộc cùng số dòng nên không tăng line_no
+            buffer = b""
+            discarding = True
+            line_no += 1
+            summary["lines"] += 1
+            ready.append(_result(line_no, None, "invalid", errors=["line too long"]))
+        if pending_answers >= batch_answers:
+            yield await flush()
+    if buffer:
+        take(buffer)
+    out = await flush()
+    if out:
+        yield out
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    yield (json.dumps({"summary": summary}) + "\n").encode("utf-8")
@@ -0,0 +1,99 @@
+"""Immutable, pre-serialized snapshots of the question catalog, one per catalog version.
+
+Every ``catalog_version.bump`` stores the active catalog, serialized exactly
+like ``GET /survey/questions`` and gzip-compressed, in
+``survey_catalog_snapshots`` in the same transaction. A version's snapshot
+never changes afterwards, so ``/survey/questions/v/{version}`` can be served
+from memory with ``Cache-Control: immutable`` and cached by CDNs/browsers
+forever. Snapshots are loaded from the DB on first request and kept in a small
+per-process LRU (``SURVEY_SNAPSHOT_CACHE_SIZE`` versions).
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import survey as models
+from schemas import survey as schemas
+
+
+SURVEY_SNAPSHOT_CACHE_SIZE = int(os.getenv("SURVEY_SNAPSHOT_CACHE_SIZE", "16"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def serialize(questions: Iterable) -> bytes:
+    """JSON body of the question list (SurveyQuestion rows or CachedQuestion)."""
+    payload = [schemas.SurveyQuestionOut.model_validate(q).model_dump(mode="json") for q in questions]
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def active_questions(db: Session):
+    q = models.SurveyQuestion
+    # populate_existing: câu hỏi trong session có thể cũ hơn DB sau các UPDATE Core (vd. option_set_id/updated_at)
+    stmt = select(q).where(q.is_active.is_(True)).order_by(q.order, q.id).execution_options(populate_existing=True)
+    return db.execute(stmt).scalars().all()
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    etag: str  # của body chưa nén, trùng ETag của /questions cùng nội dung
+    body: bytes
+    gzip_body: bytes
+
+    @property
+    def gzip_etag(self) -> str:
+        return self.etag[:-1] + '-gzip"'
+
+
+def store(db: Session, version: int) -> None:
+    """Serialize the active catalog as seen by this transaction for ``version``. Does not commit."""
+    body = serialize(active_questions(db))
+    db.add(
+        models.SurveyCatalogSnapshot(
+            version=version,
+            etag=etag_for(body),
+            size=len(body),
+            body=gzip.compress(body, compresslevel=9, mtime=0),
+        )
+    )
+    db.flush()
+
+
+class SnapshotCache:
+    def __init__(self, size: int = SURVEY_SNAPSHOT_CACHE_SIZE):
+        self.size = size
+        self._items: "OrderedDict[int, Snapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, version: int) -> Optional[Snapshot]:
+        with self._lock:
+            snapshot = self._items.get(version)
+            if snapshot is not None:
+                self._items.move_to_end(version)
+                return snapshot
+        row = db.get(models.SurveyCatalogSnapshot, version)
+        if row is None:
+            return None
+        snapshot = Snapshot(version=row.version, etag=row.etag, body=gzip.decompress(row.body), gzip_body=row.body)
+        with self._lock:
+            self._items[version] = snapshot
+            self._items.move_to_end(version)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return snapshot
+
+
+snapshot_cache = SnapshotCache()
+
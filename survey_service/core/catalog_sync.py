@@ -0,0 +1,155 @@
+"""Diff-based, idempotent sync of the question catalog from a CSV/Excel file.
+
+Questions are matched on their natural key ``(question_group, order, version)``.
+The file is the desired catalog; compared to what is in the database:
+
+- keys only in the file are inserted;
+- keys in both whose content differs (or that were retired) are updated in
+  place, so their ids and answers are kept;
+- active keys missing from the file are soft-retired (``is_active = False``)
+  instead of deleted, so answers never cascade away.
+
+All changes are applied in bulk in one transaction, a new catalog version is
+recorded and the question cache is invalidated. Running the same file twice is
+a no-op. ``dry_run`` computes and returns the same diff without writing.
+"""
+import datetime
+from typing import Any, BinaryIO, Dict, List, Tuple
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import survey as models
+from core import answer_codec, catalog_version
+from core.question_cache import question_cache
+from core.question_import import SURVEY_IMPORT_CHUNK_SIZE, add_error, new_report, read_questions
+
+
+CONTENT_FIELDS = ("question_text", "question_type", "options", "is_required", "min_value", "max_value")
+RETIRE_BATCH_SIZE = 1000
+REPORT_ITEMS = 200  # số key tối đa liệt kê trong mỗi danh sách của báo cáo
+
+Key = Tuple[str, int, int]
+
+
+def _key(row: Dict[str, Any]) -> Key:
+    return (row["question_group"], int(row["order"]), int(row["version"] or 1))
+
+
+def _key_out(key: Key) -> Dict[str, Any]:
+    return {"question_group": key[0], "order": key[1], "version": key[2]}
+
+
+def sync_questions(
+    db: Session,
+    stream: BinaryIO,
+    filename: str = "",
+    dry_run: bool = False,
+    chunk_size: int = SURVEY_IMPORT_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """Make the active catalog equal to the file. Returns the diff report.
+
+    Nothing is written if the file has invalid rows or ``dry_run`` is set.
+    """
+    report = new_report()
+    desired: Dict[Key, Dict[str, Any]] = {}
+    lines: Dict[Key, int] = {}
+    for rows in read_questions(stream, filename, report, chunk_size):
+        for line, record in rows:
+            key = _key(record)
+            if key in desired:
+                add_error(report, line, [f"duplicate key {_key_out(key)} (first seen on row {lines[key]})"])
+                continue
+            desired[key] = record
+            lines[key] = line
+
+    q = models.SurveyQuestion
+    current = db.execute(
+        select(q.id, q.question_group, q.order, q.version, q.is_active, *(getattr(q, f) for f in CONTENT_FIELDS))
+        .order_by(q.id)
+    ).mappings().all()
+
+    by_key: Dict[Key, Dict[str, Any]] = {}
+    retire_ids: List[int] = []
+    retired_keys: List[Key] = []
+    for row in current:
+        key = _key(row)
+        if key in by_key:
+            # Bản trùng key từ các lần import cũ: giữ dòng id nhỏ nhất, ngừng dùng phần còn lại
+            if row["is_active"]:
+                retire_ids.append(row["id"])
+                retired_keys.append(key)
+            continue
+        by_key[key] = row
+
+    inserts: List[Dict[str, Any]] = []
+    updates: List[Dict[str, Any]] = []
+    changed: List[Dict[str, Any]] = []
+    for key, record in desired.items():
+        existing = by_key.get(key)
+        if existing is None:
+            inserts.append(record)
+            continue
+        fields = [f for f in CONTENT_FIELDS if existing[f] != record[f]]
+        if not existing["is_active"]:
+            fields.append("is_active")
+        if fields:
+            updates.append({"_id": existing["id"], **{"_" + f: record[f] for f in CONTENT_FIELDS}})
+            changed.append({**_key_out(key), "id": existing["id"], "fields": fields})
+    for key, row in by_key.items():
+        if row["is_active"] and key not in desired:
+            retire_ids.append(row["id"])
+            retired_keys.append(key)
+
+    report.update(
+        {
+            "dry_run": dry_run,
+            "inserted": len(inserts),
+            "updated": len(updates),
+            "retired": len(retire_ids),
+            "unchanged": len(desired) - len(inserts) - len(updates),
+            "insert_keys": [_key_out(_key(r)) for r in inserts[:REPORT_ITEMS]],
+            "update_keys": changed[:REPORT_ITEMS],
+            "retire_keys": [_key_out(k) for k in retired_keys[:REPORT_ITEMS]],
+            "catalog_version": None,
+        }
+    )
+    if dry_run or report["rejected"]:
+        return report
+    if not (inserts or updates or retire_ids):
+        report["catalog_version"] = catalog_version.current(db)
+        return report
+
+    now = datetime.datetime.utcnow()
+    table = q.__table__
+    try:
+        if inserts:
+            db.execute(insert(table), inserts)
+        if updates:
+            stmt = (
+                update(table)
+                .where(table.c.id == bindparam("_id"))
+                .values(
+                    **{f: bindparam("_" + f) for f in CONTENT_FIELDS},
+                    is_active=True,
+                    retired_at=None,
+                    updated_at=now,
+                )
+            )
+            db.connection().execute(stmt, updates)
+        for i in range(0, len(retire_ids), RETIRE_BATCH_SIZE):
+            db.execute(
+                update(table)
+                .where(table.c.id.in_(retire_ids[i:i + RETIRE_BATCH_SIZE]))
+                .values(is_active=False, retired_at=now, updated_at=now)
+            )
+        answer_codec.ensure_option_sets(db)
+        report["catalog_version"] = catalog_version.bump(
+            db, "sync", inserted=len(inserts), updated=len(updates), retired=len(retire_ids)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    question_cache.invalidate()
+    return report
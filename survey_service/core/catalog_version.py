@@ -0,0 +1,35 @@
+"""Catalog version counter: one ``survey_catalog_versions`` row per change of the question set.
+
+Each new version also gets its immutable snapshot (``core.catalog_snapshot``)
+and a recount of ``survey_submissions`` against the new active set.
+"""
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import survey as models
+from core import catalog_snapshot, submissions
+
+
+def bump(db: Session, source: str, inserted: int = 0, updated: int = 0, retired: int = 0) -> int:
+    """Record a catalog change inside the caller's transaction and return the new version."""
+    row = models.SurveyCatalogVersion(source=source, inserted=inserted, updated=updated, retired=retired)
+    db.add(row)
+    db.flush()
+    catalog_snapshot.store(db, row.id)
+    # Câu hỏi chỉ được thêm: số câu đã trả lời không đổi, chỉ cần xét lại is_completed
+    submissions.recount(db, answers=bool(updated or retired))
+    return row.id
+
+
+def current(db: Session) -> int:
+    return db.execute(select(func.coalesce(func.max(models.SurveyCatalogVersion.id), 0))).scalar()
+
+
+def ensure_snapshot(db: Session) -> int:
+    """Give the current catalog a snapshot if it has none (DBs from before snapshots). Commits; returns the version."""
+    version = current(db)
+    if version and db.get(models.SurveyCatalogSnapshot, version) is not None:
+        return version
+    version = bump(db, "snapshot")
+    db.commit()
+    return version
@@ -0,0 +1,141 @@
+"""Process-wide cache of the survey question catalog.
+
+Questions only change through admin import/create, but almost every survey
+endpoint needs them. ``question_cache.get(db)`` returns an immutable
+``QuestionCatalog`` snapshot (ordered list, dict by id, compiled validators and
+the pre-serialized ``/questions`` body with its ETag).
+
+Only active (not retired) questions are part of the catalog. Writers in this
+process call ``question_cache.invalidate()`` after commit. Other workers notice
+changes through a cheap fingerprint query (count / max(id) / max(updated_at) /
+catalog version) run at most every ``SURVEY_QUESTION_CACHE_TTL`` seconds.
+"""
+import datetime
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import survey as models
+from core.catalog_snapshot import etag_for, serialize
+from core.validation import AnswerValidator, compile_validator
+
+
+SURVEY_QUESTION_CACHE_TTL = float(os.getenv("SURVEY_QUESTION_CACHE_TTL", "30"))
+
+
+@dataclass(frozen=True)
+class CachedQuestion:
+    """Detached, read-only copy of a SurveyQuestion row."""
+
+    id: int
+    question_text: str
+    question_type: str
+    question_group: str
+    options: Optional[List[str]]
+    option_set_id: Optional[int]
+    order: int
+    is_required: bool
+    min_value: Optional[float]
+    max_value: Optional[float]
+    version: int
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+
+
+@dataclass(frozen=True)
+class QuestionCatalog:
+    version: int
+    fingerprint: Tuple[Any, ...]
+    questions: Tuple[CachedQuestion, ...]
+    by_id: Dict[int, CachedQuestion]
+    validators: Dict[int, AnswerValidator]
+    groups: Dict[str, Tuple[int, ...]]  # question ids theo nhóm, đúng thứ tự
+    body: bytes
+    etag: str
+
+    @property
+    def total(self) -> int:
+        return len(self.questions)
+
+
+def _fingerprint(db: Session) -> Tuple[Any, ...]:
+    q = models.SurveyQuestion
+    version = select(func.max(models.SurveyCatalogVersion.id)).scalar_subquery()
+    return tuple(db.execute(select(func.count(q.id), func.max(q.id), func.max(q.updated_at), version)).one())
+
+
+def _group_ids(questions: Tuple[CachedQuestion, ...]) -> Dict[str, Tuple[int, ...]]:
+    groups: Dict[str, List[int]] = {}
+    for q in questions:
+        groups.setdefault(q.question_group, []).append(q.id)
+    return {g: tuple(ids) for g, ids in groups.items()}
+
+
+class QuestionCache:
+    def __init__(self, ttl: float = SURVEY_QUESTION_CACHE_TTL):
+        self.ttl = ttl
+        self._catalog: Optional[QuestionCatalog] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """Drop the snapshot; the next ``get`` reloads it from the DB."""
+        self._catalog = None
+
+    def get(self, db: Session) -> QuestionCatalog:
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._checked_at < self.ttl:
+            return catalog
+        with self._lock:
+            catalog = self._catalog
+            fingerprint = _fingerprint(db)
+            if catalog is None or catalog.fingerprint != fingerprint:
+                catalog = self._load(db, fingerprint)
+                self._catalog = catalog
+            self._checked_at = time.monotonic()
+            return catalog
+
+    def _load(self, db: Session, fingerprint: Tuple[Any, ...]) -> QuestionCatalog:
+        rows = (
+            db.query(models.SurveyQuestion)
+            .filter(models.SurveyQuestion.is_active.is_(True))
+            .order_by(models.SurveyQuestion.order, models.SurveyQuestion.id)
+            .all()
+        )
+        questions = tuple(
+            CachedQuestion(
+                id=r.id,
+                question_text=r.question_text,
+                question_type=r.question_type,
+                question_group=r.question_group,
+                options=list(r.options) if r.options is not None else None,
+                option_set_id=r.option_set_id,
+                order=r.order,
+                is_required=r.is_required,
+                min_value=r.min_value,
+                max_value=r.max_value,
+                version=r.version,
+                created_at=r.created_at,
+                updated_at=r.updated_at,
+            )
+            for r in rows
+        )
+        body = serialize(questions)
+        return QuestionCatalog(
+            version=fingerprint[3] or 0,
+            fingerprint=fingerprint,
+            questions=questions,
+            by_id={q.id: q for q in questions},
+            validators={q.id: compile_validator(q) for q in questions},
+            groups=_group_ids(questions),
+            body=body,
+            etag=etag_for(body),
+        )
+
+
+question_cache = QuestionCache()
@@ -0,0 +1,284 @@
+"""Streaming CSV/Excel question importer.
+
+The encoding and delimiter are sniffed from the first ``SNIFF_BYTES`` of the
+stream only; the CSV is then parsed by pandas' C engine in chunks of
+``SURVEY_IMPORT_CHUNK_SIZE`` rows, so memory stays bounded for 100k+ row files.
+Each chunk is validated column-wise (no ``iterrows``), valid rows are
+bulk-inserted with one executemany per chunk, and everything runs in a single
+transaction. Invalid rows are reported as ``{"row": <line in file>, "errors": [...]}``.
+
+Excel files cannot be streamed by pandas; they are loaded whole and then go
+through the same chunked validation/insert path.
+"""
+import ast
+import codecs
+import csv
+import io
+import os
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import survey as models
+from core import answer_codec, catalog_version
+
+
+SURVEY_IMPORT_CHUNK_SIZE = int(os.getenv("SURVEY_IMPORT_CHUNK_SIZE", "5000"))
+SURVEY_IMPORT_MAX_ERRORS = int(os.getenv("SURVEY_IMPORT_MAX_ERRORS", "1000"))
+
+SNIFF_BYTES = 64 * 1024
+ENCODINGS = ("utf-8", "cp1252", "latin1")
+DELIMITERS = ",;\t|"
+
+REQUIRED_COLUMNS = ["question_text", "question_type", "question_group", "order"]
+EXPECTED_HEADER = "question_text,question_type,question_group,options,order,is_required,min_value,max_value,version"
+QUESTION_TYPES = {"single_choice", "multiple_choice", "number", "text"}
+CHOICE_TYPES = {"single_choice", "multiple_choice"}
+
+_TRUE = {"1", "true", "yes", "y", "x"}
+_FALSE = {"0", "false", "no", "n"}
+
+
+class ImportFormatError(ValueError):
+    """The file as a whole cannot be read (bad encoding, missing columns...)."""
+
+
+def sniff(head: bytes) -> Tuple[str, str]:
+    """Guess (encoding, delimiter) from the first bytes of a CSV file."""
+    if head.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+        sample = head[len(codecs.BOM_UTF8):].decode("utf-8", errors="ignore")
+    else:
+        encoding, sample = None, ""
+        for enc in ENCODINGS:
+            try:
+                # final=False: ký tự nhiều byte bị cắt ở cuối đoạn đầu không tính là lỗi
+                sample = codecs.getincrementaldecoder(enc)().decode(head, final=False)
+                encoding = enc
+                break
+            except UnicodeDecodeError:
+                continue
+        if encoding is None:
+            raise ImportFormatError("Cannot detect file encoding (tried " + ", ".join(ENCODINGS) + ")")
+    # Chỉ dò trên các dòng hoàn chỉnh
+    lines = sample.splitlines()[:50]
+    try:
+        delimiter = csv.Sniffer().sniff("\n".join(lines), delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        header = lines[0] if lines else ""
+        delimiter = max(DELIMITERS, key=header.count) if any(d in header for d in DELIMITERS) else ","
+    return encoding, delimiter
+
+
+def _csv_chunks(stream: BinaryIO, chunk_size: int) -> Tuple[Iterator[pd.DataFrame], Dict[str, Any]]:
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    encoding, delimiter = sniff(head)
+    text = io.TextIOWrapper(stream, encoding=encoding, newline="")
+    reader = pd.read_csv(
+        text,
+        sep=delimiter,
+        dtype=str,
+        keep_default_na=False,
+        skipinitialspace=True,
+        chunksize=chunk_size,
+        engine="c",
+    )
+    return reader, {"encoding": encoding, "delimiter": delimiter}
+
+
+def _excel_chunks(stream: BinaryIO, chunk_size: int) -> Tuple[Iterator[pd.DataFrame], Dict[str, Any]]:
+    try:
+        df = pd.read_excel(stream, dtype=str, keep_default_na=False)
+    except Exception as e:
+        raise ImportFormatError(f"Failed to read Excel file: {e}")
+    return (df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size)), {"encoding": None, "delimiter": None}
+
+
+def _parse_options(value: str) -> Optional[List[str]]:
+    # options là list dạng JSON/Python hoặc phân tách bằng dấu ;
+    value = value.strip()
+    if not value:
+        return None
+    if value.startswith("["):
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return None
+        return [str(o).strip() for o in parsed] if isinstance(parsed, (list, tuple)) else None
+    return [o.strip() for o in value.split(";") if o.strip()]
+
+
+def _validate_chunk(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+    """Normalize a chunk column-wise. Returns (clean frame, Series of error lists by row)."""
+    n = len(df)
+    errors = pd.Series([[] for _ in range(n)], index=df.index, dtype=object)
+
+    def flag(mask: pd.Series, message: str) -> None:
+        for idx in mask[mask].index:
+            errors.at[idx].append(message)
+
+    def col(name: str) -> pd.Series:
+        return df[name].astype(str).str.strip() if name in df.columns else pd.Series([""] * n, index=df.index)
+
+    out = pd.DataFrame(index=df.index)
+    out["question_text"] = col("question_text")
+    out["question_type"] = col("question_type").str.lower()
+    out["question_group"] = col("question_group")
+    flag(out["question_text"] == "", "question_text is empty")
+    flag(out["question_group"] == "", "question_group is empty")
+    flag(~out["question_type"].isin(QUESTION_TYPES), "question_type must be one of " + ", ".join(sorted(QUESTION_TYPES)))
+
+    order = pd.to_numeric(col("order"), errors="coerce")
+    flag(order.isna() | (order % 1 != 0), "order must be an integer")
+    out["order"] = order
+
+    version_raw = col("version")
+    version = pd.to_numeric(version_raw, errors="coerce")
+    flag((version_raw != "") & (version.isna() | (version % 1 != 0)), "version must be an integer")
+    out["version"] = version.fillna(1)
+
+    required_raw = col("is_required").str.lower()
+    flag(~required_raw.isin(_TRUE | _FALSE | {""}), "is_required must be 0/1 or true/false")
+    out["is_required"] = ~required_raw.isin(_FALSE)
+
+    for bound in ("min_value", "max_value"):
+        raw = col(bound)
+        value = pd.to_numeric(raw, errors="coerce")
+        flag((raw != "") & value.isna(), f"{bound} must be a number")
+        out[bound] = value
+    flag(out["min_value"].notna() & out["max_value"].notna() & (out["min_value"] > out["max_value"]),
+         "min_value is greater than max_value")
+
+    # Các câu hỏi thường dùng chung bộ options => chỉ parse mỗi giá trị khác nhau một lần
+    raw_options = col("options")
+    parsed = {value: _parse_options(value) for value in raw_options.unique()}
+    out["options"] = raw_options.map(parsed)
+    is_choice = out["question_type"].isin(CHOICE_TYPES)
+    flag(is_choice & out["options"].isna(), "choice questions need options")
+    # options chỉ có nghĩa với câu hỏi trắc nghiệm
+    out.loc[~is_choice, "options"] = None
+    return out, errors
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    records = []
+    for row in df.itertuples(index=False):
+        records.append(
+            {
+                "question_text": row.question_text,
+                "question_type": row.question_type,
+                "question_group": row.question_group,
+                "options": row.options,
+                "order": int(row.order),
+                "is_required": bool(row.is_required),
+                "min_value": None if pd.isna(row.min_value) else float(row.min_value),
+                "max_value": None if pd.isna(row.max_value) else float(row.max_value),
+                "version": int(row.version),
+            }
+        )
+    return records
+
+
+def new_report() -> Dict[str, Any]:
+    return {
+        "encoding": None,
+        "delimiter": None,
+        "rows": 0,
+        "rejected": 0,
+        "errors": [],
+        "errors_truncated": False,
+    }
+
+
+def add_error(report: Dict[str, Any], row: int, errors: List[str]) -> None:
+    report["rejected"] += 1
+    if len(report["errors"]) >= SURVEY_IMPORT_MAX_ERRORS:
+        report["errors_truncated"] = True
+        return
+    report["errors"].append({"row": row, "errors": errors})
+
+
+def read_questions(
+    stream: BinaryIO,
+    filename: str,
+    report: Dict[str, Any],
+    chunk_size: int = SURVEY_IMPORT_CHUNK_SIZE,
+) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    """Yield the valid rows of each chunk as ``(line, record)`` pairs.
+
+    Invalid rows are recorded in ``report``; unreadable files raise ``ImportFormatError``.
+    """
+    ext = os.path.splitext(filename.lower())[1]
+    if ext in ("", ".csv", ".txt"):
+        open_chunks = _csv_chunks
+    elif ext in (".xlsx", ".xls"):
+        open_chunks = _excel_chunks
+    else:
+        raise ImportFormatError("Unsupported file type. Please upload a CSV or Excel (.xlsx) file.")
+    try:
+        chunks, info = open_chunks(stream, chunk_size)
+        report.update(info)
+        for df in chunks:
+            if report["rows"] == 0:
+                df.columns = [str(c).strip().lower() for c in df.columns]
+                columns = list(df.columns)
+                missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+                if missing:
+                    raise ImportFormatError(
+                        "Missing required columns: " + ", ".join(missing) + ". Expected header: " + EXPECTED_HEADER
+                    )
+            else:
+                df.columns = columns
+            # Số dòng trong file (dòng 1 là header)
+            first_line = report["rows"] + 2
+            report["rows"] += len(df)
+            clean, errors = _validate_chunk(df.reset_index(drop=True))
+            bad = errors.map(bool)
+            for idx in bad[bad].index:
+                add_error(report, first_line + int(idx), errors.at[idx])
+            valid = clean[~bad]
+            yield list(zip((first_line + int(i) for i in valid.index), _records(valid)))
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f"File is not valid {report['encoding']}: {e}")
+    except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        raise ImportFormatError(f"Failed to parse CSV: {e}")
+
+
+def import_questions(
+    db: Session,
+    stream: BinaryIO,
+    filename: str = "",
+    skip_invalid: bool = False,
+    chunk_size: int = SURVEY_IMPORT_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """Append questions from a seekable binary stream. Commits only on success.
+
+    With ``skip_invalid=False`` any invalid row rolls back the whole import;
+    otherwise valid rows are committed and invalid ones are only reported.
+    """
+    report = new_report()
+    report["imported"] = 0
+    table = models.SurveyQuestion.__table__
+    try:
+        for rows in read_questions(stream, filename, report, chunk_size):
+            if report["rejected"] and not skip_invalid:
+                continue  # vẫn đọc hết file để báo lỗi đầy đủ, nhưng không ghi gì thêm
+            if rows:
+                db.execute(insert(table), [record for _, record in rows])
+                report["imported"] += len(rows)
+    except Exception:
+        db.rollback()
+        raise
+
+    if report["rejected"] and not skip_invalid:
+        db.rollback()
+        report["imported"] = 0
+        return report
+    if report["imported"]:
+        answer_codec.ensure_option_sets(db)
+        report["catalog_version"] = catalog_version.bump(db, "import", inserted=report["imported"])
+    db.commit()
+    return report
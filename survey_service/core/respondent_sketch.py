@@ -0,0 +1,300 @@
+"""Distinct-respondent counts by day and scope from mergeable HyperLogLog sketches.
+
+Scopes are ``all``, ``group:<question_group>`` and ``question:<question_id>``;
+one sketch per (scope, UTC day) lives in ``survey_respondent_sketches``.
+
+Answer writers call ``record`` after their commit. Users are added to
+in-process sketches and flushed to the DB at most every
+``SURVEY_SKETCH_FLUSH_SECONDS`` (and before every query and at shutdown) by
+max-merging into the stored row under a row lock, so workers never overwrite
+each other. A crashed worker loses at most its unflushed interval; ``rebuild``
+recomputes the sketches from ``survey_answers``.
+
+``count`` merges the sketches of a date range at query time (milliseconds,
+~1.6% error). ``count_exact`` is the audit path: ``COUNT(DISTINCT user_id)``
+on ``survey_answers``. That table only keeps the last ``submitted_at`` per
+(user, question), so a user who changes an answer on a later day is counted
+on both days by the sketches but only on the last day by the exact path (and
+by ``rebuild``).
+"""
+import datetime
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from models import survey as models
+from core.hll import HyperLogLog, hash64
+from core.question_cache import question_cache
+from core.sql import dialect_insert
+
+
+SURVEY_SKETCH_FLUSH_SECONDS = float(os.getenv("SURVEY_SKETCH_FLUSH_SECONDS", "10"))
+SCOPE_ALL = "all"
+SCOPE_BATCH_SIZE = 1000
+REBUILD_CHUNK_SIZE = 5000
+
+Key = Tuple[str, datetime.date]
+
+
+def group_scope(question_group: str) -> str:
+    return f"group:{question_group}"
+
+
+def question_scope(question_id: int) -> str:
+    return f"question:{question_id}"
+
+
+def _sketches(scope_hashes: Dict[str, Set[int]]) -> Dict[str, HyperLogLog]:
+    out = {}
+    for scope, hashes in scope_hashes.items():
+        sketch = HyperLogLog()
+        sketch.add_hashes(np.fromiter(hashes, dtype=np.uint64, count=len(hashes)))
+        out[scope] = sketch
+    return out
+
+
+def _scope_hashes(db: Session, pairs: Iterable[Tuple[str, int]], groups: Optional[Dict[int, str]] = None) -> Dict[str, Set[int]]:
+    if groups is None:
+        groups = {qid: q.question_group for qid, q in question_cache.get(db).by_id.items()}
+    hashes: Dict[str, int] = {}
+    scopes: Dict[str, Set[int]] = defaultdict(set)
+    for user_id, question_id in pairs:
+        h = hashes.get(user_id)
+        if h is None:
+            h = hashes[user_id] = hash64(user_id)
+        scopes[SCOPE_ALL].add(h)
+        scopes[question_scope(question_id)].add(h)
+        group = groups.get(question_id)  # câu hỏi đã ngừng dùng: không có trong cache, bỏ qua phạm vi nhóm
+        if group is not None:
+            scopes[group_scope(group)].add(h)
+    return scopes
+
+
+# ---- in-process accumulation ---------------------------------------------------
+
+class SketchBuffer:
+    def __init__(self, flush_seconds: float = SURVEY_SKETCH_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._pending: Dict[Key, HyperLogLog] = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def add(self, day: datetime.date, sketches: Dict[str, HyperLogLog]) -> None:
+        with self._lock:
+            for scope, sketch in sketches.items():
+                current = self._pending.get((scope, day))
+                if current is None:
+                    self._pending[(scope, day)] = sketch
+                else:
+                    current.merge(sketch)
+
+    def due(self) -> bool:
+        return bool(self._pending) and time.monotonic() - self._flushed_at >= self.flush_seconds
+
+    def take(self) -> Dict[Key, HyperLogLog]:
+        with self._lock:
+            items, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        return items
+
+    def put_back(self, items: Dict[Key, HyperLogLog]) -> None:
+        with self._lock:
+            for key, sketch in items.items():
+                current = self._pending.get(key)
+                self._pending[key] = sketch if current is None else current.merge(sketch)
+
+
+sketch_buffer = SketchBuffer()
+
+
+def record(db: Session, pairs: Iterable[Tuple[str, int]], day: Optional[datetime.date] = None) -> None:
+    """Add the (user_id, question_id) pairs of a committed answer write. Never raises."""
+    try:
+        sketches = _sketches(_scope_hashes(db, pairs))
+        sketch_buffer.add(day or datetime.datetime.utcnow().date(), sketches)
+        if sketch_buffer.due():
+            flush(db)
+    except Exception:
+        # Câu trả lời đã commit; sketch chưa ghi được sẽ được ghi ở lần flush sau (hoặc rebuild)
+        db.rollback()
+
+
+def flush(db: Session) -> int:
+    """Merge the buffered sketches into the DB and commit. Returns the number of rows touched."""
+    items = sketch_buffer.take()
+    if not items:
+        return 0
+    try:
+        merge_into(db, items)
+        db.commit()
+    except Exception:
+        db.rollback()
+        sketch_buffer.put_back(items)
+        raise
+    return len(items)
+
+
+def merge_into(db: Session, items: Dict[Key, HyperLogLog]) -> None:
+    """Max-merge sketches into their stored rows (creating missing rows). Does not commit."""
+    t = models.SurveyRespondentSketch.__table__
+    now = datetime.datetime.utcnow()
+    keys = sorted(items)  # khoá theo cùng thứ tự ở mọi worker để tránh deadlock
+    insert = dialect_insert(db)
+    if insert is not None:
+        # Dòng chưa có được tạo luôn với sketch mới; merge bên dưới là idempotent (max) nên không ảnh hưởng
+        db.execute(
+            insert(t).on_conflict_do_nothing(index_elements=[t.c.scope, t.c.day]),
+            [{"scope": s, "day": d, "sketch": items[(s, d)].to_bytes(), "updated_at": now} for s, d in keys],
+        )
+    scopes = sorted({s for s, _ in keys})
+    days = sorted({d for _, d in keys})
+    stored: Dict[Key, bytes] = {}
+    for i in range(0, len(scopes), SCOPE_BATCH_SIZE):
+        rows = db.execute(
+            select(t.c.scope, t.c.day, t.c.sketch)
+            .where(t.c.scope.in_(scopes[i:i + SCOPE_BATCH_SIZE]), t.c.day.in_(days))
+            .order_by(t.c.scope, t.c.day)
+            .with_for_update()
+        )
+        stored.update({(s, d): data for s, d, data in rows if (s, d) in items})
+    params = []
+    for key in keys:
+        sketch = items[key]
+        if key in stored:
+            sketch = HyperLogLog.from_bytes(stored[key]).merge(sketch)
+        elif insert is None:
+            db.add(models.SurveyRespondentSketch(scope=key[0], day=key[1], sketch=sketch.to_bytes(), updated_at=now))
+            continue
+        params.append({"_scope": key[0], "_day": key[1], "_sketch": sketch.to_bytes(), "_updated_at": now})
+    if params:
+        db.connection().execute(
+            update(t)
+            .where(t.c.scope == bindparam("_scope"), t.c.day == bindparam("_day"))
+            .values(sketch=bindparam("_sketch"), updated_at=bindparam("_updated_at")),
+            params,
+        )
+
+
+# ---- queries -------------------------------------------------------------------
+
+def scope_for(question_group: Optional[str] = None, question_id: Optional[int] = None) -> str:
+    if question_group is not None and question_id is not None:
+        raise ValueError("Use either question_group or question_id, not both")
+    if question_id is not None:
+        return question_scope(question_id)
+    if question_group is not None:
+        return group_scope(question_group)
+    return SCOPE_ALL
+
+
+def count(
+    db: Session,
+    scope: str = SCOPE_ALL,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    by_day: bool = False,
+) -> Dict[str, Any]:
+    """Approximate distinct respondents of ``scope`` between two days (inclusive)."""
+    try:
+        flush(db)  # để worker này thấy ngay câu trả lời của chính nó
+    except Exception:
+        pass
+    t = models.SurveyRespondentSketch
+    stmt = select(t.day, t.sketch).where(t.scope == scope).order_by(t.day)
+    if date_from is not None:
+        stmt = stmt.where(t.day >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(t.day <= date_to)
+    total = HyperLogLog()
+    days: List[Dict[str, Any]] = []
+    for day, data in db.execute(stmt):
+        sketch = HyperLogLog.from_bytes(data)
+        if by_day:
+            days.append({"day": day.isoformat(), "respondents": sketch.count()})
+        total.merge(sketch)
+    result: Dict[str, Any] = {"respondents": total.count(), "approximate": True}
+    if by_day:
+        result["by_day"] = days
+    return result
+
+
+def count_exact(
+    db: Session,
+    question_group: Optional[str] = None,
+    question_id: Optional[int] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    by_day: bool = False,
+) -> Dict[str, Any]:
+    """``COUNT(DISTINCT user_id)`` on survey_answers (by last ``submitted_at``), for audits."""
+    a, q = models.SurveyAnswer, models.SurveyQuestion
+
+    def filtered(stmt):
+        if question_group is not None:
+            stmt = stmt.join(q, q.id == a.question_id).where(q.question_group == question_group)
+        if question_id is not None:
+            stmt = stmt.where(a.question_id == question_id)
+        if date_from is not None:
+            stmt = stmt.where(a.submitted_at >= datetime.datetime.combine(date_from, datetime.time.min))
+        if date_to is not None:
+            stmt = stmt.where(
+                a.submitted_at < datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min)
+            )
+        return stmt
+
+    result: Dict[str, Any] = {
+        "respondents": db.execute(filtered(select(func.count(func.distinct(a.user_id))))).scalar(),
+        "approximate": False,
+    }
+    if by_day:
+        day = func.date(a.submitted_at)
+        rows = db.execute(filtered(select(day, func.count(func.distinct(a.user_id)))).group_by(day).order_by(day))
+        result["by_day"] = [{"day": str(d)[:10], "respondents": n} for d, n in rows]
+    return result
+
+
+# ---- rebuild -------------------------------------------------------------------
+
+def is_empty(db: Session) -> bool:
+    return db.execute(select(models.SurveyRespondentSketch.scope).limit(1)).first() is None
+
+
+def rebuild(db: Session) -> Dict[str, int]:
+    """Recompute every sketch from ``survey_answers`` (grouped by the day of ``submitted_at``) and commit."""
+    a, q = models.SurveyAnswer, models.SurveyQuestion
+    sketch_buffer.take()  # dữ liệu đang gom đã có trong survey_answers
+    db.execute(delete(models.SurveyRespondentSketch))
+    groups = dict(db.execute(select(q.id, q.question_group)).all())
+    stmt = (
+        select(a.user_id, a.question_id, a.submitted_at)
+        .order_by(a.submitted_at)
+        .execution_options(stream_results=True, yield_per=REBUILD_CHUNK_SIZE)
+    )
+    report = {"days": 0, "rows": 0}
+    current_day: Optional[datetime.date] = None
+    pairs: List[Tuple[str, int]] = []
+
+    def write_day() -> None:
+        if not pairs:
+            return
+        sketches = _sketches(_scope_hashes(db, pairs, groups))
+        merge_into(db, {(scope, current_day): sketch for scope, sketch in sketches.items()})
+        report["days"] += 1
+        report["rows"] += len(sketches)
+        pairs.clear()
+
+    for user_id, question_id, submitted_at in db.execute(stmt):
+        day = submitted_at.date()
+        if day != current_day:
+            write_day()
+            current_day = day
+        pairs.append((user_id, question_id))
+    write_day()
+    db.commit()
+    return report
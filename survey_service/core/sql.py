@@ -0,0 +1,35 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def dialect_insert(db: Session):
+    """Return the dialect ``insert`` that supports ON CONFLICT, or None if unsupported."""
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        return postgresql.insert
+    if name == "sqlite":
+        return sqlite.insert
+    return None
+
+
+_serial_sequences: Dict[str, str] = {}
+
+
+def new_ids(db: Session, table, n: int) -> List[Optional[int]]:
+    """``n`` values for ``table.id`` of rows about to be inserted with an explicit id.
+
+    PostgreSQL: drawn from the column's sequence in one query. SQLite: ``None``
+    (NULL for an INTEGER PRIMARY KEY means "assign the next rowid").
+    """
+    if n <= 0:
+        return []
+    if db.get_bind().dialect.name != "postgresql":
+        return [None] * n
+    sequence = _serial_sequences.get(table.name)
+    if sequence is None:
+        sequence = db.execute(select(func.pg_get_serial_sequence(table.name, "id"))).scalar()
+        _serial_sequences[table.name] = sequence
+    return db.execute(select(func.nextval(sequence)).select_from(func.generate_series(1, n))).scalars().all()
@@ -0,0 +1,61 @@
+"""Per-user survey progress in ``survey_submissions``.
+
+``answered_count`` is the number of active questions a user has answered.
+Answer writers add only the answers they actually inserted for active
+questions (``crud.record_submissions``), so re-sending an answer never
+inflates it. ``recount`` recomputes the table from ``survey_answers`` against
+the current active catalog; ``catalog_version.bump`` runs it on every catalog
+change. An empty catalog never marks anyone completed.
+"""
+from sqlalchemy import case, exists, false, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import survey as models
+
+
+def active_total(db: Session) -> int:
+    q = models.SurveyQuestion
+    return db.execute(select(func.count(q.id)).where(q.is_active.is_(True))).scalar()
+
+
+def recount(db: Session, answers: bool = True) -> None:
+    """Recompute ``survey_submissions`` inside the caller's transaction (no commit).
+
+    ``answers=False`` only re-evaluates ``is_completed`` against the current
+    total (questions were added, none retired or reactivated). Otherwise the
+    counts are recounted too, and users with answers but no row get one.
+    """
+    table = models.SurveySubmission.__table__
+    a, q = models.SurveyAnswer, models.SurveyQuestion
+    if answers:
+        active = select(q.id).where(q.is_active.is_(True))
+        answered = (
+            select(func.count(a.id))
+            .where(a.user_id == table.c.user_id, a.question_id.in_(active))
+            .scalar_subquery()
+        )
+        db.execute(update(table).values(answered_count=answered))
+        # User có câu trả lời nhưng chưa có dòng (DB từ trước khi có bảng này)
+        db.execute(
+            insert(table).from_select(
+                ["user_id", "answered_count", "is_completed", "first_answered_at", "last_answered_at"],
+                select(
+                    a.user_id,
+                    func.count(a.id).filter(a.question_id.in_(active)),
+                    false(),
+                    func.min(a.submitted_at),
+                    func.max(a.submitted_at),
+                )
+                .where(~exists().where(table.c.user_id == a.user_id))
+                .group_by(a.user_id),
+            )
+        )
+    total = active_total(db)
+    completed = table.c.answered_count >= total if total > 0 else false()
+    db.execute(
+        update(table).values(
+            is_completed=completed,
+            completed_at=func.coalesce(table.c.completed_at, case((completed, table.c.last_answered_at))),
+        )
+    )
+
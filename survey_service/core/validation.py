@@ -1,32 +1,119 @@
 from models import survey as models
-from typing import Any
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import math
+import re
+
+CHOICE_TYPES = ("single_choice", "multiple_choice")
+
+# Chuỗi được coi là số: dùng chung cho validate, thống kê (core.answer_stats) và regex PostgreSQL khi rebuild
+NUMBER_PATTERN = r"^\s*[-+]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$"
+_NUMBER_RE = re.compile(NUMBER_PATTERN)
+
+
+# Giá trị số của câu trả lời dạng number (JSON number hoặc chuỗi khớp NUMBER_PATTERN), None nếu không phải số
+def parse_number(answer: Any) -> Optional[float]:
+    if isinstance(answer, bool):
+        return None
+    if isinstance(answer, str) and not _NUMBER_RE.fullmatch(answer):
+        return None  # float() còn nhận "1_000", "nan", "infinity"... mà rebuild SQL không nhận
+    try:
+        val = float(answer)
+    except (TypeError, ValueError):
+        return None
+    return val if math.isfinite(val) else None  # 1e999 => inf
+
+
+# Validator biên dịch sẵn cho một câu hỏi: options => frozenset, min/max => float
+# Gọi validator(answer) trả về (True, None) nếu hợp lệ, (False, error_message) nếu không hợp lệ
+class AnswerValidator:
+    __slots__ = ("question_id", "question_text", "question_type", "required", "options", "min_value", "max_value")
+
+    def __init__(
+        self,
+        question_id: int,
+        question_text: str,
+        question_type: str,
+        required: bool = True,
+        options: Optional[Iterable[Any]] = None,
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+    ):
+        self.question_id = question_id
+        self.question_text = question_text
+        self.question_type = question_type
+        self.required = bool(required)
+        self.options = frozenset(options or ())
+        self.min_value = float(min_value) if min_value is not None else None
+        self.max_value = float(max_value) if max_value is not None else None
+
+    def __call__(self, answer: Any) -> Tuple[bool, Optional[str]]:
+        # Kiểm tra bắt buộc; câu không bắt buộc bỏ trống thì không kiểm tra tiếp
+        if answer is None or (isinstance(answer, str) and not answer):
+            if self.required:
+                return False, f"Câu hỏi '{self.question_text}' là bắt buộc."
+            return True, None
+
+        # Kiểm tra loại câu hỏi
+        qtype = self.question_type
+        if qtype == "single_choice":
+            if not self._is_option(answer):
+                return False, f"Đáp án không hợp lệ cho câu hỏi '{self.question_text}'."
+        elif qtype == "multiple_choice":
+            if not isinstance(answer, list):
+                return False, f"Câu hỏi '{self.question_text}' yêu cầu chọn nhiều đáp án."
+            for a in answer:
+                if not self._is_option(a):
+                    return False, f"Một đáp án không hợp lệ cho câu hỏi '{self.question_text}'."
+        elif qtype == "number":
+            val = parse_number(answer)
+            if val is None:
+                return False, f"Câu hỏi '{self.question_text}' yêu cầu nhập số."
+            if self.min_value is not None and val < self.min_value:
+                return False, f"Câu hỏi '{self.question_text}' yêu cầu giá trị >= {self.min_value:g}."
+            if self.max_value is not None and val > self.max_value:
+                return False, f"Câu hỏi '{self.question_text}' yêu cầu giá trị <= {self.max_value:g}."
+        elif qtype == "text":
+            if not isinstance(answer, str):
+                return False, f"Câu hỏi '{self.question_text}' yêu cầu nhập text."
+            # Có thể bổ sung kiểm tra độ dài nếu cần
+        # Có thể mở rộng thêm các loại khác
+        return True, None
+
+    def _is_option(self, value: Any) -> bool:
+        try:
+            return value in self.options
+        except TypeError:  # list/dict không hash được => chắc chắn không phải một option
+            return False
+
+
+def compile_validator(question: Any) -> AnswerValidator:
+    # Nhận SurveyQuestion hoặc bất kỳ object nào có cùng thuộc tính (vd. CachedQuestion)
+    return AnswerValidator(
+        question_id=question.id,
+        question_text=question.question_text,
+        question_type=question.question_type,
+        required=question.is_required,
+        options=question.options if question.question_type in CHOICE_TYPES else None,
+        min_value=getattr(question, "min_value", None),
+        max_value=getattr(question, "max_value", None),
+    )
+
+
+def validate_submission(validators: Dict[int, AnswerValidator], answers: Iterable[Any]) -> List[str]:
+    # Một lượt duy nhất qua danh sách câu trả lời, tra validator theo id (O(1) mỗi câu)
+    errors = []
+    for ans in answers:
+        validator = validators.get(ans.question_id)
+        if validator is None:
+            errors.append(f"Không tìm thấy câu hỏi với id {ans.question_id}")
+            continue
+        ok, err = validator(ans.answer)
+        if not ok:
+            errors.append(err)
+    return errors
+
 
 # Hàm validate nâng cao cho từng câu trả lời
 # Trả về (True, None) nếu hợp lệ, (False, error_message) nếu không hợp lệ
 def validate_answer(question: models.SurveyQuestion, answer: Any):
-    # Kiểm tra bắt buộc
-    if question.is_required and (answer is None or (isinstance(answer, str) and not answer)):
-        return False, f"Câu hỏi '{question.question_text}' là bắt buộc."
-
-    # Kiểm tra loại câu hỏi
-    if question.question_type == "single_choice":
-        if answer not in question.options:
-            return False, f"Đáp án không hợp lệ cho câu hỏi '{question.question_text}'."
-    elif question.question_type == "multiple_choice":
-        if not isinstance(answer, list):
-            return False, f"Câu hỏi '{question.question_text}' yêu cầu chọn nhiều đáp án."
-        for a in answer:
-            if a not in question.options:
-                return False, f"Một đáp án không hợp lệ cho câu hỏi '{question.question_text}'."
-    elif question.question_type == "number":
-        try:
-            val = float(answer)
-        except Exception:
-            return False, f"Câu hỏi '{question.question_text}' yêu cầu nhập số."
-        # Có thể bổ sung kiểm tra min/max nếu cần
-    elif question.question_type == "text":
-        if not isinstance(answer, str):
-            return False, f"Câu hỏi '{question.question_text}' yêu cầu nhập text."
-        # Có thể bổ sung kiểm tra độ dài nếu cần
-    # Có thể mở rộng thêm các loại khác
-    return True, None 
\ No newline at end of file
+    return compile_validator(question)(answer)
@@ -1,96 +1,129 @@
+from sqlalchemy import case, false, func, select
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 from models import survey as models
 from schemas import survey as schemas
-import pandas as pd
+from core.question_cache import question_cache
+from core.sql import dialect_insert, new_ids
+from core import answer_codec, answer_stats, catalog_sync, catalog_version, question_import, respondent_sketch
+import datetime
 import os
 
-# Lấy danh sách tất cả câu hỏi (theo thứ tự)
+# Số giá trị tối đa mỗi IN (...) (giới hạn tham số của SQLite/Postgres)
+WRITE_BATCH_SIZE = 1000
+
+# Lấy danh sách tất cả câu hỏi đang dùng (theo thứ tự)
 def get_all_questions(db: Session) -> List[models.SurveyQuestion]:
-    return db.query(models.SurveyQuestion).order_by(models.SurveyQuestion.order).all()
+    return (
+        db.query(models.SurveyQuestion)
+        .filter(models.SurveyQuestion.is_active.is_(True))
+        .order_by(models.SurveyQuestion.order)
+        .all()
+    )
 
 # Tạo mới một câu hỏi
 def create_question(db: Session, question: schemas.SurveyQuestionCreate) -> models.SurveyQuestion:
     db_question = models.SurveyQuestion(**question.model_dump())
     db.add(db_question)
+    db.flush()
+    # Gán bộ options trước khi bump: bump lưu snapshot catalog, phải thấy cả option_set_id/updated_at cuối cùng
+    answer_codec.ensure_option_sets(db)
+    catalog_version.bump(db, "create", inserted=1)
     db.commit()
+    question_cache.invalidate()
     db.refresh(db_question)
     return db_question
 
-# Import câu hỏi từ file CSV (dùng pandas)
-def import_questions_from_csv(db: Session, csv_path: str):
-    # Hỗ trợ CSV hoặc Excel; kiểm tra phần mở rộng
-    _, ext = os.path.splitext(csv_path.lower())
-
-    if ext in [".csv", ".txt"]:
-        # Đọc CSV với fallback encoding và auto-detect delimiter
-        encodings_to_try = ["utf-8", "utf-8-sig", "latin1"]
-        last_err: Exception | None = None
-        df = None
-        for enc in encodings_to_try:
-            try:
-                df = pd.read_csv(csv_path, encoding=enc, sep=None, engine="python")
-                break
-            except Exception as e:  # broad intentionally for parsing robustness
-                last_err = e
-                continue
-        if df is None:
-            raise ValueError(
-                f"Failed to read CSV. Ensure the file is a valid CSV. Last error: {last_err}"
-            )
-    elif ext in [".xlsx", ".xls"]:
-        try:
-            df = pd.read_excel(csv_path)
-        except Exception as e:
-            raise ValueError(f"Failed to read Excel file: {e}")
-    else:
-        raise ValueError("Unsupported file type. Please upload a CSV or Excel (.xlsx) file.")
-
-    # Chuẩn hoá tên cột
-    df.columns = [str(c).strip().lower() for c in df.columns]
-
-    required_cols = ["question_text", "question_type", "question_group", "order"]
-    missing = [c for c in required_cols if c not in df.columns]
-    if missing:
-        raise ValueError(
-            "Missing required columns: "
-            + ", ".join(missing)
-            + ". Expected header: question_text,question_type,question_group,options,order,is_required,version"
-        )
-    for _, row in df.iterrows():
-        # Lưu ý: options phải là list dạng JSON hoặc phân tách bằng dấu ; trong file CSV
-        options = None
-        if 'options' in row and pd.notna(row['options']):
-            try:
-                text = str(row['options'])
-                if text.strip().startswith('['):
-                    import ast
-                    options = ast.literal_eval(text)
-                else:
-                    options = text.split(';')
-            except Exception:
-                options = None
-        question = models.SurveyQuestion(
-            question_text=str(row['question_text']).strip(),
-            question_type=str(row['question_type']).strip(),
-            question_group=str(row['question_group']).strip(),
-            options=options,
-            order=int(row['order']),
-            is_required=bool(int(row['is_required'])) if 'is_required' in row and pd.notna(row['is_required']) else True,
-            version=int(row['version']) if 'version' in row and pd.notna(row['version']) else 1,
-        )
-        db.add(question)
-    db.commit()
+# Import câu hỏi từ file CSV/Excel (đường dẫn hoặc stream nhị phân), đọc theo từng chunk
+# Trả về báo cáo: số dòng đã import/bị loại và lỗi theo từng dòng
+def import_questions_from_csv(db: Session, source, filename: Optional[str] = None, skip_invalid: bool = False) -> dict:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as stream:
+            return import_questions_from_csv(db, stream, filename or os.fspath(source), skip_invalid)
+    report = question_import.import_questions(db, source, filename or "", skip_invalid=skip_invalid)
+    if report["imported"]:
+        question_cache.invalidate()
+    return report
+
+# Đồng bộ bộ câu hỏi theo file (diff theo nhóm + thứ tự + phiên bản), giữ nguyên câu trả lời cũ
+def sync_questions_from_file(db: Session, source, filename: Optional[str] = None, dry_run: bool = False) -> dict:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as stream:
+            return sync_questions_from_file(db, stream, filename or os.fspath(source), dry_run)
+    return catalog_sync.sync_questions(db, source, filename or "", dry_run=dry_run)
 
 def has_user_submitted(db: Session, user_id: str, total_questions: int) -> bool:
     # Trả về True nếu user đã trả lời đủ số câu hỏi (chống spam/trả lời lại)
-    answered_distinct_questions = (
-        db.query(models.SurveyAnswer.question_id)
-        .filter_by(user_id=user_id)
-        .distinct()
-        .count()
+    # Đọc một dòng trong survey_submissions thay vì COUNT(DISTINCT) trên survey_answers
+    answered = (
+        db.query(models.SurveySubmission.answered_count)
+        .filter(models.SurveySubmission.user_id == user_id)
+        .scalar()
     )
-    return answered_distinct_questions >= total_questions
+    return (answered or 0) >= total_questions
+
+# Số user đã trả lời ít nhất một câu / đã hoàn thành khảo sát
+def count_submissions(db: Session) -> dict:
+    total, completed = db.query(
+        func.count(models.SurveySubmission.user_id),
+        func.count(models.SurveySubmission.user_id).filter(models.SurveySubmission.is_completed.is_(True)),
+    ).one()
+    return {"total_users_submitted": total, "total_users_completed": completed}
+
+# Cập nhật dòng survey_submissions của user sau khi ghi câu trả lời (không commit)
+def record_submission(db: Session, user_id: str, added: int, total_questions: Optional[int] = None) -> None:
+    record_submissions(db, {user_id: added}, total_questions)
+
+# Như trên cho nhiều user: added = {user_id: số câu trả lời mới cho câu hỏi đang dùng}, kết quả của
+# upsert_answer_rows. Cộng dồn vào answered_count bằng một câu upsert (không đếm lại survey_answers);
+# gửi lại câu đã trả lời không được tính thêm vì upsert_answer_rows chỉ đếm dòng thật sự được insert
+def record_submissions(db: Session, added: Dict[str, int], total_questions: Optional[int] = None) -> None:
+    if not added:
+        return
+    if total_questions is None:
+        total_questions = question_cache.get(db).total
+    now = datetime.datetime.utcnow()
+    user_ids = sorted(added)  # mọi transaction khoá dòng theo cùng thứ tự
+    insert = dialect_insert(db)
+    if insert is None:
+        for user_id in user_ids:
+            row = db.get(models.SurveySubmission, user_id, with_for_update=True)
+            if row is None:
+                row = models.SurveySubmission(user_id=user_id, answered_count=0, first_answered_at=now)
+                db.add(row)
+            row.answered_count += added[user_id]
+            row.is_completed = total_questions > 0 and row.answered_count >= total_questions
+            row.last_answered_at = now
+            if row.is_completed and row.completed_at is None:
+                row.completed_at = now
+        return
+    table = models.SurveySubmission.__table__
+    stmt = insert(table)
+    answered = table.c.answered_count + stmt.excluded.answered_count
+    completed = answered >= total_questions if total_questions > 0 else false()
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            "answered_count": answered,
+            "is_completed": completed,
+            "last_answered_at": stmt.excluded.last_answered_at,
+            "completed_at": func.coalesce(table.c.completed_at, case((completed, stmt.excluded.last_answered_at))),
+        },
+    )
+    rows = []
+    for user_id in user_ids:
+        is_completed = total_questions > 0 and added[user_id] >= total_questions
+        rows.append(
+            {
+                "user_id": user_id,
+                "answered_count": added[user_id],
+                "is_completed": is_completed,
+                "first_answered_at": now,
+                "last_answered_at": now,
+                "completed_at": now if is_completed else None,
+            }
+        )
+    db.execute(stmt, rows)
 
 # Lưu câu trả lời của user (chỉ cho phép trả lời 1 lần, nếu đã có thì cập nhật)
 def save_user_answers(db: Session, user_id: str, answers: List[schemas.SurveyAnswerBase], total_questions: Optional[int] = None):
@@ -99,16 +132,194 @@ def save_user_answers(db: Session, user_id: str, answers: List[schemas.SurveyAns
         if has_user_submitted(db, user_id, int(total_questions)):
             # Nếu muốn cho phép cập nhật, có thể bỏ đoạn này
             return False
-    for ans in answers:
-        db_answer = db.query(models.SurveyAnswer).filter_by(user_id=user_id, question_id=ans.question_id).first()
-        if db_answer:
-            db_answer.answer = ans.answer
-        else:
-            db_answer = models.SurveyAnswer(user_id=user_id, question_id=ans.question_id, answer=ans.answer)
-            db.add(db_answer)
+    added = upsert_answers(db, user_id, answers)
+    record_submission(db, user_id, added.get(user_id, 0), total_questions)
     db.commit()
+    # Đếm người trả lời (HyperLogLog theo ngày) sau khi đã commit
+    respondent_sketch.record(db, [(user_id, ans.question_id) for ans in answers])
     return True
 
-# Lấy tất cả câu trả lời của một user
-def get_user_answers(db: Session, user_id: str) -> List[models.SurveyAnswer]:
-    return db.query(models.SurveyAnswer).filter_by(user_id=user_id).all()
+# Ghi toàn bộ câu trả lời bằng một câu INSERT ... ON CONFLICT DO UPDATE mỗi lô (không commit)
+# Thống kê theo câu hỏi được cộng dồn trong cùng transaction
+def upsert_answers(db: Session, user_id: str, answers: List[schemas.SurveyAnswerBase]) -> Dict[str, int]:
+    # Cùng một câu hỏi xuất hiện nhiều lần trong payload thì lấy câu sau cùng
+    return upsert_answer_rows(db, {(user_id, ans.question_id): ans.answer for ans in answers})
+
+# Khoá (FOR UPDATE) và đọc giá trị đã lưu của các (user_id, question_id) đang có trong DB: {key: (id, StoredAnswer)}
+def _lock_existing_answers(db: Session, keys: list) -> dict:
+    a = models.SurveyAnswer
+    wanted = set(keys)
+    user_ids = list(dict.fromkeys(user_id for user_id, _ in keys))
+    question_ids = list({qid for _, qid in keys})
+    existing = {}
+    for i in range(0, len(user_ids), WRITE_BATCH_SIZE):
+        stmt = (
+            select(a.id, a.user_id, a.question_id, a.answer, a.option_set_id, a.answer_code)
+            .where(a.user_id.in_(user_ids[i:i + WRITE_BATCH_SIZE]), a.question_id.in_(question_ids))
+            .order_by(a.user_id, a.question_id)
+            .with_for_update()
+        )
+        for answer_id, user_id, qid, *columns in db.execute(stmt):
+            if (user_id, qid) in wanted:  # IN (users) x IN (câu hỏi) rộng hơn tập key cần
+                existing[(user_id, qid)] = (answer_id, answer_codec.StoredAnswer(*columns))
+    return existing
+
+# Upsert câu trả lời của nhiều user: {(user_id, question_id): answer}. Không commit.
+# Ghi bằng MỘT câu INSERT ... ON CONFLICT DO UPDATE ... RETURNING (executemany, nhiều VALUES mỗi lô),
+# sau một SELECT ... FOR UPDATE đọc giá trị cũ (thống kê cần trừ giá trị cũ; RETURNING chỉ thấy giá trị mới).
+# Mỗi dòng mang id: id của dòng đã khoá, hoặc id mới cho câu chưa có. ON CONFLICT chỉ cập nhật khi
+# id = excluded.id, nên dòng do transaction khác vừa insert sau lần khoá không bị ghi đè, không được
+# trả về và không bao giờ bị cộng thống kê như câu trả lời mới; chỉ các dòng đó được khoá, đọc lại
+# và upsert thêm một vòng. Dòng được trả về: có trong tập đã khoá = update, ngược lại = insert.
+# Trả về {user_id: số câu trả lời mới (insert) cho câu hỏi đang dùng} cho mọi user trong answers
+def upsert_answer_rows(db: Session, answers: dict) -> Dict[str, int]:
+    if not answers:
+        return {}
+    question_ids = list({qid for _, qid in answers})
+    # Câu trắc nghiệm lưu dạng index/bitmask theo bộ options hiện tại của câu hỏi
+    questions = question_info(db, question_ids)
+    sets = answer_codec.get_sets(db, [info[1] for info in questions.values()])
+    stored = {}
+    for key, answer in answers.items():
+        info = questions.get(key[1])
+        stored[key] = answer_codec.encode(info[0], sets.get(info[1]), answer) if info else answer_codec.StoredAnswer(answer)
+    now = datetime.datetime.utcnow()
+    keys = sorted(stored)  # mọi transaction khoá dòng theo cùng thứ tự
+    rows = {
+        (user_id, qid): {
+            "user_id": user_id,
+            "question_id": qid,
+            "answer": stored[(user_id, qid)].answer,
+            "option_set_id": stored[(user_id, qid)].option_set_id,
+            "answer_code": stored[(user_id, qid)].answer_code,
+            "submitted_at": now,
+        }
+        for user_id, qid in keys
+    }
+    insert = dialect_insert(db)
+    if insert is None:
+        return _upsert_answer_rows_orm(db, stored, questions, list(rows.values()))
+
+    table = models.SurveyAnswer.__table__
+    stmt = insert(table)
+    # Một câu lệnh compile một lần (cache được); executemany gom thành INSERT nhiều VALUES mỗi lô
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.question_id],
+        set_={
+            "answer": stmt.excluded.answer,
+            "option_set_id": stmt.excluded.option_set_id,
+            "answer_code": stmt.excluded.answer_code,
+            "submitted_at": stmt.excluded.submitted_at,
+        },
+        where=table.c.id == stmt.excluded.id,
+    ).returning(table.c.user_id, table.c.question_id)
+    previous = {}  # giá trị cũ của các dòng đã được cập nhật (dòng insert mới: không có)
+    inserted = []
+    pending = keys
+    while pending:
+        locked = _lock_existing_answers(db, pending)
+        fresh = iter(new_ids(db, table, sum(1 for key in pending if key not in locked)))
+        params = [dict(rows[key], id=locked[key][0] if key in locked else next(fresh)) for key in pending]
+        written = {(user_id, qid) for user_id, qid in db.execute(stmt, params)}
+        for key in pending:
+            if key in written:
+                if key in locked:
+                    previous[key] = locked[key][1]
+                else:
+                    inserted.append(key)
+        # Dòng không được trả về: transaction khác insert sau lần khoá => khoá/đọc lại ở vòng sau
+        pending = [key for key in pending if key not in written]
+    answer_stats.apply_changes(
+        db,
+        [
+            (qid, questions[qid][0], previous.get((user_id, qid), answer_stats.NO_ANSWER), stored[(user_id, qid)])
+            for user_id, qid in keys
+            if qid in questions
+        ],
+    )
+    return _added_answers(keys, inserted, questions)
+
+# Dialect không hỗ trợ ON CONFLICT: đọc (khoá) dòng cũ rồi cập nhật/thêm qua session.
+# Hai lần ghi đầu tiên đồng thời cho cùng (user, câu hỏi) sẽ lỗi unique ở lần commit sau
+# (transaction đó rollback cả thống kê) chứ không bị đếm hai lần
+def _upsert_answer_rows_orm(db: Session, stored: dict, questions: dict, rows: list) -> Dict[str, int]:
+    a = models.SurveyAnswer
+    user_ids = list(dict.fromkeys(user_id for user_id, _ in stored))
+    question_ids = list({qid for _, qid in stored})
+    orm_rows = {}
+    existing = {}
+    for i in range(0, len(user_ids), WRITE_BATCH_SIZE):
+        where = (a.user_id.in_(user_ids[i:i + WRITE_BATCH_SIZE]), a.question_id.in_(question_ids))
+        for r in db.execute(select(a).where(*where).with_for_update()).scalars():
+            orm_rows[(r.user_id, r.question_id)] = r
+            existing[(r.user_id, r.question_id)] = answer_codec.StoredAnswer(r.answer, r.option_set_id, r.answer_code)
+    answer_stats.apply_changes(
+        db,
+        [
+            (qid, questions[qid][0], existing.get((user_id, qid), answer_stats.NO_ANSWER), new)
+            for (user_id, qid), new in stored.items()
+            if qid in questions
+        ],
+    )
+    for row in rows:
+        db_answer = orm_rows.get((row["user_id"], row["question_id"]))
+        if db_answer is not None:
+            db_answer.answer = row["answer"]
+            db_answer.option_set_id = row["option_set_id"]
+            db_answer.answer_code = row["answer_code"]
+            db_answer.submitted_at = row["submitted_at"]
+        else:
+            db.add(models.SurveyAnswer(**row))
+    return _added_answers(stored, [key for key in stored if key not in existing], questions)
+
+# {user_id: số câu hỏi đang dùng vừa được trả lời lần đầu}, có cả user chỉ cập nhật câu cũ (0)
+def _added_answers(keys, inserted, questions: dict) -> Dict[str, int]:
+    added = dict.fromkeys((user_id for user_id, _ in keys), 0)
+    for user_id, qid in inserted:
+        if qid in questions and questions[qid][2]:
+            added[user_id] += 1
+    return added
+
+# {question_id: (question_type, option_set_id, is_active)}: đọc từ cache (chỉ chứa câu đang dùng),
+# chỉ hỏi DB cho id mà cache chưa thấy (vừa import ở worker khác hoặc đã ngừng dùng)
+def question_info(db: Session, question_ids) -> dict:
+    by_id = question_cache.get(db).by_id
+    info = {qid: (by_id[qid].question_type, by_id[qid].option_set_id, True) for qid in question_ids if qid in by_id}
+    missing = [qid for qid in question_ids if qid not in info]
+    if missing:
+        q = models.SurveyQuestion
+        info.update(
+            (qid, (qtype, set_id, active))
+            for qid, qtype, set_id, active in db.query(q.id, q.question_type, q.option_set_id, q.is_active).filter(
+                q.id.in_(missing)
+            )
+        )
+    return info
+
+# Id các câu hỏi user đã trả lời (chỉ đọc index uq_survey_answers_user_question)
+def get_answered_question_ids(db: Session, user_id: str) -> set:
+    return set(
+        db.execute(
+            select(models.SurveyAnswer.question_id).where(models.SurveyAnswer.user_id == user_id)
+        ).scalars()
+    )
+
+# Lấy tất cả câu trả lời của một user (câu trắc nghiệm được giải mã lại thành text của options)
+def get_user_answers(db: Session, user_id: str) -> List[schemas.SurveyAnswerOut]:
+    a, q = models.SurveyAnswer, models.SurveyQuestion
+    rows = db.execute(
+        select(a.id, a.user_id, a.question_id, a.answer, a.option_set_id, a.answer_code, a.submitted_at, q.question_type)
+        .join(q, q.id == a.question_id)
+        .where(a.user_id == user_id)
+    ).all()
+    decode = answer_codec.Decoder(db)
+    return [
+        schemas.SurveyAnswerOut(
+            id=r.id,
+            user_id=r.user_id,
+            question_id=r.question_id,
+            answer=decode(r.question_type, r.answer, r.option_set_id, r.answer_code),
+            submitted_at=r.submitted_at,
+        )
+        for r in rows
+    ]
@@ -1,81 +1,52 @@
-import pandas as pd
-import ast
+#!/usr/bin/env python3
+"""
+Đồng bộ bộ câu hỏi từ file CSV/Excel vào database (diff theo question_group + order + version).
+Không xoá câu hỏi cũ: câu hỏi không còn trong file chỉ bị ngừng dùng, câu trả lời của user được giữ nguyên.
+
+Usage: python import_questions.py [file] [--dry-run]
+"""
+
+import sys
 from database import SessionLocal
-from models.survey import SurveyQuestion
+from crud import crud
+from core.question_import import ImportFormatError
 
-def import_questions_from_csv(csv_file_path: str):
-    """Import câu hỏi từ file CSV vào database"""
+def sync_questions(path: str, dry_run: bool = False) -> bool:
+    db = SessionLocal()
     try:
-        # Đọc file CSV
-        df = pd.read_csv(csv_file_path)
-        print(f"📖 Đọc được {len(df)} câu hỏi từ file CSV")
-        
-        # Tạo session database
-        db = SessionLocal()
-        
-        # Xóa tất cả câu hỏi cũ (nếu có)
-        db.query(SurveyQuestion).delete()
-        db.commit()
-        print("🗑️ Đã xóa dữ liệu cũ")
-        
-        # Import từng câu hỏi
-        for index, row in df.iterrows():
-            try:
-                # Xử lý options (chuyển từ string sang list)
-                options = None
-                if pd.notna(row['options']) and str(row['options']).strip():
-                    try:
-                        options = ast.literal_eval(str(row['options']))
-                    except:
-                        value = str(row['options'])
-                        options = value.split(',') if ',' in value else [value]
-                
-                # Tạo câu hỏi mới
-                question = SurveyQuestion(
-                    question_text=row['question_text'],
-                    question_type=row['question_type'],
-                    question_group=row['question_group'],
-                    options=options,
-                    order=int(row['order']),
-                    is_required=bool(int(row['is_required'])),
-                    version=int(row['version'])
-                )
-                
-                db.add(question)
-                print(f"✅ Đã thêm câu hỏi {index + 1}: {row['question_text'][:50]}...")
-                
-            except Exception as e:
-                print(f"❌ Lỗi khi import câu hỏi {index + 1}: {e}")
-                continue
-        
-        # Commit tất cả thay đổi
-        db.commit()
-        print(f"🎉 Hoàn thành import {len(df)} câu hỏi vào database!")
-        
-        # Đếm số câu hỏi theo nhóm
-        questions = db.query(SurveyQuestion).all()
-        groups = {}
-        for q in questions:
-            if q.question_group not in groups:
-                groups[q.question_group] = 0
-            groups[q.question_group] += 1
-        
-        print("\n📊 Thống kê theo nhóm câu hỏi:")
-        for group, count in groups.items():
-            print(f"  - {group}: {count} câu hỏi")
-        
+        report = crud.sync_questions_from_file(db, path, dry_run=dry_run)
+    except (OSError, ImportFormatError) as e:
+        print(f"❌ Lỗi khi đọc file: {e}")
+        return False
+    finally:
         db.close()
-        return True
-        
-    except Exception as e:
-        print(f"❌ Lỗi khi import: {e}")
+
+    print(f"📖 Đọc được {report['rows']} dòng (encoding={report['encoding']}, delimiter={report['delimiter']!r})")
+    if report["rejected"]:
+        print(f"❌ {report['rejected']} dòng không hợp lệ, không ghi gì:")
+        for err in report["errors"]:
+            print(f"  - dòng {err['row']}: {'; '.join(err['errors'])}")
         return False
 
+    print(f"➕ Thêm mới: {report['inserted']}")
+    print(f"✏️  Cập nhật: {report['updated']}")
+    for item in report["update_keys"]:
+        print(f"    {item['question_group']}#{item['order']} v{item['version']}: {', '.join(item['fields'])}")
+    print(f"🗄️  Ngừng dùng: {report['retired']}")
+    print(f"= Không đổi: {report['unchanged']}")
+    if dry_run:
+        print("🔍 Dry run: chưa ghi thay đổi nào")
+    else:
+        print(f"🎉 Catalog version: {report['catalog_version']}")
+    return True
+
 if __name__ == "__main__":
-    print("🚀 Bắt đầu import câu hỏi từ CSV...")
-    success = import_questions_from_csv("sample_questions.csv")
-    
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    print("🚀 Bắt đầu đồng bộ câu hỏi...")
+    success = sync_questions(args[0] if args else "sample_questions.csv", dry_run="--dry-run" in sys.argv)
+
     if success:
-        print("✅ Import thành công!")
+        print("✅ Đồng bộ thành công!")
     else:
-        print("❌ Import thất bại!") 
\ No newline at end of file
+        print("❌ Đồng bộ thất bại!")
+        sys.exit(1)
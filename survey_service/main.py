@@ -1,5 +1,7 @@
 from fastapi import FastAPI
 from routers import survey
+from database import SessionLocal
+from core import respondent_sketch
 
 app = FastAPI(
     title="Survey Service API",
@@ -16,6 +18,15 @@ app = FastAPI(
 # Đăng ký router cho survey_service
 app.include_router(survey.router, prefix="/api/v1")
 
+# Ghi nốt sketch đếm người trả lời đang gom trong bộ nhớ trước khi worker dừng
+@app.on_event("shutdown")
+def flush_respondent_sketches():
+    db = SessionLocal()
+    try:
+        respondent_sketch.flush(db)
+    finally:
+        db.close()
+
 @app.get("/")
 def root():
     return {"status": "ok", "service": "survey_service"}
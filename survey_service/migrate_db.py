@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Database migration script for Survey Service
+Removes duplicate answers and adds the unique (user_id, question_id) index
+used by the answer upsert, the numeric bounds used by answer validation,
+recounts survey_submissions from existing answers (active questions only),
+adds soft-retirement columns plus the natural-key index used by catalog sync,
+the time indexes used by incremental exports,
+the question_id index on survey_answers,
+the encoded (index/bitmask) storage of choice answers: new columns,
+encoding of existing rows and a stats rebuild on the integer form,
+a snapshot of the current question catalog
+and the initial per-day distinct-respondent sketches
+"""
+
+from sqlalchemy import text
+from database import engine, SessionLocal
+from core import answer_codec, answer_stats, catalog_version, respondent_sketch, submissions
+
+def migrate_database():
+    """Apply schema changes that create_all() does not add to existing tables"""
+
+    migration_commands = [
+        # Giữ lại câu trả lời mới nhất (id lớn nhất) cho mỗi (user_id, question_id)
+        """
+        DELETE FROM survey_answers
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM survey_answers GROUP BY user_id, question_id
+        );
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_survey_answers_user_question
+        ON survey_answers (user_id, question_id);
+        """,
+        """
+        ALTER TABLE survey_questions
+        ADD COLUMN IF NOT EXISTS min_value DOUBLE PRECISION;
+        """,
+        """
+        ALTER TABLE survey_questions
+        ADD COLUMN IF NOT EXISTS max_value DOUBLE PRECISION;
+        """,
+        """
+        ALTER TABLE survey_questions
+        ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;
+        """,
+        """
+        ALTER TABLE survey_questions
+        ADD COLUMN IF NOT EXISTS retired_at TIMESTAMP;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_survey_questions_key
+        ON survey_questions (question_group, "order", version);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_survey_answers_question
+        ON survey_answers (question_id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_survey_answers_submitted_at
+        ON survey_answers (submitted_at);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_survey_submissions_last_answered
+        ON survey_submissions (last_answered_at);
+        """,
+        # Bảng survey_option_sets / survey_option_index_counts do create_all() tạo
+        """
+        ALTER TABLE survey_questions
+        ADD COLUMN IF NOT EXISTS option_set_id INTEGER;
+        """,
+        """
+        ALTER TABLE survey_answers
+        ADD COLUMN IF NOT EXISTS option_set_id INTEGER REFERENCES survey_option_sets (id);
+        """,
+        """
+        ALTER TABLE survey_answers
+        ADD COLUMN IF NOT EXISTS answer_code BIGINT;
+        """,
+        """
+        ALTER TABLE survey_answers
+        ALTER COLUMN answer DROP NOT NULL;
+        """,
+        # Thống kê theo text cũ, thay bằng survey_option_index_counts (tính lại ở bước dưới)
+        """
+        DROP TABLE IF EXISTS survey_option_counts;
+        """,
+    ]
+
+    try:
+        with engine.connect() as conn:
+            for command in migration_commands:
+                print(f"Executing: {command.strip()}")
+                conn.execute(text(command))
+                conn.commit()
+                print("✓ Success")
+
+        # Mã hoá câu trả lời trắc nghiệm cũ theo bộ options hiện tại, rồi tính lại thống kê trên dạng số
+        db = SessionLocal()
+        try:
+            report = answer_codec.encode_existing(db)
+            print(
+                f"✓ Encoded {report['encoded']} choice answers "
+                f"({report['skipped']} not matching any option kept as text, {report['option_sets']} option sets created)"
+            )
+            answer_stats.rebuild(db)
+            print("✓ Rebuilt answer statistics")
+            # Bảng survey_submissions do create_all() tạo; điền/đếm lại cho user cũ, chỉ tính câu hỏi đang dùng
+            # (cần cột is_active ở trên). Catalog rỗng: không ai được đánh dấu hoàn thành
+            submissions.recount(db)
+            db.commit()
+            print("✓ Recounted survey submissions")
+            # Bảng survey_catalog_snapshots do create_all() tạo; catalog hiện tại cần một snapshot
+            print(f"✓ Catalog snapshot for version {catalog_version.ensure_snapshot(db)}")
+            # Sketch đếm người trả lời theo ngày: chỉ dựng lại từ survey_answers khi bảng còn trống
+            if respondent_sketch.is_empty(db):
+                report = respondent_sketch.rebuild(db)
+                print(f"✓ Built {report['rows']} respondent sketches over {report['days']} days")
+        finally:
+            db.close()
+
+        print("\n🎉 Database migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🔄 Starting database migration...")
+    migrate_database()
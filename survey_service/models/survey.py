@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, JSON, Boolean, ForeignKey, Index, Float, LargeBinary
 from sqlalchemy.orm import relationship
 import datetime
 from .base import Base
@@ -10,9 +10,14 @@ class SurveyQuestion(Base):
     question_type = Column(String(50), nullable=False)  # single_choice, multiple_choice, number, text
     question_group = Column(String(100), nullable=False)  # nhóm câu hỏi
     options = Column(JSON, nullable=True)  # list các lựa chọn nếu là trắc nghiệm
+    option_set_id = Column(Integer, nullable=True)  # survey_option_sets.id ứng với options hiện tại
     order = Column(Integer, nullable=False)
     is_required = Column(Boolean, default=True, nullable=False)
+    min_value = Column(Float, nullable=True)  # giới hạn cho câu hỏi dạng number
+    max_value = Column(Float, nullable=True)
     version = Column(Integer, default=1)
+    is_active = Column(Boolean, default=True, nullable=False)  # False = đã ngừng dùng (giữ lại câu trả lời cũ)
+    retired_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
@@ -28,8 +33,97 @@ class SurveyAnswer(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(100), nullable=False)
     question_id = Column(Integer, ForeignKey("survey_questions.id", ondelete="CASCADE"), nullable=False)
-    answer = Column(JSON, nullable=False)  # Có thể là text, số, list, v.v.
+    # Có thể là text, số, list, v.v. Câu trắc nghiệm đã mã hoá: NULL (hoặc list index khi > 63 options)
+    answer = Column(JSON(none_as_null=True), nullable=True)
+    option_set_id = Column(Integer, ForeignKey("survey_option_sets.id"), nullable=True)  # bộ options dùng để mã hoá
+    answer_code = Column(BigInteger, nullable=True)  # single_choice: index; multiple_choice: bitmask
     submitted_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     question = relationship("SurveyQuestion", back_populates="answers")
 
+# Khoá tự nhiên của câu hỏi khi đồng bộ catalog: (nhóm, thứ tự, phiên bản)
+Index("ix_survey_questions_key", SurveyQuestion.question_group, SurveyQuestion.order, SurveyQuestion.version)
+
+# Mỗi user chỉ có một câu trả lời cho mỗi câu hỏi; cũng là đích của ON CONFLICT khi upsert
+Index("uq_survey_answers_user_question", SurveyAnswer.user_id, SurveyAnswer.question_id, unique=True)
+# Thống kê / xoá theo câu hỏi (truy vấn theo user dùng uq_survey_answers_user_question ở trên)
+Index("ix_survey_answers_question", SurveyAnswer.question_id)
+# Export tăng dần theo thời gian gửi
+Index("ix_survey_answers_submitted_at", SurveyAnswer.submitted_at)
+
+
+class SurveySubmission(Base):
+    """Trạng thái làm khảo sát của từng user, cập nhật cùng transaction với câu trả lời."""
+    __tablename__ = "survey_submissions"
+    user_id = Column(String(100), primary_key=True)
+    answered_count = Column(Integer, nullable=False, default=0)  # số câu hỏi đang dùng đã trả lời
+    is_completed = Column(Boolean, nullable=False, default=False)
+    first_answered_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    last_answered_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    completed_at = Column(DateTime, nullable=True)
+
+Index("ix_survey_submissions_completed", SurveySubmission.is_completed)
+Index("ix_survey_submissions_last_answered", SurveySubmission.last_answered_at)
+
+
+class SurveyQuestionStat(Base):
+    """Tổng hợp câu trả lời theo câu hỏi, cộng dồn mỗi lần ghi câu trả lời."""
+    __tablename__ = "survey_question_stats"
+    question_id = Column(Integer, ForeignKey("survey_questions.id", ondelete="CASCADE"), primary_key=True)
+    answer_count = Column(Integer, nullable=False, default=0)
+    numeric_count = Column(Integer, nullable=False, default=0)
+    numeric_sum = Column(Float, nullable=False, default=0.0)
+    numeric_sum_sq = Column(Float, nullable=False, default=0.0)
+    numeric_min = Column(Float, nullable=True)
+    numeric_max = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+
+class SurveyOptionSet(Base):
+    """Một phiên bản danh sách options của câu hỏi trắc nghiệm; không bao giờ sửa, options đổi => thêm dòng mới."""
+    __tablename__ = "survey_option_sets"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    question_id = Column(Integer, ForeignKey("survey_questions.id", ondelete="CASCADE"), nullable=False)
+    options = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+Index("ix_survey_option_sets_question", SurveyOptionSet.question_id)
+
+
+class SurveyOptionCount(Base):
+    """Tần suất từng đáp án của câu hỏi trắc nghiệm, theo index trong bộ options đã dùng để mã hoá."""
+    __tablename__ = "survey_option_index_counts"
+    question_id = Column(Integer, ForeignKey("survey_questions.id", ondelete="CASCADE"), primary_key=True)
+    option_set_id = Column(Integer, ForeignKey("survey_option_sets.id", ondelete="CASCADE"), primary_key=True)
+    option_index = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class SurveyCatalogVersion(Base):
+    """Mỗi lần bộ câu hỏi thay đổi (sync/import/tạo mới) ghi một dòng; id là phiên bản catalog."""
+    __tablename__ = "survey_catalog_versions"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String(50), nullable=False)  # sync, import, create
+    inserted = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    retired = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+
+class SurveyCatalogSnapshot(Base):
+    """Danh sách câu hỏi đã serialize (JSON nén gzip) của một phiên bản catalog; không bao giờ sửa."""
+    __tablename__ = "survey_catalog_snapshots"
+    version = Column(Integer, ForeignKey("survey_catalog_versions.id", ondelete="CASCADE"), primary_key=True)
+    etag = Column(String(64), nullable=False)  # sha1 của JSON chưa nén
+    size = Column(Integer, nullable=False)  # số byte JSON chưa nén
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+
+class SurveyRespondentSketch(Base):
+    """HyperLogLog các user đã trả lời trong một ngày (UTC) theo phạm vi: all, group:<nhóm>, question:<id>."""
+    __tablename__ = "survey_respondent_sketches"
+    scope = Column(String(120), primary_key=True)
+    day = Column(Date, primary_key=True)
+    sketch = Column(LargeBinary, nullable=False)  # core.hll.HyperLogLog.to_bytes()
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Recompute survey_question_stats / survey_option_index_counts from survey_answers
+Usage: python rebuild_question_stats.py [question_id]
+"""
+
+import sys
+from database import SessionLocal
+from core.answer_stats import rebuild
+
+def rebuild_stats(question_id: int | None = None):
+    db = SessionLocal()
+    try:
+        result = rebuild(db, question_id)
+        target = f"question {question_id}" if question_id is not None else "all questions"
+        print(
+            f"✓ Rebuilt answer statistics for {target} "
+            f"({result['question_rows']} question rows, {result['option_rows']} option rows)"
+        )
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("🔄 Rebuilding answer statistics...")
+    rebuild_stats(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Body
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Body, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from schemas import survey as schemas
 from crud import crud
 from database import SessionLocal
-from typing import List
-import shutil
-import os
-from core.validation import validate_answer
+from typing import List, Optional
+import datetime
+from core.question_cache import question_cache
+from core.catalog_snapshot import IMMUTABLE_CACHE_CONTROL, snapshot_cache
+from core.question_import import ImportFormatError
+from core.validation import validate_submission
+from core import answer_export, answer_stats, bulk_ingest, respondent_sketch
 from core.security import get_current_user, require_admin
 
 # Gợi ý rõ ràng cho Swagger: không yêu cầu auth ở DEV mode
@@ -27,11 +31,69 @@ def get_db():
     "/questions",
     response_model=List[schemas.SurveyQuestionOut],
     summary="List all survey questions",
-    description="Trả về toàn bộ câu hỏi theo thứ tự `order`. Dùng để render form khảo sát ở client.",
+    description=(
+        "Trả về toàn bộ câu hỏi theo thứ tự `order`. Dùng để render form khảo sát ở client.\n"
+        "Có header `ETag`: gửi lại qua `If-None-Match` để nhận 304 khi danh sách chưa đổi."
+    ),
+    responses={304: {"description": "Danh sách câu hỏi không đổi"}},
 )
-def get_questions(db: Session = Depends(get_db)):
+def get_questions(request: Request, db: Session = Depends(get_db)):
     """Lấy danh sách câu hỏi khảo sát (đủ trường và metadata)."""
-    return crud.get_all_questions(db)
+    catalog = question_cache.get(db)
+    headers = {"ETag": catalog.etag, "Cache-Control": "no-cache", "X-Catalog-Version": str(catalog.version)}
+    if request.headers.get("if-none-match") == catalog.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+@router.get(
+    "/questions/version",
+    summary="Current question catalog version",
+    description=(
+        "Phiên bản hiện tại của bộ câu hỏi và URL snapshot tương ứng. Client lưu danh sách câu hỏi theo `version`, "
+        "chỉ tải lại `/survey/questions/v/{version}` khi version đổi."
+    ),
+)
+def get_questions_version(request: Request, db: Session = Depends(get_db)):
+    catalog = question_cache.get(db)
+    return JSONResponse(
+        {
+            "version": catalog.version,
+            "etag": catalog.etag,
+            "total": catalog.total,
+            "url": request.url_for("get_questions_snapshot", version=catalog.version).path,
+        },
+        headers={"Cache-Control": "no-cache"},
+    )
+
+@router.get(
+    "/questions/v/{version}",
+    response_model=List[schemas.SurveyQuestionOut],
+    summary="Immutable snapshot of the question catalog at a version",
+    description=(
+        "Danh sách câu hỏi đúng như lúc catalog ở phiên bản `version` (cùng định dạng `/survey/questions`). "
+        "Nội dung của một version không bao giờ đổi: trả về từ bộ nhớ, đã nén sẵn (gzip nếu client hỗ trợ), "
+        "với `Cache-Control: immutable` để CDN/trình duyệt cache lâu dài."
+    ),
+    responses={304: {"description": "Client đã có snapshot này"}, 404: {"description": "Không có snapshot cho version"}},
+)
+def get_questions_snapshot(version: int, request: Request, db: Session = Depends(get_db)):
+    snapshot = snapshot_cache.get(db, version)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Không có snapshot cho phiên bản {version}")
+    gzip_ok = "gzip" in request.headers.get("accept-encoding", "").lower()
+    etag = snapshot.gzip_etag if gzip_ok else snapshot.etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+        "X-Catalog-Version": str(snapshot.version),
+    }
+    if request.headers.get("if-none-match") in (snapshot.etag, snapshot.gzip_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if gzip_ok:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=snapshot.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
 # User gửi câu trả lời (nhiều câu hỏi cùng lúc)
 @router.post(
@@ -70,17 +132,9 @@ def submit_answers(
 ):
     # Chỉ cho user đã đăng nhập gửi câu trả lời (user lấy từ JWT)
     # Có thể so khớp user_id trong token và payload nếu muốn tăng bảo mật
-    errors = []
-    questions = db.query(crud.models.SurveyQuestion).all()
-    total_questions = len(questions)
-    for ans in payload.answers:
-        question = next((q for q in questions if q.id == ans.question_id), None)
-        if not question:
-            errors.append(f"Không tìm thấy câu hỏi với id {ans.question_id}")
-            continue
-        ok, err = validate_answer(question, ans.answer)
-        if not ok:
-            errors.append(err)
+    catalog = question_cache.get(db)
+    total_questions = catalog.total
+    errors = validate_submission(catalog.validators, payload.answers)
     if errors:
         raise HTTPException(status_code=400, detail=errors)
     # Chống spam: nếu user đã trả lời đủ số câu hỏi thì không cho trả lời lại
@@ -108,34 +162,145 @@ def get_answers(user_id: str, db: Session = Depends(get_db), user=Depends(get_cu
     description=(
         "File chấp nhận: .csv/.xlsx.\n\n"
         "Cột bắt buộc: question_text, question_type, question_group, order.\n"
-        "Cột tuỳ chọn: options, is_required, version.\n"
-        "CSV: hệ thống tự dò delimiter và encoding."
+        "Cột tuỳ chọn: options, is_required, min_value, max_value, version.\n"
+        "CSV: hệ thống tự dò delimiter và encoding từ phần đầu file, đọc và ghi theo từng chunk.\n\n"
+        "Dòng không hợp lệ được trả về trong `errors` (số dòng trong file + danh sách lỗi). "
+        "Mặc định có lỗi thì không import gì (400); `skip_invalid=true` để import các dòng hợp lệ."
     ),
+    responses={400: {"description": "File không đọc được hoặc có dòng không hợp lệ"}},
 )
 def import_questions(
     file: UploadFile = File(..., description="CSV hoặc Excel (.xlsx) chứa danh sách câu hỏi"),
+    skip_invalid: bool = False,
     db: Session = Depends(get_db),
     admin=Depends(require_admin),
 ):
-    # Chỉ cho admin import câu hỏi
-    temp_path = f"temp_{file.filename}"
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Chỉ cho admin import câu hỏi; đọc thẳng từ stream upload, không ghi file tạm
     try:
-        crud.import_questions_from_csv(db, temp_path)
-    finally:
-        os.remove(temp_path)
-    return {"message": "Questions imported successfully"}
+        report = crud.import_questions_from_csv(db, file.file, file.filename, skip_invalid=skip_invalid)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if report["rejected"] and not skip_invalid:
+        raise HTTPException(status_code=400, detail={"message": "Import bị huỷ do có dòng không hợp lệ", **report})
+    return {"message": "Questions imported successfully", **report}
+
+@router.post(
+    "/admin/sync-questions",
+    status_code=status.HTTP_200_OK,
+    summary="Admin sync survey questions from CSV/Excel (diff-based)",
+    description=(
+        "Đồng bộ bộ câu hỏi theo file: so khớp theo (question_group, order, version).\n\n"
+        "- Key mới => thêm; key đã có nhưng nội dung khác => cập nhật tại chỗ (giữ id và câu trả lời);\n"
+        "- Câu hỏi đang dùng nhưng không có trong file => ngừng dùng (is_active=false), không xoá.\n\n"
+        "Chạy lại cùng một file không thay đổi gì. `dry_run=true` chỉ trả về diff. "
+        "File có dòng không hợp lệ => 400, không ghi gì."
+    ),
+    responses={400: {"description": "File không đọc được hoặc có dòng không hợp lệ"}},
+)
+def sync_questions(
+    file: UploadFile = File(..., description="CSV hoặc Excel (.xlsx) chứa toàn bộ bộ câu hỏi mong muốn"),
+    dry_run: bool = False,
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin),
+):
+    try:
+        report = crud.sync_questions_from_file(db, file.file, file.filename, dry_run=dry_run)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if report["rejected"]:
+        raise HTTPException(status_code=400, detail={"message": "Sync bị huỷ do có dòng không hợp lệ", **report})
+    return report
+
+@router.get(
+    "/admin/export",
+    summary="Admin - stream survey answers export",
+    description=(
+        "Xuất toàn bộ câu trả lời kèm metadata câu hỏi, stream theo từng chunk (bộ nhớ không tăng theo dữ liệu).\n\n"
+        "- `layout=long`: mỗi dòng một câu trả lời; `layout=wide`: mỗi dòng một user, cột `q_<question_id>`\n"
+        "- `format`: csv | ndjson | parquet (parquet cần cài `pyarrow`)\n"
+        "- `since`/`until`: lọc theo thời gian gửi (wide: theo lần trả lời cuối của user) để lấy tăng dần\n"
+        "- `question_group`: lặp lại tham số để lọc nhiều nhóm"
+    ),
+    responses={200: {"content": {"text/csv": {}, "application/x-ndjson": {}, "application/vnd.apache.parquet": {}}}},
+)
+def export_answers(
+    format: str = "csv",
+    layout: str = "long",
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    question_group: Optional[List[str]] = Query(None),
+    admin=Depends(require_admin),
+):
+    try:
+        answer_export.check_format(format, layout)
+    except answer_export.ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, ext = answer_export.FORMATS[format]
+    # Generator tự mở session riêng: session của request đã đóng khi response còn đang stream
+    body = answer_export.stream_export(SessionLocal, format, layout, since, until, question_group)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="survey_answers_{layout}.{ext}"'},
+    )
+
+@router.post(
+    "/admin/ingest",
+    summary="Admin - bulk ingest answers of many users (NDJSON)",
+    description=(
+        "Body là NDJSON, mỗi dòng một user: `{\"user_id\": \"u1\", \"answers\": [{\"question_id\": 1, \"answer\": \"A\"}]}`.\n\n"
+        "- Đọc body dạng stream, gom theo lô lớn, kiểm tra bằng catalog câu hỏi đã biên dịch (cache) rồi upsert cả lô\n"
+        "- Response là NDJSON stream: mỗi dòng input một kết quả `{line, user_id, status: ok|invalid|error, ...}`, "
+        "dòng cuối là `{\"summary\": {...}}`\n"
+        "- Không giới hạn một lần trả lời: gửi lại cùng user sẽ ghi đè câu trả lời"
+    ),
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def ingest_answers(request: Request, admin=Depends(require_admin)):
+    # Generator tự mở session cho mỗi lô (chạy trong threadpool); response đọc body song song khi đang stream
+    return bulk_ingest.NDJSONDuplexResponse(bulk_ingest.ingest(request.stream(), SessionLocal))
 
 @router.get(
     "/admin/statistics",
     summary="Admin - overall survey statistics",
-    description="Số lượng user đã có ít nhất một câu trả lời (distinct theo user_id).",
+    description=(
+        "Số lượng user đã có ít nhất một câu trả lời và số user đã hoàn thành khảo sát "
+        "(đọc từ bảng survey_submissions)."
+    ),
 )
 def survey_statistics(db: Session = Depends(get_db), admin=Depends(require_admin)):
-    # Tổng số user đã trả lời survey (dựa vào user_id duy nhất trong survey_answers)
-    user_count = db.query(crud.models.SurveyAnswer.user_id).distinct().count()
-    return {"total_users_submitted": user_count}
+    # Tổng số user đã trả lời survey (mỗi user một dòng trong survey_submissions)
+    return crud.count_submissions(db)
+
+@router.get(
+    "/admin/respondents",
+    summary="Admin - distinct respondents over a date range",
+    description=(
+        "Số user khác nhau đã trả lời trong khoảng ngày (UTC, tính cả hai đầu), toàn bộ survey hoặc theo "
+        "`question_group` / `question_id`. Mặc định ước lượng bằng HyperLogLog gộp theo ngày (sai số ~1.6%, "
+        "vài ms với mọi khoảng ngày); `exact=true` đếm chính xác trên survey_answers để đối soát "
+        "(theo thời điểm trả lời cuối cùng của mỗi câu). `by_day=true` trả thêm số theo từng ngày."
+    ),
+)
+def respondent_count(
+    date_from: Optional[datetime.date] = Query(None, description="Ngày bắt đầu (YYYY-MM-DD)"),
+    date_to: Optional[datetime.date] = Query(None, description="Ngày kết thúc (YYYY-MM-DD)"),
+    question_group: Optional[str] = None,
+    question_id: Optional[int] = None,
+    by_day: bool = False,
+    exact: bool = False,
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin),
+):
+    try:
+        scope = respondent_sketch.scope_for(question_group, question_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if exact:
+        result = respondent_sketch.count_exact(db, question_group, question_id, date_from, date_to, by_day)
+    else:
+        result = respondent_sketch.count(db, scope, date_from, date_to, by_day)
+    return {"scope": scope, "date_from": date_from, "date_to": date_to, **result}
 
 @router.get(
     "/admin/question-stats/{question_id}",
@@ -143,41 +308,18 @@ def survey_statistics(db: Session = Depends(get_db), admin=Depends(require_admin
     description=(
         "Thống kê tuỳ theo loại câu hỏi: \n"
         "- single_choice/multiple_choice: tần suất các đáp án\n"
-        "- number: trung bình và số lượng\n"
+        "- number: trung bình, số lượng, min/max và độ lệch chuẩn\n"
         "- text: tổng số câu trả lời"
     ),
 )
 def question_statistics(question_id: int, db: Session = Depends(get_db), admin=Depends(require_admin)):
     # Thống kê đáp án cho 1 câu hỏi
-    question = db.query(crud.models.SurveyQuestion).filter_by(id=question_id).first()
+    # Câu hỏi đã ngừng dùng không có trong cache nhưng vẫn xem được thống kê
+    question = question_cache.get(db).by_id.get(question_id) or db.get(crud.models.SurveyQuestion, question_id)
     if not question:
         raise HTTPException(status_code=404, detail="Không tìm thấy câu hỏi")
-    answers = db.query(crud.models.SurveyAnswer).filter_by(question_id=question_id).all()
-    stats = {}
-    if question.question_type in ["single_choice", "multiple_choice"]:
-        # Đếm tần suất từng đáp án
-        from collections import Counter
-        all_answers = []
-        for a in answers:
-            if question.question_type == "single_choice":
-                all_answers.append(a.answer)
-            else:
-                all_answers.extend(a.answer if isinstance(a.answer, list) else [])
-        stats = dict(Counter(all_answers))
-    elif question.question_type == "number":
-        # Tính giá trị trung bình
-        nums = []
-        for a in answers:
-            try:
-                nums.append(float(a.answer))
-            except Exception:
-                pass
-        if nums:
-            stats = {"average": sum(nums)/len(nums), "count": len(nums)}
-        else:
-            stats = {"average": None, "count": 0}
-    else:
-        stats = {"count": len(answers)}
+    # Đọc số liệu đã cộng dồn sẵn (survey_question_stats / survey_option_index_counts), không quét survey_answers
+    stats = answer_stats.read_stats(db, question_id, question.question_type)
     return {"question_id": question_id, "question_text": question.question_text, "stats": stats}
 
 @router.patch(
@@ -201,10 +343,10 @@ def save_single_answer(
     user=Depends(get_current_user),
 ):
     # Validate câu hỏi tồn tại
-    question = db.query(crud.models.SurveyQuestion).filter_by(id=payload.question_id).first()
-    if not question:
+    validator = question_cache.get(db).validators.get(payload.question_id)
+    if validator is None:
         raise HTTPException(status_code=404, detail=f"Không tìm thấy câu hỏi với id {payload.question_id}")
-    ok, err = validate_answer(question, payload.answer)
+    ok, err = validator(payload.answer)
     if not ok:
         raise HTTPException(status_code=400, detail=err)
     # Lưu hoặc cập nhật câu trả lời
@@ -216,18 +358,30 @@ def save_single_answer(
 @router.get(
     "/progress/{user_id}",
     summary="Get survey progress for a user",
-    description="Trả về danh sách câu đã trả lời, còn thiếu và tổng số câu hỏi để client hiển thị tiến độ.",
+    description=(
+        "Trả về danh sách câu đã trả lời, còn thiếu (theo thứ tự câu hỏi) và tổng số câu hỏi để client hiển thị tiến độ.\n"
+        "`by_group=true` trả thêm tiến độ theo từng nhóm câu hỏi."
+    ),
 )
-def get_survey_progress(user_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    # Lấy tất cả câu hỏi
-    questions = db.query(crud.models.SurveyQuestion).all()
-    question_ids = set(q.id for q in questions)
-    # Lấy tất cả câu đã trả lời
-    answers = db.query(crud.models.SurveyAnswer).filter_by(user_id=user_id).all()
-    answered_ids = set(a.question_id for a in answers)
-    missing_ids = list(question_ids - answered_ids)
-    return {
-        "answered": list(answered_ids),
-        "missing": missing_ids,
-        "total": len(question_ids)
-    } 
\ No newline at end of file
+def get_survey_progress(
+    user_id: str,
+    by_group: bool = False,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    # Danh sách câu hỏi lấy từ cache; chỉ một truy vấn (theo index) lấy id các câu đã trả lời
+    catalog = question_cache.get(db)
+    answered_ids = crud.get_answered_question_ids(db, user_id)
+    answered = [q.id for q in catalog.questions if q.id in answered_ids]
+    missing = [q.id for q in catalog.questions if q.id not in answered_ids]
+    result = {
+        "answered": answered,
+        "missing": missing,
+        "total": catalog.total,
+    }
+    if by_group:
+        result["groups"] = {
+            group: {"answered": sum(1 for qid in ids if qid in answered_ids), "total": len(ids)}
+            for group, ids in catalog.groups.items()
+        }
+    return result 
\ No newline at end of file
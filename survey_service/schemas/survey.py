@@ -9,6 +9,8 @@ class SurveyQuestionBase(BaseModel):
     options: Optional[List[str]] = None  # Chỉ dùng cho trắc nghiệm
     order: int
     is_required: bool = True
+    min_value: Optional[float] = None  # Chỉ dùng cho câu hỏi dạng number
+    max_value: Optional[float] = None
     version: int = 1
 
 class SurveyQuestionCreate(SurveyQuestionBase):
@@ -40,4 +42,12 @@ class SurveyAnswerOut(SurveyAnswerBase):
 # Schema cho request gửi nhiều câu trả lời một lúc
 class SurveySubmitRequest(BaseModel):
     user_id: str
-    answers: List[SurveyAnswerBase] 
\ No newline at end of file
+    answers: List[SurveyAnswerBase] 
+# Schema cho một dòng NDJSON của /admin/ingest (nhiều user trong một request)
+class BulkAnswerIn(BaseModel):
+    question_id: int
+    answer: Any
+
+class BulkSubmissionIn(BaseModel):
+    user_id: str = Field(..., min_length=1, max_length=100)
+    answers: List[BulkAnswerIn]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bulk NDJSON ingestion through ``POST /api/v1/survey/admin/ingest``.
+
+Usage (from survey_service/):
+    python scripts/bench_ingest.py [--users 5000] [--questions 40] [--db /tmp/survey_bench_ingest.db]
+
+Creates a fresh SQLite database with a synthetic catalog, streams the NDJSON body
+in 64 KiB chunks through the ASGI app (TestClient, AUTH_MODE=dev) and reports
+answers/s for a first load (inserts) and a second load of the same users
+(updates, so stats deltas are subtracted too).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--users", type=int, default=5_000)
+    p.add_argument("--questions", type=int, default=40)
+    p.add_argument("--db", default="/tmp/survey_bench_ingest.db")
+    return p.parse_args()
+
+
+def _catalog(n_questions: int):
+    types = ["single_choice", "multiple_choice", "number", "text"]
+    rows = []
+    for i in range(1, n_questions + 1):
+        qtype = types[i % len(types)]
+        rows.append(
+            {
+                "question_text": f"Câu hỏi {i}",
+                "question_type": qtype,
+                "question_group": "bench",
+                "options": [f"Lựa chọn {j}" for j in range(8)] if qtype.endswith("choice") else None,
+                "order": i,
+                "is_required": True,
+                "min_value": 0 if qtype == "number" else None,
+                "max_value": 1_000 if qtype == "number" else None,
+                "version": 1,
+            }
+        )
+    return rows
+
+
+def _answer(question):
+    qtype = question.question_type
+    if qtype == "single_choice":
+        return random.choice(question.options)
+    if qtype == "multiple_choice":
+        return random.sample(question.options, 3)
+    if qtype == "number":
+        return random.randint(0, 1_000)
+    return "Câu trả lời tự do"
+
+
+def _body(questions, n_users: int):
+    lines = []
+    for u in range(n_users):
+        answers = [{"question_id": q.id, "answer": _answer(q)} for q in questions]
+        lines.append(json.dumps({"user_id": f"bench_{u}", "answers": answers}, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _chunks(data: bytes, size: int = 64 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def main():
+    args = _args()
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["SURVEY_DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ.setdefault("AUTH_MODE", "dev")
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import insert
+
+    from database import SessionLocal
+    from main import app
+    from models import survey as models
+    from core.question_cache import question_cache
+
+    random.seed(42)
+    db = SessionLocal()
+    db.execute(insert(models.SurveyQuestion.__table__), _catalog(args.questions))
+    db.commit()
+    questions = question_cache.get(db).questions
+    db.close()
+
+    client = TestClient(app)
+    total_answers = args.users * args.questions
+    print(f"Ingest: {args.users} users x {args.questions} questions = {total_answers} answers (SQLite)")
+    for label in ("insert", "update"):
+        body = _body(questions, args.users)
+        t0 = time.perf_counter()
+        resp = client.post("/api/v1/survey/admin/ingest", content=_chunks(body))
+        elapsed = time.perf_counter() - t0
+        summary = json.loads(resp.text.strip().rsplit("\n", 1)[-1])["summary"]
+        assert resp.status_code == 200 and summary["ok"] == args.users, summary
+        print(f"{label:>7}: {elapsed:6.2f} s  {summary['answers'] / elapsed:10,.0f} answers/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: submission validation with compiled validators vs the old per-answer scan.
+
+Usage (from survey_service/):
+    python scripts/bench_validation.py [--questions 500] [--options 2000] [--rounds 20]
+
+Pure in-memory (no database). The "legacy" path reproduces the previous code:
+``next(q for q in questions ...)`` for each answer and list membership on options.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--questions", type=int, default=500)
+    p.add_argument("--options", type=int, default=2_000)
+    p.add_argument("--rounds", type=int, default=20)
+    return p.parse_args()
+
+
+def _survey(n_questions: int, n_options: int):
+    types = ["single_choice", "multiple_choice", "number", "text"]
+    questions, answers = [], []
+    for qid in range(1, n_questions + 1):
+        qtype = types[qid % len(types)]
+        options = [f"Lựa chọn {qid}-{i}" for i in range(n_options)] if qtype.endswith("choice") else None
+        questions.append(
+            SimpleNamespace(
+                id=qid,
+                question_text=f"Câu hỏi {qid}",
+                question_type=qtype,
+                options=options,
+                is_required=True,
+                min_value=0 if qtype == "number" else None,
+                max_value=1_000_000 if qtype == "number" else None,
+            )
+        )
+        if qtype == "single_choice":
+            answer = random.choice(options)
+        elif qtype == "multiple_choice":
+            answer = random.sample(options, 5)
+        elif qtype == "number":
+            answer = random.randint(0, 1_000_000)
+        else:
+            answer = "Câu trả lời tự do"
+        answers.append(SimpleNamespace(question_id=qid, answer=answer))
+    random.shuffle(answers)
+    return questions, answers
+
+
+def _legacy(questions, answers):
+    errors = []
+    for ans in answers:
+        question = next((q for q in questions if q.id == ans.question_id), None)
+        if not question:
+            errors.append(ans.question_id)
+            continue
+        if question.question_type == "single_choice":
+            if ans.answer not in question.options:
+                errors.append(ans.question_id)
+        elif question.question_type == "multiple_choice":
+            for a in ans.answer:
+                if a not in question.options:
+                    errors.append(ans.question_id)
+                    break
+        elif question.question_type == "number":
+            float(ans.answer)
+        elif not isinstance(ans.answer, str):
+            errors.append(ans.question_id)
+    return errors
+
+
+def _time(fn, rounds: int) -> list:
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+        assert not result, result
+    return samples
+
+
+def main():
+    from core.validation import compile_validator, validate_submission
+
+    args = _args()
+    random.seed(42)
+    questions, answers = _survey(args.questions, args.options)
+    print(f"Survey: {args.questions} questions, {args.options} options per choice question")
+
+    t0 = time.perf_counter()
+    validators = {q.id: compile_validator(q) for q in questions}
+    compile_ms = (time.perf_counter() - t0) * 1000
+    print(f"Compile validators (once per catalog load): {compile_ms:.1f} ms")
+
+    legacy = _time(lambda: _legacy(questions, answers), args.rounds)
+    compiled = _time(lambda: validate_submission(validators, answers), args.rounds)
+    for name, samples in (("legacy scan", legacy), ("compiled", compiled)):
+        print(f"{name:>12}: median {statistics.median(samples):8.2f} ms  max {max(samples):8.2f} ms per submission")
+    print(f"Speedup: {statistics.median(legacy) / statistics.median(compiled):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Test chạy từ survey_service/ với import kiểu top-level như main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import survey as models
+from models.base import Base
+from schemas import survey as schemas
+from core import catalog_version, submissions
+from core.question_cache import question_cache
+from crud import crud
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'survey.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    question_cache.invalidate()
+    yield session
+    session.close()
+    question_cache.invalidate()
+    engine.dispose()
+
+
+def _question(db, order):
+    return crud.create_question(
+        db, schemas.SurveyQuestionCreate(question_text=f"Q{order}", question_type="text", question_group="g", order=order)
+    ).id
+
+
+def _answer(db, user_id, *question_ids):
+    answers = [schemas.SurveyAnswerBase(user_id=user_id, question_id=qid, answer="x") for qid in question_ids]
+    return crud.save_user_answers(db, user_id, answers)
+
+
+def _row(db, user_id):
+    db.expire_all()
+    return db.get(models.SurveySubmission, user_id)
+
+
+def test_counts_only_new_answers(db):
+    q1, q2 = _question(db, 1), _question(db, 2)
+    _answer(db, "u1", q1)
+    _answer(db, "u1", q1)  # gửi lại câu đã trả lời: không cộng thêm
+    assert (_row(db, "u1").answered_count, _row(db, "u1").is_completed) == (1, False)
+    _answer(db, "u1", q1, q2)
+    row = _row(db, "u1")
+    assert (row.answered_count, row.is_completed) == (2, True)
+    assert row.completed_at is not None
+
+
+def test_catalog_changes_recount_active_questions(db):
+    q1, q2 = _question(db, 1), _question(db, 2)
+    _answer(db, "u1", q1, q2)
+    _question(db, 3)  # thêm câu hỏi: chưa hoàn thành nữa
+    assert (_row(db, "u1").answered_count, _row(db, "u1").is_completed) == (2, False)
+
+    db.get(models.SurveyQuestion, q2).is_active = False
+    catalog_version.bump(db, "sync", retired=1)
+    db.commit()
+    question_cache.invalidate()
+    assert _row(db, "u1").answered_count == 1
+    # Câu hỏi đã ngừng dùng không được tính
+    _answer(db, "u2", q2)
+    assert _row(db, "u2").answered_count == 0
+
+
+def test_empty_catalog_completes_nobody(db):
+    db.add(models.SurveySubmission(user_id="u1", answered_count=0))
+    db.commit()
+    submissions.recount(db)
+    db.commit()
+    assert _row(db, "u1").is_completed is False
@@ -0,0 +1,22 @@
+import pytest
+
+from core.validation import AnswerValidator, parse_number
+
+
+@pytest.mark.parametrize("answer, expected", [(3, 3.0), (2.5, 2.5), ("42", 42.0), (" -1.5e3 ", -1500.0), (".5", 0.5)])
+def test_parse_number_accepts_plain_numbers(answer, expected):
+    assert parse_number(answer) == expected
+
+
+@pytest.mark.parametrize("answer", ["1_000", "nan", "inf", "-Infinity", "1e999", float("nan"), float("inf"), True, "0x10", "", [1]])
+def test_parse_number_rejects_other_values(answer):
+    assert parse_number(answer) is None
+
+
+def test_number_validator_uses_shared_parser():
+    validator = AnswerValidator(1, "Tuổi", "number", min_value=0, max_value=120)
+    assert validator("30") == (True, None)
+    for answer in ("1_0", "nan", "inf", True):
+        ok, err = validator(answer)
+        assert not ok and "yêu cầu nhập số" in err
+    assert validator("121")[0] is False
@@ -0,0 +1,148 @@
+"""Password hashing (bcrypt) off the request path.
+
+bcrypt is deliberately slow (~250 ms at 12 rounds) and holds the GIL, so
+hashing inline in a route pins the worker and serializes every other request.
+Hash/verify jobs run in a process pool of ``PASSWORD_HASH_WORKERS`` processes
+(0 = inline, for development). At most ``PASSWORD_HASH_MAX_PENDING`` jobs may
+be queued or running per worker process; beyond that, or when a job does not
+finish within ``PASSWORD_HASH_TIMEOUT`` seconds, ``PasswordHashingBusy`` is
+raised and the API answers 503 instead of letting the queue grow without bound.
+
+The work factor is ``BCRYPT_ROUNDS``. Hashes made with other parameters are
+flagged by ``verify_and_update`` so login can transparently rehash them.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 8)))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "5"))
+
+# min = max = default: hash với số vòng khác (tăng hoặc giảm BCRYPT_ROUNDS) đều bị coi là cần rehash
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHashingBusy(RuntimeError):
+    """The hashing pool is saturated or too slow; the request should be retried later."""
+
+
+# ---- chạy trong process con ----------------------------------------------------
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+# ---- pool ----------------------------------------------------------------------
+
+class PasswordHasher:
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        timeout: float = PASSWORD_HASH_TIMEOUT,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: process con không thừa hưởng thread/kết nối DB của worker API
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy("Too many password hashing requests in flight")
+        pool = self._executor()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # Process con chết (OOM...): bỏ pool hỏng, lần gọi sau tạo pool mới
+            self._slots.release()
+            self._discard(pool)
+            raise PasswordHashingBusy("Password hashing pool restarted")
+        except BaseException:
+            self._slots.release()
+            raise
+        # Trả slot khi job thật sự xong, kể cả khi caller đã bỏ chờ vì timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHashingBusy("Password hashing timed out")
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise PasswordHashingBusy("Password hashing pool restarted")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
+
+
+def configure(workers: int, max_pending: Optional[int] = None, timeout: Optional[float] = None) -> None:
+    """Replace the module-level pool (benchmarks, tests)."""
+    global password_hasher
+    password_hasher.shutdown()
+    password_hasher = PasswordHasher(
+        workers=workers,
+        max_pending=max_pending if max_pending is not None else max(workers, 1) * 8,
+        timeout=timeout if timeout is not None else PASSWORD_HASH_TIMEOUT,
+    )
+
+
+def shutdown() -> None:
+    password_hasher.shutdown()
+
+
+def hash_password(password: str) -> str:
+    return password_hasher.run(_hash, password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return password_hasher.run(_verify, password, hashed_password)
+
+
+def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """``(ok, new_hash)``; ``new_hash`` is set when the stored hash uses outdated parameters."""
+    return password_hasher.run(_verify_and_update, password, hashed_password)
@@ -1,8 +1,9 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 import os
 from dotenv import load_dotenv
+from core import hashing
+from core.hashing import PasswordHashingBusy, pwd_context
 
 load_dotenv()
 
@@ -16,13 +17,15 @@ if not SECRET_KEY:
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
+# Hash/verify chạy trong process pool (core/hashing.py), không chiếm CPU của worker API
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.verify_password(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password, hashed_password):
+    return hashing.verify_and_update(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -1,23 +1,55 @@
+from sqlalchemy import exists, insert, literal, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from models.user import User
+from models.user import AdminBootstrap, User
 from schemas.user import UserCreate, UserUpdatePassword
 from core.security import get_password_hash, verify_password
+from datetime import datetime
 import secrets
 from typing import List
 
+ADMIN_BOOTSTRAP_ID = 1
+
+# Đã có dòng admin_bootstrap (cache theo process): signup không cần thêm query nào
+_admin_bootstrapped = False
+
+def _claim_first_admin(db: Session, user_id: int) -> bool:
+    """Chiếm dòng admin_bootstrap cho user vừa flush; True nếu user này là admin đầu tiên."""
+    if db.get(AdminBootstrap, ADMIN_BOOTSTRAP_ID) is not None:
+        return False
+    t = AdminBootstrap.__table__
+    now = datetime.utcnow()
+    try:
+        with db.begin_nested():
+            # Chỉ là admin khi không có user nào khác; signup đồng thời khác sẽ đụng khoá chính id=1
+            claimed = db.execute(
+                insert(t).from_select(
+                    ["id", "user_id", "created_at"],
+                    select(literal(ADMIN_BOOTSTRAP_ID), literal(user_id), literal(now))
+                    .where(~exists().where(User.id != user_id)),
+                )
+            ).rowcount == 1
+            if not claimed:
+                # DB đã có user từ trước khi có bảng này: chỉ đánh dấu đã bootstrap
+                db.execute(insert(t).values(id=ADMIN_BOOTSTRAP_ID, user_id=None, created_at=now))
+    except IntegrityError:
+        return False
+    return claimed
+
 def create_user(db: Session, user: UserCreate):
-    # Kiểm tra số lượng user trong DB
-    user_count = db.query(User).count()
-    is_admin = user_count == 0  # User đầu tiên là admin
-    
+    global _admin_bootstrapped
     db_user = User(
         email=user.email,
         hashed_password=get_password_hash(user.password),
         disabled=user.disabled,
-        is_admin=is_admin,
+        is_admin=False,
     )
     db.add(db_user)
+    if not _admin_bootstrapped:
+        db.flush()
+        db_user.is_admin = _claim_first_admin(db, db_user.id)  # User đầu tiên là admin
     db.commit()
+    _admin_bootstrapped = True  # sau commit dòng id=1 chắc chắn đã tồn tại
     db.refresh(db_user)
     return db_user
 
@@ -1,6 +1,8 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from routers import users, admin, auth
 from fastapi.openapi.utils import get_openapi
+from core import hashing
 
 app = FastAPI(
     title="User Service API",
@@ -67,6 +69,15 @@ def custom_openapi():
 
 app.openapi = custom_openapi
 
+@app.exception_handler(hashing.PasswordHashingBusy)
+async def password_hashing_busy(request: Request, exc: hashing.PasswordHashingBusy):
+    # Pool hash mật khẩu quá tải/quá chậm: báo client thử lại thay vì xếp hàng vô hạn
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.on_event("shutdown")
+def shutdown_password_hashing():
+    hashing.shutdown()
+
 app.include_router(auth.router, prefix="/api/v1", tags=["auth"])
 app.include_router(users.router, prefix="/api/v1", tags=["users"])
 app.include_router(admin.router, prefix="/api/v1", tags=["admin"])
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, CheckConstraint
 from datetime import datetime
 from models.base import Base
 
@@ -17,3 +17,18 @@ class User(Base):
     
     def __repr__(self):
         return f"<User(email='{self.email}', id={self.id})>"
+
+
+class AdminBootstrap(Base):
+    """Một dòng duy nhất (id=1): đã có admin đầu tiên.
+
+    Khoá chính + CHECK đảm bảo chỉ một signup chiếm được dòng này, kể cả khi
+    nhiều signup đầu tiên chạy đồng thời. ``user_id`` NULL khi DB đã có user
+    trước khi có bảng này (không phong admin cho ai).
+    """
+    __tablename__ = "admin_bootstrap"
+    __table_args__ = (CheckConstraint("id = 1", name="ck_admin_bootstrap_single_row"), {'extend_existing': True})
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
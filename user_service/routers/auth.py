@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from schemas.user import UserLogin, UserOut, UserForgotPassword, UserUpdatePassword, UserCreate
 from crud.crud import get_user_by_email, update_password, set_reset_token, reset_password_with_token, create_user
 from database import get_db
-from core.security import verify_password, create_access_token, decode_access_token, get_password_hash
+from core.security import verify_password, verify_and_update_password, create_access_token, decode_access_token, get_password_hash
 from models.user import User
 from typing import Optional
 import secrets
@@ -41,12 +41,17 @@ def login_for_access_token(form_data: UserLogin, db: Session = Depends(get_db)):
     Đăng nhập bằng email và password.
     """
     user = get_user_by_email(db, form_data.email)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = verify_and_update_password(form_data.password, user.hashed_password) if user else (False, None)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Hash cũ dùng tham số khác BCRYPT_ROUNDS hiện tại: lưu lại hash mới khi đã có mật khẩu gốc
+        user.hashed_password = new_hash
+        db.commit()
     access_token = create_access_token(data={"sub": str(user.id), "email": user.email, "is_admin": user.is_admin})
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ``POST /api/v1/auth/login`` throughput for several hashing pool sizes.
+
+Usage (from user_service/):
+    python scripts/bench_login.py [--workers 0,1,2,4] [--requests 200] [--concurrency 32] [--rounds 12]
+
+Creates a fresh SQLite database with one user, then for each pool size
+(``0`` = bcrypt inline in the request thread, the old behaviour) fires
+``--requests`` logins with ``--concurrency`` in flight through the ASGI app in
+one process (like one uvicorn worker), and reports logins/s, p50/p95 login
+latency, 503s (pool saturated, see ``--max-pending``) and the p50 latency of
+``GET /ping`` measured during the load (how responsive the worker stays).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--workers", default=f"0,1,2,{os.cpu_count() or 1}")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--rounds", type=int, default=12)
+    p.add_argument("--max-pending", type=int, default=None, help="mặc định = --concurrency (không từ chối request)")
+    p.add_argument("--db", default="/tmp/user_bench_login.db")
+    return p.parse_args()
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+async def _run(app, n_requests: int, concurrency: int):
+    import httpx
+
+    body = {"email": "bench@example.com", "password": "bench-password"}
+    latencies, pings, busy = [], [], 0
+    sem = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+
+        async def login():
+            nonlocal busy
+            async with sem:
+                t0 = time.perf_counter()
+                resp = await client.post("/api/v1/auth/login", json=body)
+                latencies.append(time.perf_counter() - t0)
+                if resp.status_code == 503:
+                    busy += 1
+                else:
+                    assert resp.status_code == 200, resp.text
+
+        async def ping():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/ping")
+                pings.append(time.perf_counter() - t0)
+                await asyncio.sleep(0.05)
+
+        pinger = asyncio.create_task(ping())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(n_requests)))
+        elapsed = time.perf_counter() - t0
+        done.set()
+        await pinger
+    return elapsed, latencies, pings, busy
+
+
+def main():
+    args = _args()
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["USER_DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+    from core import hashing
+    from crud.crud import create_user
+    from database import SessionLocal
+    from main import app
+    from schemas.user import UserCreate
+
+    hashing.configure(0)
+    db = SessionLocal()
+    create_user(db, UserCreate(email="bench@example.com", password="bench-password"))
+    db.close()
+
+    print(f"Login: {args.requests} requests, {args.concurrency} concurrent, bcrypt rounds={args.rounds}, {os.cpu_count()} CPUs")
+    for workers in dict.fromkeys(int(w) for w in args.workers.split(",")):
+        hashing.configure(workers, max_pending=args.max_pending or args.concurrency, timeout=30)
+        if workers:
+            hashing.verify_password("warm-up", hashing.hash_password("warm-up"))  # khởi động process con
+        elapsed, latencies, pings, busy = asyncio.run(_run(app, args.requests, args.concurrency))
+        label = "inline" if workers == 0 else f"{workers} proc"
+        print(
+            f"{label:>8}: {(args.requests - busy) / elapsed:7.1f} logins/s  "
+            f"p50 {_pct(latencies, 0.5) * 1000:7.0f} ms  p95 {_pct(latencies, 0.95) * 1000:7.0f} ms  "
+            f"503 {busy:4d}  ping p50 {statistics.median(pings) * 1000 if pings else float('nan'):6.1f} ms"
+        )
+    hashing.shutdown()
+
+
+if __name__ == "__main__":
+    main()